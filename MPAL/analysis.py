@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 
-import math
-from collections import Counter
-import re
+from collections import Counter, OrderedDict
+import csv
+import inspect
+import os
+import pickle
+import struct
+import threading
+import zipfile
 import numpy as np
 from numpy.linalg import norm
 import pandas as pd
+from scipy.io import savemat
 
 from preprocessing import *
 
@@ -16,10 +22,14 @@ Main analysis class
 The analysis logic is inspired by the following article:
 Schrum, P., Rintoul, M.D., & Newton, B.D. (2018). Curvature Based Analysis to Identify and Categorize Trajectory Segments.
 
-This class serves as the main class for analyzing motion trajectory, with plot object created
+This class serves as the main class for analyzing motion trajectory, with plot object created on first access
+(the module does not depend on matplotlib or PyQt, so it can be used without a display, e.g. by batch.py)
 
 Usage:  Pass the file path and turning thresholds when initializing the Analysis class 
         (e.g., analysis = Analysis(file, thresholds))
+        The file is either a .csv file or a binary trajectory (.npy/.npz, see convert_csv), which is memory-mapped
+        With cache=PreprocessingCache() (see cache.py), reopening a smoothed or interpolated .csv file with the same
+        options skips parsing and preprocessing
                 
         Goal:
         To create a hash string that describes the trajectory
@@ -42,9 +52,201 @@ Usage:  Pass the file path and turning thresholds when initializing the Analysis
             lowercase letters respectively. Furthermore, consecutive changes in direction will also be grouped.
 
 Parameters:  X global angle, Y global angle, Z global angle, relative angle, arc length, radius, curvature vector(3)
+             Stored as an (n, 9) float64 matrix (NaN where undefined), with named fields (PARAMETER_NAMES) available
+             through analysis.named_parameters
 --------------------------------------------------------------
 '''
 
+# Names of the parameter columns
+PARAMETER_NAMES = ('x_angle', 'y_angle', 'z_angle', 'relative_angle', 'arc_length', 'radius', 'kx', 'ky', 'kz')
+PARAMETER_DTYPE = np.dtype([(name, np.float64) for name in PARAMETER_NAMES])
+
+
+###################
+# Input functions #
+###################
+# Read the given columns (index starts at 0) of a .csv file, in the given order
+# Only the requested columns are parsed as float64 by the C engine; the python engine is used as a fallback when the
+# fast parse fails (e.g. non-numeric entries or ragged rows)
+def _read_csv_columns(file, cols, header=None):
+    usecols = sorted(set(cols))
+    try:
+        dataset = pd.read_csv(file, header=header, usecols=usecols, dtype=np.float64, engine="c",
+                              float_precision="round_trip")
+        return dataset.values[:, [usecols.index(c) for c in cols]]
+    except ValueError:
+        dataset = pd.read_csv(file, header=header, engine="python")
+        return dataset.iloc[:, cols].values
+
+
+# Binary trajectory formats: an (n, 3) float64 .npy file, or a .npz file holding the trajectory as 'X' and metadata
+BINARY_EXTENSIONS = ('.npy', '.npz')
+
+
+# Detect binary trajectory files by extension
+def is_binary_trajectory(file):
+    return os.path.splitext(file)[1].lower() in BINARY_EXTENSIONS
+
+
+# Load a binary trajectory as a read-only memory map, together with its metadata (empty for .npy files)
+def load_trajectory(file):
+    if os.path.splitext(file)[1].lower() == '.npy':
+        X, metadata = np.load(file, mmap_mode='r'), {}
+    else:
+        with np.load(file) as archive:
+            metadata = {key: archive[key].item() for key in archive.files if key != 'X'}
+        X = _memmap_npz_member(file, 'X.npy')
+
+    if X.ndim != 2 or X.shape[1] != 3:
+        raise ValueError("{} does not hold an (n, 3) trajectory".format(file))
+    return X, metadata
+
+
+# Memory-map an array stored uncompressed in a .npz file (np.load only memory-maps .npy files)
+# Compressed members are read into memory instead
+def _memmap_npz_member(file, name):
+    with zipfile.ZipFile(file) as archive:
+        info = archive.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED:
+            with archive.open(name) as f:
+                return np.lib.format.read_array(f)
+
+    with open(file, 'rb') as f:
+        # Skip the local file header of the member, then read the .npy header
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = struct.unpack('<HH', f.read(4))
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    return np.memmap(file, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+
+# Convert the columns of a .csv file to a binary trajectory file (index and header row start at 1, as in the GUI)
+# A .npz file (default) also stores the source file name, header row (0 for none), columns, and inversion flags
+def convert_csv(file, out, col_x, col_y, col_z, header=None, invert_x=False, invert_y=False, invert_z=False):
+    data = _read_csv_columns(file, [col_x-1, col_y-1, col_z-1], header=None if header is None else header - 1)
+    X = np.ascontiguousarray(data, dtype=np.float64)
+
+    if os.path.splitext(out)[1].lower() == '.npy':
+        np.save(out, X)
+    else:
+        np.savez(out, X=X, source=os.path.basename(file), header=0 if header is None else header,
+                 col_x=col_x, col_y=col_y, col_z=col_z, invert_x=invert_x, invert_y=invert_y, invert_z=invert_z)
+
+
+#####################
+# Level-1 functions #
+#####################
+# Compute the angular change in x/y (angle1) and z (angle2) of every point duplet (i, i+1) in degrees
+# (float_power squares through pow() like the scalar ** operator, keeping angle2 identical to a per-point loop)
+def _direction_angles(X):
+    direction_vector = np.diff(X, axis=0)
+    angle1 = np.degrees(np.arctan2(direction_vector[:, 1], direction_vector[:, 0]))
+    angle2 = np.degrees(np.arctan2(direction_vector[:, 2],
+                                   np.sqrt(np.float_power(direction_vector[:, 0], 2) +
+                                           np.float_power(direction_vector[:, 1], 2))))
+    return angle1, angle2
+
+
+# Assign the X (L/R/-), Y (F/B/-) and Z (U/D/-) labels of every point duplet
+# y_threshold and z_threshold are the complementary angles (90 - threshold) used by the Analysis class
+def _lvl1labels(angle1, angle2, x_threshold, y_threshold, z_threshold, invert_x=False, invert_y=False, invert_z=False):
+    return [labels.tobytes().decode('ascii') for labels in (_x_labels(angle1, x_threshold, invert_x),
+                                                            _y_labels(angle1, y_threshold, invert_y),
+                                                            _z_labels(angle2, z_threshold, invert_z))]
+
+
+# Determine left/right, as ASCII codes
+def _x_labels(angle1, x_threshold, invert_x=False):
+    abs_angle1 = np.abs(angle1)
+    return np.select([abs_angle1 <= x_threshold, abs_angle1 >= 180 - x_threshold],
+                     [ord('R' if invert_x else 'L'), ord('L' if invert_x else 'R')], ord('-')).astype(np.uint8)
+
+
+# Determine forward/backward, as ASCII codes
+def _y_labels(angle1, y_threshold, invert_y=False):
+    return np.select([(y_threshold < angle1) & (angle1 < 180 - y_threshold),
+                      (-(180 - y_threshold) < angle1) & (angle1 < -y_threshold)],
+                     [ord('F' if invert_y else 'B'), ord('B' if invert_y else 'F')], ord('-')).astype(np.uint8)
+
+
+# Determine up/down, as ASCII codes
+def _z_labels(angle2, z_threshold, invert_z=False):
+    return np.select([angle2 >= z_threshold, angle2 <= -z_threshold],
+                     [ord('D' if invert_z else 'U'), ord('U' if invert_z else 'D')], ord('-')).astype(np.uint8)
+
+
+#######################
+# Parameter functions #
+#######################
+# Compute the relative angle at every interior point X[i] between its neighbours X[i-1] and X[i+1] in degrees
+# Duplicate neighbouring points result in NaN
+def _turning_angles(X):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n1 = (X[2:] - X[1:-1]) / norm(X[2:] - X[1:-1], axis=1)[:, None]
+        n2 = (X[:-2] - X[1:-1]) / norm(X[:-2] - X[1:-1], axis=1)[:, None]
+    return np.degrees(np.arctan2(norm(np.cross(n1, n2), axis=1), np.sum(n1 * n2, axis=1)))
+
+
+# Compute the cumulative arc length L, and the radius R and curvature vector k of the circumcircle through
+# X[i-1], X[i] and X[i+1] at every interior point
+# Collinear or duplicate points result in NaN radius and curvature
+def _curvature(X):
+    N = X.shape[0]
+    L = np.zeros(N)
+    R = np.full(N, np.nan)
+    k = np.full((N, 3), np.nan)
+
+    # Circumcenter M = A + G of the triangles (A, B, C) = (X[i], X[i-1], X[i+1])
+    A, B, C = X[1:-1], X[:-2], X[2:]
+    D = np.cross(B - A, C - A)
+    b = norm(A - C, axis=1)
+    c = norm(A - B, axis=1)
+
+    E = np.cross(D, B - A)
+    F = np.cross(D, C - A)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        G = ((b * b)[:, None] * E - (c * c)[:, None] * F) / np.float_power(norm(D, axis=1), 2)[:, None] / 2
+        R[1:-1] = norm(G, axis=1)
+        k[1:-1] = np.where(R[1:-1, None] == 0, G, G / (R[1:-1] * R[1:-1])[:, None])
+
+    # Cumulative arc length
+    if N > 1:
+        chordlen = norm(np.diff(X, axis=0), axis=1)
+        L[1:-1] = np.cumsum(chordlen[:-1])
+        L[-1] = L[-2] + L[-2] + chordlen[-1]
+    return L, R, k
+
+
+#####################
+# Level-3 functions #
+#####################
+# Reduce a change in direction (lowercase) enclosed by the main directions main_axis1 and main_axis2
+# Axes shared by both main directions are removed, then only the most frequent labels are kept, in the order of their
+# first occurrence (instead of the order of a set, which changed from run to run with the hash seed of Python)
+def _reduce_turn(turn, main_axis1, main_axis2):
+    # Identify which main axes to remove
+    if ('F' in main_axis1 or 'B' in main_axis1) and ('F' in main_axis2 or 'B' in main_axis2):
+        turn = [a for a in turn if a not in 'fb']
+    if ('L' in main_axis1 or 'R' in main_axis1) and ('L' in main_axis2 or 'R' in main_axis2):
+        turn = [a for a in turn if a not in 'lr']
+    if ('U' in main_axis1 or 'D' in main_axis1) and ('U' in main_axis2 or 'D' in main_axis2):
+        turn = [a for a in turn if a not in 'ud']
+
+    # Join string and remove duplicate characters
+    if len(turn) > 0:
+        c = Counter(turn)
+        highest = max(c.values())
+        result = [k for k, v in c.items() if v == highest]
+    else:
+        result = ""
+    return ''.join(result)
+
 
 #######################
 # Main analysis class #
@@ -53,8 +255,66 @@ class Analysis:
 
     def __init__(self, file, col_x, col_y, col_z, x_threshold, y_threshold, z_threshold, main_direction_threshold,
                  invert_x=False, invert_y=False, invert_z=False,
-                 header=None, smooth=False, interpolate=False, interdist=0.5):
+                 header=None, smooth=False, interpolate=False, interdist=0.5, smoothing=None, cache=None):
         # Set object attributes
+        self._settings(x_threshold, y_threshold, z_threshold, main_direction_threshold, invert_x, invert_y, invert_z)
+
+        # Update header
+        if header is not None: header -= 1
+
+        # Look up the preprocessed trajectory in the cache (PreprocessingCache), if given
+        # Only smoothed or interpolated .csv files are cached: binary trajectories are memory-mapped, and a trajectory
+        # without preprocessing is its file content, so a copy would only fill the cache
+        if is_binary_trajectory(file) or not (smooth or interpolate):
+            cache = None
+        cached = None
+        if cache is not None:
+            key = cache.key(file, col_x=col_x, col_y=col_y, col_z=col_z, header=header, smooth=smooth,
+                            interpolate=interpolate, interdist=interdist, smoothing=smoothing if smooth else None,
+                            invert_x=invert_x, invert_y=invert_y, invert_z=invert_z)
+            cached = cache.load(key)
+
+        if cached is not None:
+            self.original_corr, X, pre_post_idx = cached
+            self._set_trajectory(X, pre_post_idx)
+        else:
+            # Read binary trajectory (memory-mapped) or .csv file and assign to variables
+            if is_binary_trajectory(file):
+                data, _ = load_trajectory(file)
+            else:
+                data = _read_csv_columns(file, [col_x-1, col_y-1, col_z-1], header=header)
+            x = data[:, 0]
+            y = data[:, 1]
+            z = data[:, 2]
+            self.original_corr = np.asarray(data)
+
+            # Preprocessing
+            # Without smoothing and interpolation, the trajectory is the data read (still memory-mapped for binary
+            # trajectories) instead of a copy
+            if smooth or interpolate:
+                self._preprocessing(x, y, z, smooth, interpolate, interdist, smoothing)
+            else:
+                self._set_trajectory(self.original_corr, np.arange(0, len(data)))
+            if cache is not None:
+                cache.store(key, self.original_corr, self.X, self.pre_post_idx)
+
+        # Get parameters, hashes and frames
+        self._analyse()
+
+    # Analysis of a trajectory already read and preprocessed (e.g. by MultiAnalysis)
+    @classmethod
+    def from_preprocessed(cls, original_corr, X, pre_post_idx, x_threshold, y_threshold, z_threshold,
+                          main_direction_threshold, invert_x=False, invert_y=False, invert_z=False):
+        analysis = cls.__new__(cls)
+        analysis._settings(x_threshold, y_threshold, z_threshold, main_direction_threshold,
+                           invert_x, invert_y, invert_z)
+        analysis.original_corr = original_corr
+        analysis._set_trajectory(X, pre_post_idx)
+        analysis._analyse()
+        return analysis
+
+    # Set object attributes
+    def _settings(self, x_threshold, y_threshold, z_threshold, main_direction_threshold, invert_x, invert_y, invert_z):
         self.x_threshold = x_threshold
         self.y_threshold = 90 - y_threshold
         self.z_threshold = 90 - z_threshold
@@ -63,18 +323,9 @@ class Analysis:
         self.invert_y = invert_y
         self.invert_z = invert_z
 
-        # Update header
-        if header is not None: header -= 1
-
-        # Read .csv file and assign to variables
-        dataset = pd.read_csv(file, header=header, engine="python")
-        x = dataset.iloc[:, col_x-1].values
-        y = dataset.iloc[:, col_y-1].values
-        z = dataset.iloc[:, col_z-1].values
-        self.original_corr = np.asarray([x, y, z]).T
-
-        # Preprocessing
-        self._preprocessing(x, y, z, smooth, interpolate, interdist)
+    def _analyse(self):
+        # Get parameters of each node
+        self._parameters()
 
         # Get level-1 hash
         self._lvl1hash()
@@ -88,309 +339,435 @@ class Analysis:
         # Get post-interpolated to pre-interpolated conversion of data points
         self._get_prepost_idx()
 
-        # Create plot object
-        self.plot = Plot(self.x, self.y, self.z, self.lvl2hashframe, self.lvl3hashframe)
+        # Plot object is created on first access (see Analysis.plot)
+        self._plot = None
+
+    # Plot object, created on first access so that headless runs do not pay for it
+    @property
+    def plot(self):
+        if self._plot is None:
+            self._plot = Plot(self.X, self.lvl2hashframe, self.lvl3hashframe)
+        return self._plot
 
     # Preprocessing
-    def _preprocessing(self, x, y, z, smooth, interpolate, interdist):
-        self.X, self.pre_post_idx = preprocess(x, y, z, smooth=smooth, interpolate=interpolate, interdist=interdist)
+    def _preprocessing(self, x, y, z, smooth, interpolate, interdist, smoothing):
+        self._set_trajectory(*preprocess(x, y, z, smooth=smooth, interpolate=interpolate, interdist=interdist,
+                                         smoothing=smoothing))
+
+    # Set the preprocessed trajectory and the lookup table of pre-processed and post-processed time information
+    def _set_trajectory(self, X, pre_post_idx):
+        self.X = X
+        self.pre_post_idx = pre_post_idx
         self.x = self.X[:, 0]
         self.y = self.X[:, 1]
         self.z = self.X[:, 2]
 
-    # Get level-1 hash string and parameters of each node
-    def _lvl1hash(self):
+    # Get parameters of each node
+    # They do not depend on the thresholds, so they are computed once per trajectory and reused by re-runs
+    # out: (n, 9) float64 array to fill instead of a new one (e.g. a shared memory block, see parallel.py)
+    def _parameters(self, out=None):
         # Initialize variables
-        self.lvl1hash = [''] * 3
-        self.parameters = np.empty((len(self.x), 9), dtype=object)
-
-        # Loop through point duplets
-        for i in range(len(self.x) - 1):
-            # Compute directional vector
-            direction_vector = [self.x[i+1] - self.x[i], self.y[i+1] - self.y[i], self.z[i+1] - self.z[i]]
-
-            # Compute angular change in x/y and z
-            angle1 = math.degrees(math.atan2(direction_vector[1], direction_vector[0]))
-            angle2 = math.degrees(math.atan2(direction_vector[2], math.sqrt(direction_vector[0]**2 + direction_vector[1]**2)))
-
-            # Determine left/right
-            if abs(angle1) <= self.x_threshold:
-                self.lvl1hash[0] += 'R' if self.invert_x else 'L'
-            elif abs(angle1) >= 180 - self.x_threshold:
-                self.lvl1hash[0] += 'L' if self.invert_x else 'R'
-            else:
-                self.lvl1hash[0] += '-'
-            self.parameters[i, 0] = angle1
-
-            # Determine forward/backward
-            if self.y_threshold < angle1 < 180 - self.y_threshold:
-                self.lvl1hash[1] += 'F' if self.invert_y else 'B'
-            elif -(180 - self.y_threshold) < angle1 < -self.y_threshold:
-                self.lvl1hash[1] += 'B' if self.invert_y else 'F'
-            else:
-                self.lvl1hash[1] += '-'
-            self.parameters[i, 1] = angle1
-
-            # Determine up/down
-            if angle2 >= self.z_threshold:
-                self.lvl1hash[2] += 'D' if self.invert_z else 'U'
-            elif angle2 <= -self.z_threshold:
-                self.lvl1hash[2] += 'U' if self.invert_z else 'D'
-            else:
-                self.lvl1hash[2] += '-'
-            self.parameters[i, 2] = angle2
-
-        # '/' padding
-        self.lvl1hash[0] += '/'
-        self.lvl1hash[1] += '/'
-        self.lvl1hash[2] += '/'
-
-        # Compute parameters
-        for i in range(1, len(self.x) - 1):
-            self.parameters[i, 3] = self.__find_angle(self.X[i-1], self.X[i], self.X[i+1])
-
-        L, R, k = self.__curvature()
+        if out is None:
+            self.parameters = np.full((len(self.x), len(PARAMETER_NAMES)), np.nan)
+        else:
+            self.parameters = out
+            self.parameters.fill(np.nan)
+
+        # Compute angular change in x/y and z of all point duplets
+        angle1, angle2 = _direction_angles(self.X)
+        self.parameters[:-1, 0] = angle1
+        self.parameters[:-1, 1] = angle1
+        self.parameters[:-1, 2] = angle2
+
+        # Compute relative angle, arc length, radius and curvature
+        self.parameters[1:-1, 3] = _turning_angles(self.X)
+
+        L, R, k = _curvature(self.X)
         self.parameters[:, 4] = L
         self.parameters[:, 5] = R
         self.parameters[:, 6:] = k
 
+    # Get level-1 hash string of each node from the angles in the parameters
+    def _lvl1hash(self):
+        # Determine left/right, forward/backward and up/down, with '/' padding
+        self.lvl1hash = [labels + '/' for labels in _lvl1labels(self.parameters[:-1, 0], self.parameters[:-1, 2],
+                                                                 self.x_threshold, self.y_threshold, self.z_threshold,
+                                                                 self.invert_x, self.invert_y, self.invert_z)]
+
+    # Structured view of the parameters sharing the same buffer (e.g. analysis.named_parameters['radius'])
+    @property
+    def named_parameters(self):
+        return self.parameters.view(PARAMETER_DTYPE)[:, 0]
+
     # Get level-2 hash strings and hash frame
     def _lvl2hash(self):
-        # Initialize variables
-        self.lvl2hash = [''] * 3
-        self.lvl2hashframe = [0]
+        # Combine the three rows of level-1 labels into one integer code per node
+        rows = [np.frombuffer(row.encode('ascii'), dtype=np.uint8) for row in self.lvl1hash]
+        code = (rows[0].astype(np.int32) << 16) | (rows[1].astype(np.int32) << 8) | rows[2]
 
-        # Loop through level-3 nodes
-        Xchar, Ychar, Zchar = self.lvl1hash[0][0], self.lvl1hash[1][0], self.lvl1hash[2][0]
-        for i in range(1, len(self.lvl1hash[0])):
-            if self.lvl1hash[0][i] == Xchar and self.lvl1hash[1][i] == Ychar and self.lvl1hash[2][i] == Zchar:
-                continue
-            else:
-                self.lvl2hash[0] += Xchar
-                self.lvl2hash[1] += Ychar
-                self.lvl2hash[2] += Zchar
-                self.lvl2hashframe.append(i)
-                Xchar = self.lvl1hash[0][i]
-                Ychar = self.lvl1hash[1][i]
-                Zchar = self.lvl1hash[2][i]
+        # Run-length encode consecutive identical codes, the last run being the '/' padding
+        self.lvl2hashframe = np.concatenate(([0], np.flatnonzero(code[1:] != code[:-1]) + 1))
 
         # '/' padding
-        self.lvl2hash[0] += '/'
-        self.lvl2hash[1] += '/'
-        self.lvl2hash[2] += '/'
+        self.lvl2hash = [row[self.lvl2hashframe[:-1]].tobytes().decode('ascii') + '/' for row in rows]
 
     # Get level-3 hash string and hash frame
     def _lvl3hash(self):
-        # Initialize hash and hash frame variables
-        self.lvl3hash = []
-        self.lvl3hashframe = []
-
         # Group the three rows of level-2 hash strings into one
-        # Remove 'n'
+        # Remove '-'
         # Change in direction is defined as Level-2 consecutive grouping smaller than main_direction_threshold
         # Change in direction is denoted with lowercase
-        for i in range(len(self.lvl2hashframe)-1):
-            # Line segment is larger than main_direction threshold
-            if self.lvl2hashframe[i+1] - self.lvl2hashframe[i] >= self.main_direction_threshold:
-                temp = self.lvl2hash[0][i] + self.lvl2hash[1][i] + self.lvl2hash[2][i]
-                # Regex for substituting 'n' with blank
-                temp = re.sub('[-]', '', temp)
-            # Line segment is a change in direction
-            else:
-                temp = (self.lvl2hash[0][i] + self.lvl2hash[1][i] + self.lvl2hash[2][i]).lower()
-                # Regex for substituting 'n' with blank
-                temp = re.sub('[-]', '', temp)
-
-            if temp != '':
-                self.lvl3hash.append(temp)
-                self.lvl3hashframe.append(self.lvl2hashframe[i])
+        # (the label of each distinct combination of characters and case is built once, then looked up for every node)
+        rows = [np.frombuffer(row[:-1].encode('ascii'), dtype=np.uint8) for row in self.lvl2hash]
+        lower = np.diff(self.lvl2hashframe) < self.main_direction_threshold
+        code = (lower.astype(np.int32) << 24) | (rows[0].astype(np.int32) << 16) | \
+               (rows[1].astype(np.int32) << 8) | rows[2]
+        combos, inverse = np.unique(code, return_inverse=True)
+        labels = []
+        for c in combos.tolist():
+            temp = chr(c >> 16 & 255) + chr(c >> 8 & 255) + chr(c & 255)
+            labels.append((temp.lower() if c >> 24 else temp).replace('-', ''))
+
+        # Drop nodes without any label
+        nodes = np.flatnonzero(np.array([label != '' for label in labels], dtype=bool)[inverse.ravel()])
+        lvl3hash = [labels[i] for i in inverse.ravel()[nodes].tolist()]
+        lower = lower[nodes]
 
         # Group consecutive change in directions (lowercase)
-        temphash = [self.lvl3hash[0]]
-        temphashframe = [self.lvl3hashframe[0]]
-        for i in range(1, len(self.lvl3hash)):
-            if self.lvl3hash[i].isupper():
-                temphash.append(self.lvl3hash[i])
-                temphashframe.append(self.lvl3hashframe[i])
-            elif self.lvl3hash[i].islower() and temphash[-1].islower():
-                temphash[-1] += self.lvl3hash[i]
-            else:
-                temphash.append(self.lvl3hash[i])
-                temphashframe.append(self.lvl3hashframe[i])
+        first = np.ones(len(nodes), dtype=bool)
+        first[1:] = ~(lower[1:] & lower[:-1])
+        starts = np.flatnonzero(first).tolist()
+        ends = starts[1:] + [len(nodes)]
+        self.lvl3hash = [lvl3hash[s] if e - s == 1 else ''.join(lvl3hash[s:e]) for s, e in zip(starts, ends)]
 
         # Mark the last frame of the Level-1 hash
-        temphashframe.append(self.lvl2hashframe[-1])
-
-        self.lvl3hash = temphash
-        self.lvl3hashframe = temphashframe
-
-        while True:
-            length = len(self.lvl3hash)
-            # Remove main direction axes from change in direction
-            for h in range(len(self.lvl3hash)):
-                # Only make amendments to lowercase strings
-                if self.lvl3hash[h].islower():
-                    # Get strings of main direction
-                    if h == 0:
-                        continue
-                    elif h == len(self.lvl3hash) - 1:
-                        continue
-                    else:
-                        j = h - 1
-                        while True:
-                            if self.lvl3hash[j].isupper():
-                                main_axis1 = self.lvl3hash[j]
-                                break
-                            j -= 1
-                        main_axis2 = self.lvl3hash[h + 1]
-
-                    # Identify which main axes to remove
-                    include = [0, 1, 2]
-                    if ('F' in main_axis1 or 'B' in main_axis1) and ('F' in main_axis2 or 'B' in main_axis2):
-                        include.remove(0)
-                    if ('L' in main_axis1 or 'R' in main_axis1) and ('L' in main_axis2 or 'R' in main_axis2):
-                        include.remove(1)
-                    if ('U' in main_axis1 or 'D' in main_axis1) and ('U' in main_axis2 or 'D' in main_axis2):
-                        include.remove(2)
-
-                    # Remove labels according to main axes
-                    if 0 not in include:
-                        self.lvl3hash[h] = list(filter(lambda a: a not in 'fb', self.lvl3hash[h]))
-                    if 1 not in include:
-                        self.lvl3hash[h] = list(filter(lambda a: a not in 'lr', self.lvl3hash[h]))
-                    if 2 not in include:
-                        self.lvl3hash[h] = list(filter(lambda a: a not in 'ud', self.lvl3hash[h]))
-
-                    # Join string and remove duplicate characters
-                    if self.lvl3hash[h] != []:
-                        c = Counter(self.lvl3hash[h])
-                        highest = max(c.values())
-                        result = [k for k, v in c.items() if v == highest]
-                    else:
-                        result = ""
-                    self.lvl3hash[h] = ''.join(set(result))
-
-                    # Remove turn between two identical main direction
-                    try:
-                        if main_axis1 == main_axis2:
-                            self.lvl3hash[h + 1] = ""
-                            self.lvl3hash[h] = ""
-                    except IndexError:
-                        pass
-
-            # List all index where "" empty string
-            ix = [i for i, s in enumerate(self.lvl3hash) if s == '']
-            ix.reverse()
-
-            for i in ix:
-                self.lvl3hash.pop(i)
-                self.lvl3hashframe.pop(i)
-
-            if len(self.lvl3hash) == length:
-                break
+        self.lvl3hashframe = np.asarray(self.lvl2hashframe)[nodes[starts]].tolist() + [int(self.lvl2hashframe[-1])]
+
+        # Remove main direction axes from change in direction in a single pass
+        # main_axis1 is the previous main direction that has not been removed, main_axis2 the following one
+        keep = [True] * len(self.lvl3hash)
+        main_axis1 = None
+        for h in range(len(self.lvl3hash)):
+            if not keep[h]:
+                continue
+            if self.lvl3hash[h].isupper():
+                main_axis1 = self.lvl3hash[h]
+                continue
+            # Only make amendments to lowercase strings that are enclosed by main directions
+            if h == 0 or h == len(self.lvl3hash) - 1:
+                continue
+            main_axis2 = self.lvl3hash[h + 1]
+            self.lvl3hash[h] = _reduce_turn(self.lvl3hash[h], main_axis1, main_axis2)
+
+            # Remove turn between two identical main direction, and turns left empty
+            if main_axis1 == main_axis2:
+                keep[h] = keep[h + 1] = False
+            elif self.lvl3hash[h] == '':
+                keep[h] = False
+
+        # Compact the removed nodes
+        # Removals never change the main directions enclosing the remaining turns, so no other pass is needed
+        if not all(keep):
+            self.lvl3hash = [s for s, k in zip(self.lvl3hash, keep) if k]
+            self.lvl3hashframe = [fr for fr, k in zip(self.lvl3hashframe, keep + [True]) if k]
 
         # END Padding
         self.lvl3hash.append("END")
 
     # Get post-interpolated to pre-interpolated conversion of data points
     def _get_prepost_idx(self):
-        self.idx = []
-        for fr in self.lvl3hashframe:
-            self.idx.append(np.where((self.pre_post_idx >= fr) == True)[0][0])
-
-    @staticmethod
-    def __find_angle(p1, p2, p3):
-        p1 = np.array(p1)
-        p2 = np.array(p2)
-        p3 = np.array(p3)
-        with np.errstate(divide='ignore', invalid='ignore'):
-            n1 = (p3 - p2) / norm(p3 - p2)
-            n2 = (p1 - p2) / norm(p1 - p2)
-        return math.degrees(math.atan2(norm(np.cross(n1, n2)), np.dot(n1, n2)))
-
-    def __curvature(self):
-
-        def circumcenter(A, B, C):
-            D = np.cross(B - A, C - A)
-            b = norm(A - C)
-            c = norm(A - B)
-
-            E = np.cross(D, B - A)
-            F = np.cross(D, C - A)
-            with np.errstate(divide='ignore', invalid='ignore'):
-                G = (b * b * E - c * c * F) / norm(D) ** 2 / 2
-            M = A + G
-            R = norm(G)
-            if R == 0:
-                k = G
+        self.idx = self.raw_frame(self.lvl3hashframe)
+
+    # Convert post-interpolated frame(s) to the first pre-interpolated data point reaching them
+    # pre_post_idx is non-decreasing, so a binary search replaces a scan over all data points
+    def raw_frame(self, frame):
+        return np.searchsorted(self.pre_post_idx, frame, side='left')
+
+    # Save results as a pickle (.pkl), MATLAB (.mat), or level-3 label (.csv) file
+    # The extension of file_format is appended to name
+    def save(self, name, file_format):
+        if file_format == 'pkl':
+            with open(name + '.pkl', 'wb') as handle:
+                pickle.dump([self.original_corr,
+                             self.X,
+                             self.x_threshold,
+                             self.y_threshold,
+                             self.z_threshold,
+                             self.main_direction_threshold,
+                             self.parameters,
+                             self.lvl1hash,
+                             self.lvl2hash,
+                             self.lvl2hashframe,
+                             self.lvl3hash,
+                             self.lvl3hashframe,
+                             self.idx], handle)
+        elif file_format == 'mat':
+            savemat(name + '.mat',
+                    {'original_corr': self.original_corr,
+                     'X': self.X,
+                     'x_threshold': self.x_threshold,
+                     'y_threshold': self.y_threshold,
+                     'z_threshold': self.z_threshold,
+                     'main_direction_threshold': self.main_direction_threshold,
+                     'parameters': self.parameters,
+                     'lvl3hash': self.lvl1hash,
+                     'lvl2hash': self.lvl2hash,
+                     'lvl2hashframe': self.lvl2hashframe,
+                     'lvl1hash': self.lvl3hash,
+                     'lvl1hashframe': self.lvl3hashframe,
+                     'idx': self.idx})
+        elif file_format == 'csv':
+            # Ensure length of the three outputs are the same
+            # (IT SHOULD BE THE SAME, OTHERWISE SOMETHING WENT WRONG)
+            if len(self.lvl3hash) == len(self.lvl3hashframe) == len(self.idx):
+                out1 = np.array(list(map(str, self.lvl3hash)))
+                out2 = np.array(list(map(str, self.lvl3hashframe)))
+                out3 = np.array(list(map(str, self.idx)))
             else:
-                k = G / (R * R)
-            return R, M, k
-
-        N = self.X.shape[0]
-        L = np.zeros(N)
-        R = np.full(N, np.NAN)
-        k = np.full((N, 3), np.NAN)
-        for i in range(1, N - 1):
-            R[i], _, k[i, :] = circumcenter(self.X[i], self.X[i - 1], self.X[i + 1])
-            L[i] = L[i - 1] + norm(self.X[i] - self.X[i - 1])
-        i = N - 1
-        L[i] = L[i - 1] + L[i - 1] + norm(self.X[i] - self.X[i - 1])
-        return L, R, k
-
-    # Re-run analysis
+                len_arr = max([len(self.lvl3hash), len(self.lvl3hashframe), len(self.idx)])
+
+                tmpout1 = np.array(list(map(str, self.lvl3hash)))
+                out1 = np.empty_like(tmpout1, shape=(len_arr,))
+                out1[:len(self.lvl3hash)] = tmpout1
+
+                tmpout2 = np.array(list(map(str, self.lvl3hashframe)))
+                out2 = np.empty_like(tmpout2, shape=(len_arr,))
+                out2[:len(self.lvl3hashframe)] = tmpout2
+
+                tmpout3 = np.array(list(map(str, self.idx)))
+                out3 = np.empty_like(tmpout3, shape=(len_arr,))
+                out3[:len(self.idx)] = tmpout3
+
+            # Column of index
+            number = np.arange(1, len(out1) + 1)
+
+            # Output
+            out = np.vstack((number, out1, out2, out3)).T
+            with open(name + '.csv', 'w') as handle:
+                wr = csv.writer(handle, quoting=csv.QUOTE_MINIMAL)
+                wr.writerow(["number", "label_of_segment", "starting_index_of_segment", "starting_index_of_segment_pre_interpolation"])
+                wr.writerows(out)
+
+    # Re-run analysis with the current thresholds, reusing the parameters of the trajectory
     def rerun(self):
         self._lvl1hash()
         self._lvl2hash()
         self._lvl3hash()
         self._get_prepost_idx()
-        self.plot = Plot(self.x, self.y, self.z, self.lvl2hashframe, self.lvl3hashframe)
+        self._plot = None
+
+
+#########################
+# Multi-marker analysis #
+#########################
+# Analysis of several markers (column triples) of the same .csv file, read once
+# The markers are preprocessed and labelled one by one, as their number of data points may differ after interpolation
+class MultiAnalysis:
+
+    def __init__(self, file, columns, x_threshold, y_threshold, z_threshold, main_direction_threshold,
+                 invert_x=False, invert_y=False, invert_z=False,
+                 header=None, smooth=False, interpolate=False, interdist=0.5, smoothing=None):
+        # columns: list of (col_x, col_y, col_z) of every marker, index starts at 1
+        self.columns = [tuple(marker) for marker in columns]
+
+        # Update header
+        if header is not None: header -= 1
+
+        # Read all markers at once, as a (markers, n, 3) array
+        if is_binary_trajectory(file):
+            if len(self.columns) > 1:
+                raise ValueError("Binary trajectory files hold a single marker")
+            data, _ = load_trajectory(file)
+            data = np.asarray(data)[np.newaxis]
+        else:
+            data = _read_csv_columns(file, [col - 1 for marker in self.columns for col in marker], header=header)
+            data = data.reshape(len(data), len(self.columns), 3).transpose(1, 0, 2)
+        self.original_corr = data
+
+        # Every marker is preprocessed on its own: smoothing the markers together in one filter call changes the
+        # rounding of the Savitzky–Golay fits at both ends (by ~1e-14), so the results would differ from an Analysis
+        # of the marker
+        trajectories = []
+        for i in range(len(self.columns)):
+            if smooth or interpolate:
+                X, pre_post_idx = preprocess(*data[i].T, smooth=smooth, interpolate=interpolate, interdist=interdist,
+                                             smoothing=smoothing)
+            else:
+                X, pre_post_idx = data[i], np.arange(0, len(data[i]))
+            trajectories.append((data[i], X, pre_post_idx))
+        self.markers = self._analyse(trajectories, x_threshold, y_threshold, z_threshold, main_direction_threshold,
+                                     invert_x, invert_y, invert_z)
+
+    # Label the preprocessed trajectories (original_corr, X, pre_post_idx) one after the other
+    # (ParallelMultiAnalysis in parallel.py labels them in worker processes instead)
+    def _analyse(self, trajectories, *settings):
+        return [Analysis.from_preprocessed(*trajectory, *settings) for trajectory in trajectories]
+
+    def __len__(self):
+        return len(self.markers)
+
+    def __getitem__(self, i):
+        return self.markers[i]
+
+    # Save the results of every marker (see Analysis.save), with the marker number appended to the name
+    def save(self, name, file_format):
+        for i, marker in enumerate(self.markers, 1):
+            marker.save("{}_marker{}".format(name, i), file_format)
 
 
 ####################################
 # Class for getting plot materials #
 ####################################
+# Level of detail: segments of more than LOD_POINTS data points are drawn simplified (Ramer-Douglas-Peucker), within
+# LOD_PIXELS pixels of the full segment on screen
+# The simplified segments of the last LOD_CACHE node and zoom combinations are kept
+LOD_POINTS = 2000
+LOD_PIXELS = 0.5
+LOD_CACHE = 256
+
+
 class Plot:
 
-    def __init__(self, x, y, z, lvl2hashframe, lvl3hashframe):
-        self.x = x
-        self.y = y
-        self.z = z
+    def __init__(self, X, lvl2hashframe, lvl3hashframe):
+        # Single contiguous (n, 3) array, handed out as zero-copy segment views
+        self.X = np.ascontiguousarray(X)
+        self.x = self.X[:, 0]
+        self.y = self.X[:, 1]
+        self.z = self.X[:, 2]
         self.lvl2hashframe = lvl2hashframe
         self.lvl3hashframe = lvl3hashframe
-        self.max_min = np.array([max(x), min(x), max(y), min(y), max(z), min(z)])
-
-    def initplot_lvl1(self):
-        mainplot = [self.x[0:2], self.y[0:2], self.z[0:2]]
+        self.max_min = np.column_stack((np.nanmax(self.X, axis=0), np.nanmin(self.X, axis=0))).ravel()
+
+        # First and last frame of the data points of every node (the last point is shared with the next node), per level
+        lvl1hashframe = np.arange(len(self.X))
+        lvl2hashframe = np.asarray(lvl2hashframe, dtype=np.intp)
+        lvl3hashframe = np.asarray(lvl3hashframe, dtype=np.intp)
+        self.starts = {1: lvl1hashframe[:-1], 2: lvl2hashframe[:-1], 3: lvl3hashframe[:-1]}
+        self.stops = {1: lvl1hashframe[1:] + 1, 2: lvl2hashframe[1:] + 1, 3: lvl3hashframe[1:] + 1}
+
+        # Level of detail: (tolerance, significance of every data point) of long nodes, and simplified segments
+        # Segments may be requested by several threads (see cache.NavigationCache), so both are changed under a lock
+        self._significance = {}
+        self._lod = OrderedDict()
+        self._lock = threading.Lock()
+
+    # (k, 3) view of the data points of a node
+    # With the resolution (pixels across the bounding box on screen), long nodes are simplified (copied)
+    def segment(self, level, node, resolution=None):
+        return self._simplified(level, node, self.starts[level][node], self.stops[level][node], resolution)
+
+    # Data points [start, stop) of a node, simplified for the resolution if there are more than LOD_POINTS
+    def _simplified(self, level, node, start, stop, resolution):
+        if resolution is None or stop - start <= LOD_POINTS:
+            return self.X[start:stop]
+
+        tolerance = self.tolerance(resolution)
+        key = (level, node, stop, tolerance)
+        with self._lock:
+            segment = self._lod.get(key)
+            if segment is not None:
+                self._lod.move_to_end(key)
+                return segment
+            cached = self._significance.get((level, node, stop))
+
+        # Significances are computed once per node, down to a quarter of the tolerance so that zooming in does not
+        # compute them again
+        if cached is None or cached[0] > tolerance:
+            cached = (tolerance / 4, _rdp_significance(self.X[start:stop], tolerance / 4))
+            with self._lock:
+                self._significance[(level, node, stop)] = cached
+        segment = self.X[start:stop][cached[1] > tolerance]
+
+        with self._lock:
+            self._lod[key] = segment
+            if len(self._lod) > LOD_CACHE:
+                self._lod.popitem(last=False)
+        return segment
+
+    # (2, 3) view of the data points joining a node to the previous one, or None for the first node
+    def tail(self, level, node):
+        if node == 0:
+            return None
+        start = self.starts[level][node]
+        return self.X[start - 1:start + 1]
+
+    # Largest distance (data units) between a simplified and a full segment for a resolution (pixels across the
+    # bounding box)
+    def tolerance(self, resolution):
+        return LOD_PIXELS * np.nanmax(self.max_min[0::2] - self.max_min[1::2]) / resolution
+
+    def initplot_lvl1(self, resolution=None):
+        mainplot = self.X[0:2]
         return [mainplot, self.max_min]
 
-    def initplot_lvl2(self):
-        mainplot = [self.x[0:self.lvl2hashframe[1]], self.y[0:self.lvl2hashframe[1]], self.z[0:self.lvl2hashframe[1]]]
+    # The first node is plotted without the data point shared with the next node, before it is simplified so that the
+    # simplified line still ends at the last data point of the node
+    def initplot_lvl2(self, resolution=None):
+        mainplot = self._simplified(2, 0, self.starts[2][0], self.stops[2][0] - 1, resolution)
         return [mainplot, self.max_min]
 
-    def initplot_lvl3(self):
-        mainplot = [self.x[0:self.lvl3hashframe[1]], self.y[0:self.lvl3hashframe[1]], self.z[0:self.lvl3hashframe[1]]]
+    def initplot_lvl3(self, resolution=None):
+        mainplot = self._simplified(3, 0, self.starts[3][0], self.stops[3][0] - 1, resolution)
         return [mainplot, self.max_min]
 
-    def updateplot_lvl1(self, node):
-        mainplot = [self.x[node:node+2], self.y[node:node+2], self.z[node:node+2]]
-        faintplot_tail = [self.x[node-1:node+1], self.y[node-1:node+1], self.z[node-1:node+1]] if node != 0 else None
-        return [mainplot, faintplot_tail, self.max_min]
-
-    def updateplot_lvl2(self, node):
-        mainplot = [self.x[self.lvl2hashframe[node]:self.lvl2hashframe[node+1]+1],
-                    self.y[self.lvl2hashframe[node]:self.lvl2hashframe[node+1]+1],
-                    self.z[self.lvl2hashframe[node]:self.lvl2hashframe[node+1]+1]]
-        faintplot_tail = [self.x[self.lvl2hashframe[node]-1:self.lvl2hashframe[node]+1],
-                          self.y[self.lvl2hashframe[node]-1:self.lvl2hashframe[node]+1],
-                          self.z[self.lvl2hashframe[node]-1:self.lvl2hashframe[node]+1]] if node != 0 else None
-        return [mainplot, faintplot_tail, self.max_min]
-
-    def updateplot_lvl3(self, node):
-        mainplot = [self.x[self.lvl3hashframe[node]:self.lvl3hashframe[node+1]+1],
-                    self.y[self.lvl3hashframe[node]:self.lvl3hashframe[node+1]+1],
-                    self.z[self.lvl3hashframe[node]:self.lvl3hashframe[node+1]+1]]
-        faintplot_tail = [self.x[self.lvl3hashframe[node]-1:self.lvl3hashframe[node]+1],
-                          self.y[self.lvl3hashframe[node]-1:self.lvl3hashframe[node]+1],
-                          self.z[self.lvl3hashframe[node]-1:self.lvl3hashframe[node]+1]] if node != 0 else None
-        return [mainplot, faintplot_tail, self.max_min]
+    def updateplot_lvl1(self, node, resolution=None):
+        return [self.segment(1, node), self.tail(1, node), self.max_min]
+
+    def updateplot_lvl2(self, node, resolution=None):
+        return [self.segment(2, node, resolution), self.tail(2, node), self.max_min]
+
+    def updateplot_lvl3(self, node, resolution=None):
+        return [self.segment(3, node, resolution), self.tail(3, node), self.max_min]
+
+
+# Corners of a cube around data with the given maximum and minimum (X, Y, Z), centred on the data, as a (3, 8) array
+# Plotted without lines, it gives the 3D axes an equal aspect ratio
+def bounding_box(maximum, minimum):
+    maximum, minimum = np.asarray(maximum, dtype=float), np.asarray(minimum, dtype=float)
+    max_range = (maximum - minimum).max()
+    corners = np.mgrid[-1:2:2, -1:2:2, -1:2:2].reshape(3, -1)
+    return 0.5 * max_range * corners + 0.5 * (maximum + minimum)[:, None]
+
+
+# Project the points of a 3D scatter plot (Path3DCollection) when it is drawn on its own, e.g. when blitting, as the 3D
+# axes only project them in full redraws
+# matplotlib < 3.5 projects with the renderer, later versions take no argument
+def project_scatter(collection, renderer):
+    parameter = inspect.signature(collection.do_3d_projection).parameters.get('renderer')
+    if parameter is not None and parameter.default is inspect.Parameter.empty:
+        collection.do_3d_projection(renderer)
+    else:
+        collection.do_3d_projection()
+
+
+# Significance of every point of a polyline: the largest Ramer-Douglas-Peucker tolerance that keeps it (infinite for
+# the end points), so that the simplification for any tolerance is the points of higher significance
+# Points under the tolerance `floor` are not refined and get 0
+def _rdp_significance(P, floor=0.0):
+    significance = np.zeros(len(P))
+    significance[[0, -1]] = np.inf
+
+    stack = [(0, len(P) - 1, np.inf)]
+    while stack:
+        a, b, parent = stack.pop()
+        if b - a < 2:
+            continue
+
+        # Distance of the points between a and b to the chord (a, b)
+        chord = P[b] - P[a]
+        length = norm(chord)
+        if length > 0:
+            d = norm(np.cross(P[a + 1:b] - P[a], chord), axis=1) / length
+        else:
+            d = norm(P[a + 1:b] - P[a], axis=1)
+        d[np.isnan(d)] = np.inf
+        i = int(np.argmax(d))
+
+        # A point is never more significant than the point that split its range
+        s = min(d[i], parent)
+        if s <= floor:
+            continue
+        significance[a + 1 + i] = s
+        stack.append((a, a + 1 + i, s))
+        stack.append((a + 1 + i, b, s))
+    return significance
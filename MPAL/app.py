@@ -10,16 +10,14 @@ import matplotlib
 matplotlib.use('Qt5Agg')
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D, proj3d
-from matplotlib.animation import FuncAnimation
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import numpy as np
-from scipy.io import savemat
 import pandas as pd
 import os
 import csv
-import pickle
 
 from analysis import *
+from cache import PreprocessingCache, NavigationCache
 
 # App info
 appname = "MPAL"
@@ -42,6 +40,8 @@ class App(QtWidgets.QMainWindow):
 
         # Initialize UI components
         self.settings = Settings()
+        self.cache = PreprocessingCache()
+        self.navigation = NavigationCache(self.__node)
         self.initUI()
         self.dropdownUI()
         credit = QtWidgets.QLabel("{} v{}".format(appname, version))
@@ -79,10 +79,14 @@ class App(QtWidgets.QMainWindow):
         self.col_x = 1
         self.col_y = 2
         self.col_z = 3
+        self.other_markers = ""
         self.smooth = False
         self.interpolate = False
         self.interpolate_val = 0.5
 
+        # Analysis of every marker of the file (self.analysis is the one displayed)
+        self.markers = []
+
         # Set initial plot attributes
         self.zoom = 1.0
         self.invert_x = False
@@ -167,8 +171,16 @@ class App(QtWidgets.QMainWindow):
         bottom_left_layout.addWidget(self.zoom_in_btn)
         bottom_left_layout.addStretch()
 
-        # Button for changing the labels
+        # Marker selection (files opened with several markers)
         bottom_mid_layout.addStretch()
+        self.marker_cb = QtWidgets.QComboBox(main_widget)
+        self.marker_cb.setSizeAdjustPolicy(QtWidgets.QComboBox.AdjustToContents)
+        self.marker_cb.setStatusTip("Switch marker")
+        self.marker_cb.setDisabled(True)
+        self.marker_cb.currentIndexChanged.connect(self.__select_marker)
+        bottom_mid_layout.addWidget(self.marker_cb)
+
+        # Button for changing the labels
         self.change_btn = QtWidgets.QPushButton("Change Labels", main_widget)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
         sizePolicy.setHeightForWidth(self.change_btn.sizePolicy().hasHeightForWidth())
@@ -377,6 +389,11 @@ class App(QtWidgets.QMainWindow):
         self.lvl1Button.setDisabled(True)
         self.animationButton.setDisabled(True)
         self.rerunButton.setDisabled(True)
+        self.markers = []
+        self.marker_cb.blockSignals(True)
+        self.marker_cb.clear()
+        self.marker_cb.blockSignals(False)
+        self.marker_cb.setDisabled(True)
         self.m.clearplot()
         self.operating = False
 
@@ -404,16 +421,42 @@ class App(QtWidgets.QMainWindow):
 
         def __selectfile():
             file_path = QtWidgets.QFileDialog.getOpenFileName(None, "Select File",
-                                                              filter="CSV Files (*.csv)",
+                                                              filter="Trajectory Files (*.csv *.npy *.npz);;"
+                                                                     "CSV Files (*.csv);;"
+                                                                     "Binary Trajectory Files (*.npy *.npz)",
                                                               options=QtWidgets.QFileDialog.DontUseNativeDialog)
             if file_path[0] != "":
                 self.file_path = file_path
                 file_le.setText(self.file_path[0])
 
+                # Header and columns do not apply to binary trajectories
+                binary = is_binary_trajectory(self.file_path[0])
+                header_cb.setDisabled(binary)
+                header_le.setDisabled(binary or not header_cb.isChecked())
+                col_x_le.setDisabled(binary)
+                col_y_le.setDisabled(binary)
+                col_z_le.setDisabled(binary)
+                markers_le.setDisabled(binary)
+
+                # Restore the inversion options stored when converting from .csv
+                if binary:
+                    try:
+                        _, metadata = load_trajectory(self.file_path[0])
+                    except (OSError, ValueError, KeyError):
+                        metadata = {}
+                    x_cb.setChecked(bool(metadata.get('invert_x', x_cb.isChecked())))
+                    y_cb.setChecked(bool(metadata.get('invert_y', y_cb.isChecked())))
+                    z_cb.setChecked(bool(metadata.get('invert_z', z_cb.isChecked())))
+
         # TODO: file-breaking prevention (equal rows, data type)
         # TODO: header check
         # TODO: column selection check
         def __checkfile():
+            # Other markers must be triples of column numbers
+            for marker in markers_le.text().split(';'):
+                cols = marker.split(',')
+                if len(marker.strip()) > 0 and (len(cols) != 3 or not all(col.strip().isdigit() for col in cols)):
+                    return False
             return True
 
         def __ok():
@@ -423,6 +466,7 @@ class App(QtWidgets.QMainWindow):
                 valid = __checkfile()
 
             if valid:
+                self.navigation.reset()
                 self.processing_level = 1
                 self.current_pos = 0
                 self.scroll_txt_le.setText('0')
@@ -437,6 +481,10 @@ class App(QtWidgets.QMainWindow):
                 self.col_x = int(col_x_le.text())
                 self.col_y = int(col_y_le.text())
                 self.col_z = int(col_z_le.text())
+                self.other_markers = markers_le.text() if markers_le.isEnabled() else ""
+                columns = [(self.col_x, self.col_y, self.col_z)] + \
+                          [tuple(int(col) for col in marker.split(',')) for marker in self.other_markers.split(';')
+                           if len(marker.strip()) > 0]
 
                 # Check if the smoothing option is checked
                 if smooth_cb.isChecked():
@@ -460,11 +508,29 @@ class App(QtWidgets.QMainWindow):
                 self.zoom_lbl.setText(str(self.zoom))
                 self.m.axes.dist = 10
 
-                self.analysis = Analysis(self.file_path[0], self.col_x, self.col_y, self.col_z, self.settings.x_threshold,
-                                         self.settings.y_threshold, self.settings.z_threshold,
-                                         self.settings.main_direction_threshold,
-                                         invert_x=self.invert_x, invert_y=self.invert_y, invert_z=self.invert_z,
-                                         header=self.header, smooth=self.smooth, interpolate=self.interpolate, interdist=self.interpolate_val)
+                if len(columns) == 1:
+                    self.markers = [Analysis(self.file_path[0], self.col_x, self.col_y, self.col_z, self.settings.x_threshold,
+                                             self.settings.y_threshold, self.settings.z_threshold,
+                                             self.settings.main_direction_threshold,
+                                             invert_x=self.invert_x, invert_y=self.invert_y, invert_z=self.invert_z,
+                                             header=self.header, smooth=self.smooth, interpolate=self.interpolate, interdist=self.interpolate_val,
+                                             smoothing=self.settings.smoothing, cache=self.cache)]
+                else:
+                    # Read the file once for all markers
+                    self.markers = MultiAnalysis(self.file_path[0], columns, self.settings.x_threshold,
+                                                 self.settings.y_threshold, self.settings.z_threshold,
+                                                 self.settings.main_direction_threshold,
+                                                 invert_x=self.invert_x, invert_y=self.invert_y, invert_z=self.invert_z,
+                                                 header=self.header, smooth=self.smooth, interpolate=self.interpolate,
+                                                 interdist=self.interpolate_val, smoothing=self.settings.smoothing).markers
+                self.analysis = self.markers[0]
+
+                self.marker_cb.blockSignals(True)
+                self.marker_cb.clear()
+                for i, marker in enumerate(columns, 1):
+                    self.marker_cb.addItem("Marker {} ({}, {}, {})".format(i, *marker))
+                self.marker_cb.blockSignals(False)
+                self.marker_cb.setDisabled(len(columns) == 1)
                 self.m.initplot(self.analysis.plot.initplot_lvl1(), title='3D trajectory (Level 1)',
                                 x_axis='X (Left/Right)', y_axis='Y (Forward/Backward)', z_axis='Z (Up/Down)',
                                 invert_x=self.invert_x, invert_y=self.invert_y, invert_z=self.invert_z)
@@ -574,11 +640,19 @@ class App(QtWidgets.QMainWindow):
         col_z_le.textChanged.connect(__textchange)
         layout2.addWidget(col_z_le, 2, 5, 1, 1)
 
+        markers_lbl = QtWidgets.QLabel("Other markers: ", d)
+        layout2.addWidget(markers_lbl, 3, 0, 1, 1)
+
+        markers_le = QtWidgets.QLineEdit(self.other_markers, d)
+        markers_le.setPlaceholderText("X, Y, Z; X, Y, Z; ... (e.g. 4, 5, 6; 7, 8, 9)")
+        markers_le.setValidator(QtGui.QRegExpValidator(QtCore.QRegExp("(\\s*\\d+\\s*,\\s*\\d+\\s*,\\s*\\d+\\s*;?)*\\s*")))
+        layout2.addWidget(markers_le, 3, 1, 1, 5)
+
         # Separation line
         line1 = QtWidgets.QFrame(d)
         line1.setFrameShape(QtWidgets.QFrame.HLine)
         line1.setFrameShadow(QtWidgets.QFrame.Sunken)
-        layout2.addWidget(line1, 3, 0, 1, 6)
+        layout2.addWidget(line1, 4, 0, 1, 6)
 
         # Preprocessing options
         pp_lbl = QtWidgets.QLabel("Preprocessing Options:", d)
@@ -651,65 +725,11 @@ class App(QtWidgets.QMainWindow):
                                                      options=QtWidgets.QFileDialog.DontUseNativeDialog)
         if name[0] != '':
             if name[1] == "Pickle Files (*.pkl)":
-                with open(name[0] + '.pkl', 'wb') as handle:
-                    pickle.dump([self.analysis.original_corr,
-                                 self.analysis.X,
-                                 self.analysis.x_threshold,
-                                 self.analysis.y_threshold,
-                                 self.analysis.z_threshold,
-                                 self.analysis.main_direction_threshold,
-                                 self.analysis.parameters,
-                                 self.analysis.lvl1hash,
-                                 self.analysis.lvl2hash,
-                                 self.analysis.lvl2hashframe,
-                                 self.analysis.lvl3hash,
-                                 self.analysis.lvl3hashframe,
-                                 self.analysis.idx], handle)
+                self.analysis.save(name[0], 'pkl')
             elif name[1] == "MATLAB Files (*.mat)":
-                savemat(name[0] + '.mat',
-                        {'original_corr': self.analysis.original_corr,
-                         'X': self.analysis.X,
-                         'x_threshold': self.analysis.x_threshold,
-                         'y_threshold': self.analysis.y_threshold,
-                         'z_threshold': self.analysis.z_threshold,
-                         'main_direction_threshold': self.analysis.main_direction_threshold,
-                         'lvl3hash': self.analysis.lvl1hash,
-                         'lvl2hash': self.analysis.lvl2hash,
-                         'lvl2hashframe': self.analysis.lvl2hashframe,
-                         'lvl1hash': self.analysis.lvl3hash,
-                         'lvl1hashframe': self.analysis.lvl3hashframe,
-                         'idx': self.analysis.idx})
+                self.analysis.save(name[0], 'mat')
             elif name[1] == "CSV Files (*.csv)":
-                # Ensure length of the three outputs are the same
-                # (IT SHOULD BE THE SAME, OTHERWISE SOMETHING WENT WRONG)
-                if len(self.analysis.lvl3hash) == len(self.analysis.lvl3hashframe) == len(self.analysis.idx):
-                    out1 = np.array(list(map(str, self.analysis.lvl3hash)))
-                    out2 = np.array(list(map(str, self.analysis.lvl3hashframe)))
-                    out3 = np.array(list(map(str, self.analysis.idx)))
-                else:
-                    len_arr = max([len(self.analysis.lvl3hash), len(self.analysis.lvl3hashframe), len(self.analysis.idx)])
-
-                    tmpout1 = np.array(list(map(str, self.analysis.lvl3hash)))
-                    out1 = np.empty_like(tmpout1, shape=(len_arr,))
-                    out1[:len(self.analysis.lvl3hash)] = tmpout1
-
-                    tmpout2 = np.array(list(map(str, self.analysis.lvl3hashframe)))
-                    out2 = np.empty_like(tmpout2, shape=(len_arr,))
-                    out2[:len(self.analysis.lvl3hashframe)] = tmpout2
-
-                    tmpout3 = np.array(list(map(str, self.analysis.idx)))
-                    out3 = np.empty_like(tmpout3, shape=(len_arr,))
-                    out3[:len(self.analysis.idx)] = tmpout3
-
-                # Column of index
-                number = np.arange(1, len(out1) + 1)
-
-                # Output
-                out = np.vstack((number, out1, out2, out3)).T
-                with open(name[0] + '.csv', 'w') as handle:
-                    wr = csv.writer(handle, quoting=csv.QUOTE_MINIMAL)
-                    wr.writerow(["number", "label_of_segment", "starting_index_of_segment", "starting_index_of_segment_pre_interpolation"])
-                    wr.writerows(out)
+                self.analysis.save(name[0], 'csv')
 
     def __exportcsv(self):
         name = QtWidgets.QFileDialog.getSaveFileName(self, "Export to CSV", self.file_path[0][:-4], "CSV Files (*.csv)",
@@ -724,44 +744,17 @@ class App(QtWidgets.QMainWindow):
         if self.operating:
             self.current_pos = 0
             self.scroll_txt_le.setText("0")
-            if self.processing_level == 1:
-                self.m.updateplot(self.analysis.plot.updateplot_lvl1(self.current_pos))
-                self.trajlabel.setText(self.analysis.lvl1hash[0][self.current_pos] +
-                                       self.analysis.lvl1hash[1][self.current_pos] +
-                                       self.analysis.lvl1hash[2][self.current_pos])
-            elif self.processing_level == 2:
-                self.m.updateplot(self.analysis.plot.updateplot_lvl2(self.current_pos))
-                self.trajlabel.setText(self.analysis.lvl2hash[0][self.current_pos] +
-                                       self.analysis.lvl2hash[1][self.current_pos] +
-                                       self.analysis.lvl2hash[2][self.current_pos])
-            elif self.processing_level == 3:
-                self.m.updateplot(self.analysis.plot.updateplot_lvl3(self.current_pos))
-                self.trajlabel.setText(self.analysis.lvl3hash[self.current_pos])
+            self.__shownode()
 
     def __jumpend(self):
         if self.operating:
-            if self.processing_level == 1:
-                self.current_pos = len(self.analysis.lvl1hash[0]) - 2
-                self.scroll_txt_le.setText(str(self.current_pos))
-                self.m.updateplot(self.analysis.plot.updateplot_lvl1(self.current_pos))
-                self.trajlabel.setText(self.analysis.lvl1hash[0][self.current_pos] +
-                                       self.analysis.lvl1hash[1][self.current_pos] +
-                                       self.analysis.lvl1hash[2][self.current_pos])
-            elif self.processing_level == 2:
-                self.current_pos = len(self.analysis.lvl2hash[0]) - 2
-                self.scroll_txt_le.setText(str(self.current_pos))
-                self.m.updateplot(self.analysis.plot.updateplot_lvl2(self.current_pos))
-                self.trajlabel.setText(self.analysis.lvl2hash[0][self.current_pos] +
-                                       self.analysis.lvl2hash[1][self.current_pos] +
-                                       self.analysis.lvl2hash[2][self.current_pos])
-            elif self.processing_level == 3:
-                self.current_pos = len(self.analysis.lvl3hash) - 2
-                self.scroll_txt_le.setText(str(self.current_pos))
-                self.m.updateplot(self.analysis.plot.updateplot_lvl3(self.current_pos))
-                self.trajlabel.setText(self.analysis.lvl3hash[self.current_pos])
+            self.current_pos = self.__lastpos()
+            self.scroll_txt_le.setText(str(self.current_pos))
+            self.__shownode()
 
     def __lvl1switch(self):
         if self.processing_level != 1:
+            self.navigation.reset()
             self.processing_level = 1
             self.current_pos = 0
             self.scroll_txt_le.setText('0')
@@ -774,10 +767,11 @@ class App(QtWidgets.QMainWindow):
 
     def __lvl2switch(self):
         if self.processing_level != 2:
+            self.navigation.reset()
             self.processing_level = 2
             self.current_pos = 0
             self.scroll_txt_le.setText('0')
-            self.m.initplot(self.analysis.plot.initplot_lvl2(), title='3D trajectory (Level 2)',
+            self.m.initplot(self.analysis.plot.initplot_lvl2(self.m.resolution()), title='3D trajectory (Level 2)',
                             x_axis='X (Left/Right)', y_axis='Y (Forward/Backward)', z_axis='Z (Up/Down)',
                             invert_x=self.invert_x, invert_y=self.invert_y, invert_z=self.invert_z)
             self.trajlabel.setText(self.analysis.lvl2hash[0][0] +
@@ -786,17 +780,19 @@ class App(QtWidgets.QMainWindow):
 
     def __lvl3switch(self):
         if self.processing_level != 3:
+            self.navigation.reset()
             self.processing_level = 3
             self.current_pos = 0
             self.scroll_txt_le.setText('0')
-            self.m.initplot(self.analysis.plot.initplot_lvl3(), title='3D trajectory (Level 3)',
+            self.m.initplot(self.analysis.plot.initplot_lvl3(self.m.resolution()), title='3D trajectory (Level 3)',
                             x_axis='X (Left/Right)', y_axis='Y (Forward/Backward)', z_axis='Z (Up/Down)',
                             invert_x=self.invert_x, invert_y=self.invert_y, invert_z=self.invert_z)
             self.trajlabel.setText(self.analysis.lvl3hash[0])
 
     def __trajectory(self):
         traj = Trajectory(self.analysis.x, self.analysis.y, self.analysis.z,
-                          self.invert_x, self.invert_y, self.invert_z)
+                          self.invert_x, self.invert_y, self.invert_z,
+                          rate=self.settings.sample_rate, pre_post_idx=self.analysis.pre_post_idx)
 
     def __settings(self):
         self.settings.change()
@@ -806,14 +802,34 @@ class App(QtWidgets.QMainWindow):
     # Re-run analysis with new thresholds from settings
     def __rerun(self):
         if self.operating:
-            # Set new thresholds of analysis object
-            self.analysis.x_threshold = self.settings.x_threshold
-            self.analysis.y_threshold = 90 - self.settings.y_threshold
-            self.analysis.z_threshold = 90 - self.settings.z_threshold
-            self.analysis.main_direction_threshold = self.settings.main_direction_threshold
+            # Wait for the navigation thread before changing the analysis
+            self.navigation.reset()
+            for analysis in self.markers:
+                # Set new thresholds of analysis object
+                analysis.x_threshold = self.settings.x_threshold
+                analysis.y_threshold = 90 - self.settings.y_threshold
+                analysis.z_threshold = 90 - self.settings.z_threshold
+                analysis.main_direction_threshold = self.settings.main_direction_threshold
+
+                # Re-run analysis
+                analysis.rerun()
+
+            # Reset plotting and labels
+            self.processing_level = 1
+            self.current_pos = 0
+            self.scroll_txt_le.setText('0')
+            self.m.initplot(self.analysis.plot.initplot_lvl1(), title='3D trajectory (Level 1)',
+                            x_axis='X (Left/Right)', y_axis='Y (Forward/Backward)', z_axis='Z (Up/Down)',
+                            invert_x=self.invert_x, invert_y=self.invert_y, invert_z=self.invert_z)
+            self.trajlabel.setText(self.analysis.lvl1hash[0][0] +
+                                   self.analysis.lvl1hash[1][0] +
+                                   self.analysis.lvl1hash[2][0])
 
-            # Re-run analysis
-            self.analysis.rerun()
+    # Display another marker of the file, without reloading it
+    def __select_marker(self, index):
+        if self.operating and 0 <= index < len(self.markers):
+            self.navigation.reset()
+            self.analysis = self.markers[index]
 
             # Reset plotting and labels
             self.processing_level = 1
@@ -901,12 +917,10 @@ class App(QtWidgets.QMainWindow):
                 self.m.axes.dist += 1
                 self.zoom -= .1
                 self.zoom_lbl.setText(str(round(self.zoom, 1)))
-                if self.processing_level == 3:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl3(self.current_pos))
-                elif self.processing_level == 2:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl2(self.current_pos))
-                elif self.processing_level == 1:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl1(self.current_pos))
+                # The view and the level of detail change, so the node is plotted again and the whole plot redrawn
+                if self.processing_level != 1:
+                    self.__shownode()
+                self.m.draw_idle()
 
     # Action for zooming in
     def __zoom_in(self):
@@ -915,12 +929,10 @@ class App(QtWidgets.QMainWindow):
                 self.m.axes.dist -= 1
                 self.zoom += .1
                 self.zoom_lbl.setText(str(round(self.zoom, 1)))
-                if self.processing_level == 3:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl3(self.current_pos))
-                elif self.processing_level == 2:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl2(self.current_pos))
-                elif self.processing_level == 1:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl1(self.current_pos))
+                # The view and the level of detail change, so the node is plotted again and the whole plot redrawn
+                if self.processing_level != 1:
+                    self.__shownode()
+                self.m.draw_idle()
 
     # Action for scroll left
     def __scroll_left(self):
@@ -928,81 +940,30 @@ class App(QtWidgets.QMainWindow):
             if self.current_pos > 0:
                 self.current_pos -= 1
                 self.scroll_txt_le.setText(str(self.current_pos))
-                if self.processing_level == 1:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl1(self.current_pos))
-                    self.trajlabel.setText(self.analysis.lvl1hash[0][self.current_pos] +
-                                           self.analysis.lvl1hash[1][self.current_pos] +
-                                           self.analysis.lvl1hash[2][self.current_pos])
-                elif self.processing_level == 2:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl2(self.current_pos))
-                    self.trajlabel.setText(self.analysis.lvl2hash[0][self.current_pos] +
-                                           self.analysis.lvl2hash[1][self.current_pos] +
-                                           self.analysis.lvl2hash[2][self.current_pos])
-                elif self.processing_level == 3:
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl3(self.current_pos))
-                    self.trajlabel.setText(self.analysis.lvl3hash[self.current_pos])
+                self.__shownode()
 
     # Action for scroll right
     def __scroll_right(self):
         if self.operating:
-            if self.processing_level == 1:
-                if self.current_pos < len(self.analysis.lvl1hash[0]) - 2:
-                    self.current_pos += 1
-                    self.scroll_txt_le.setText(str(self.current_pos))
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl1(self.current_pos))
-                    self.trajlabel.setText(self.analysis.lvl1hash[0][self.current_pos] +
-                                           self.analysis.lvl1hash[1][self.current_pos] +
-                                           self.analysis.lvl1hash[2][self.current_pos])
-            elif self.processing_level == 2:
-                if self.current_pos < len(self.analysis.lvl2hash[0]) - 2:
-                    self.current_pos += 1
-                    self.scroll_txt_le.setText(str(self.current_pos))
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl2(self.current_pos))
-                    self.trajlabel.setText(self.analysis.lvl2hash[0][self.current_pos] +
-                                           self.analysis.lvl2hash[1][self.current_pos] +
-                                           self.analysis.lvl2hash[2][self.current_pos])
-            elif self.processing_level == 3:
-                if self.current_pos < len(self.analysis.lvl3hash) - 2:
-                    self.current_pos += 1
-                    self.scroll_txt_le.setText(str(self.current_pos))
-                    self.m.updateplot(self.analysis.plot.updateplot_lvl3(self.current_pos))
-                    self.trajlabel.setText(self.analysis.lvl3hash[self.current_pos])
+            if self.current_pos < self.__lastpos():
+                self.current_pos += 1
+                self.scroll_txt_le.setText(str(self.current_pos))
+                self.__shownode()
 
     # Action for hitting enter on scroll line edit
     def __scroll_enter(self):
         if self.operating:
             if self.scroll_txt_le.text() != "":
-                if self.processing_level == 1:
-                    if int(self.scroll_txt_le.text()) <= len(self.analysis.lvl1hash[0]) - 2:
-                        self.current_pos = int(self.scroll_txt_le.text())
-                        self.m.updateplot(self.analysis.plot.updateplot_lvl1(self.current_pos))
-                        self.trajlabel.setText(self.analysis.lvl1hash[0][self.current_pos] +
-                                               self.analysis.lvl1hash[1][self.current_pos] +
-                                               self.analysis.lvl1hash[2][self.current_pos])
-                elif self.processing_level == 2:
-                    if int(self.scroll_txt_le.text()) <= len(self.analysis.lvl2hash[0]) - 2:
-                        self.current_pos = int(self.scroll_txt_le.text())
-                        self.m.updateplot(self.analysis.plot.updateplot_lvl2(self.current_pos))
-                        self.trajlabel.setText(self.analysis.lvl2hash[0][self.current_pos] +
-                                               self.analysis.lvl2hash[1][self.current_pos] +
-                                               self.analysis.lvl2hash[2][self.current_pos])
-                elif self.processing_level == 3:
-                    if int(self.scroll_txt_le.text()) <= len(self.analysis.lvl3hash) - 2:
-                        self.current_pos = int(self.scroll_txt_le.text())
-                        self.m.updateplot(self.analysis.plot.updateplot_lvl3(self.current_pos))
-                        self.trajlabel.setText(self.analysis.lvl3hash[self.current_pos])
+                if int(self.scroll_txt_le.text()) <= self.__lastpos():
+                    self.current_pos = int(self.scroll_txt_le.text())
+                    self.__shownode()
                 self.scroll_txt_le.clearFocus()
 
     # Action for detecting text change on scroll line edit (to prevent passing upper boundary)
     def __scroll_textChange(self):
         if self.operating:
             if self.scroll_txt_le.text() != "":
-                if self.processing_level == 1:
-                    limit = len(self.analysis.lvl1hash[0]) - 2
-                elif self.processing_level == 2:
-                    limit = len(self.analysis.lvl2hash[0]) - 2
-                elif self.processing_level == 3:
-                    limit = len(self.analysis.lvl3hash) - 2
+                limit = self.__lastpos()
 
                 if int(self.scroll_txt_le.text()) > limit:
                     self.scroll_left_btn.setDisabled(True)
@@ -1018,9 +979,39 @@ class App(QtWidgets.QMainWindow):
                     self.scroll_left_btn.setDisabled(False)
                     self.scroll_right_btn.setDisabled(False)
 
+    # Position of the last node of the current level
+    def __lastpos(self):
+        if self.processing_level == 1:
+            return len(self.analysis.lvl1hash[0]) - 2
+        elif self.processing_level == 2:
+            return len(self.analysis.lvl2hash[0]) - 2
+        elif self.processing_level == 3:
+            return len(self.analysis.lvl3hash) - 2
+
+    # Plot the node at current_pos and show its label
+    # The nodes around it are computed on the worker thread of the navigation cache while it is displayed
+    def __shownode(self):
+        resolution = self.m.resolution() if self.processing_level != 1 else None
+        plot, label = self.navigation.get(self.processing_level, self.current_pos, resolution, self.__lastpos())
+        self.m.updateplot(plot)
+        self.trajlabel.setText(label)
+
+    # Plot data and label of a node (source of the navigation cache, called on its worker thread when prefetching)
+    def __node(self, level, pos, resolution):
+        if level == 1:
+            return (self.analysis.plot.updateplot_lvl1(pos),
+                    self.analysis.lvl1hash[0][pos] + self.analysis.lvl1hash[1][pos] + self.analysis.lvl1hash[2][pos])
+        elif level == 2:
+            return (self.analysis.plot.updateplot_lvl2(pos, resolution),
+                    self.analysis.lvl2hash[0][pos] + self.analysis.lvl2hash[1][pos] + self.analysis.lvl2hash[2][pos])
+        elif level == 3:
+            return self.analysis.plot.updateplot_lvl3(pos, resolution), self.analysis.lvl3hash[pos]
+
     # Logic for changing the labels
     def __change_label(self):
         labelchange = LabelChange(self.current_pos, self.analysis, self.processing_level, self.trajlabel)
+        # Prefetched labels may have changed
+        self.navigation.reset()
 
     # Detect focus out
     def eventFilter(self, source, event):
@@ -1305,6 +1296,10 @@ class LabelChange(QtWidgets.QDialog):
 class Settings:
 
     def __init__(self):
+        # Preprocessing and recording settings, kept if missing from an older settings.config file
+        self.smoothing = dict(SMOOTHING)
+        self.sample_rate = 100.0
+
         # Find settings.config file
         # Load if found, create file with default parameters if missing
         try:
@@ -1315,22 +1310,31 @@ class Settings:
                     except Exception:
                         pass
         except FileNotFoundError:
-            default_text = "# DO NOT CHANGE THE CONTENT OF THIS FILE UNLESS YOU KNOW WHAT YOU ARE DOING!!!\n" \
-                           "# IF ERROR OCCURS BECAUSE OF THIS FILE, SIMPLY DELETE THIS FILE THEN RUN THE APPLICATION TO RESET TO DEFAULT SETTINGS\n\n" \
-                           "# Analysis settings parameters\n" \
-                           "self.x_threshold = 60.0\n" \
-                           "self.y_threshold = 60.0\n" \
-                           "self.z_threshold = 60.0\n" \
-                           "self.main_direction_threshold = 5\n\n" \
-                           "# Plot settings parameters\n" \
-                           "self.dpi = 60"
-            with open(os.path.join(script_dir, "config/settings.config"), 'w') as f:
-                f.writelines(default_text)
             self.x_threshold = 60.0
             self.y_threshold = 60.0
             self.z_threshold = 60.0
             self.main_direction_threshold = 5
             self.dpi = 60
+            self.__save()
+
+    # Write the settings to the settings.config file
+    def __save(self):
+        text = "# DO NOT CHANGE THE CONTENT OF THIS FILE UNLESS YOU KNOW WHAT YOU ARE DOING!!!\n" \
+               "# IF ERROR OCCURS BECAUSE OF THIS FILE, SIMPLY DELETE THIS FILE THEN RUN THE APPLICATION TO RESET TO DEFAULT SETTINGS\n\n" \
+               "# Analysis settings parameters\n" \
+               "self.x_threshold = {}\n" \
+               "self.y_threshold = {}\n" \
+               "self.z_threshold = {}\n" \
+               "self.main_direction_threshold = {}\n\n" \
+               "# Preprocessing settings parameters (method: savgol, butterworth or moving_average)\n" \
+               "self.smoothing = {}\n\n" \
+               "# Recording settings parameters (sample rate in Hz, for playing trajectories in real time)\n" \
+               "self.sample_rate = {}\n\n" \
+               "# Plot settings parameters\n" \
+               "self.dpi = {}".format(self.x_threshold, self.y_threshold, self.z_threshold,
+                                      self.main_direction_threshold, self.smoothing, self.sample_rate, self.dpi)
+        with open(os.path.join(script_dir, "config/settings.config"), 'w') as f:
+            f.writelines(text)
 
     def change(self):
         # Initialize variable
@@ -1344,7 +1348,7 @@ class Settings:
 
         # Initialize tabs
         self.analysistab = AnalysisSettingsWidget(self.x_threshold, self.y_threshold, self.z_threshold, self.main_direction_threshold)
-        self.plottab = PlotSettingsWidget(self.dpi)
+        self.plottab = PlotSettingsWidget(self.dpi, self.sample_rate)
 
         # Tab widget
         tab_widget = QtWidgets.QTabWidget()
@@ -1370,7 +1374,8 @@ class Settings:
     def __change(self):
         if len(self.analysistab.xturn_le.text()) > 0 and len(self.analysistab.yturn_le.text()) > 0 and \
                 len(self.analysistab.zturn_le.text()) > 0 and len(self.analysistab.md_le.text()) > 0 and \
-                len(self.plottab.dpi_le.text()) > 0 and \
+                len(self.plottab.dpi_le.text()) > 0 and len(self.plottab.rate_le.text()) > 0 and \
+                float(self.plottab.rate_le.text()) > 0 and \
                 float(self.analysistab.xturn_le.text()) <= 90 and float(self.analysistab.yturn_le.text()) <= 90 and \
                 float(self.analysistab.zturn_le.text()) <= 90:
             if self.x_threshold == float(self.analysistab.xturn_le.text()) and \
@@ -1385,6 +1390,7 @@ class Settings:
                 self.z_threshold = float(self.analysistab.zturn_le.text())
                 self.main_direction_threshold = int(self.analysistab.md_le.text())
             self.dpi = int(self.plottab.dpi_le.text())
+            self.sample_rate = float(self.plottab.rate_le.text())
 
             if changed:
                 reply = QtWidgets.QMessageBox.question(self.d, "Re-run Analysis?",
@@ -1393,19 +1399,9 @@ class Settings:
                                                        QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
                                                        QtWidgets.QMessageBox.No)
                 self.rerun = True if reply == QtWidgets.QMessageBox.Yes else False
-                new_settings = "# DO NOT CHANGE THE CONTENT OF THIS FILE UNLESS YOU KNOW WHAT YOU ARE DOING!!!\n\n" \
-                               "# IF ERROR OCCURS BECAUSE OF THIS FILE, SIMPLY DELETE THIS FILE THEN RUN THE APPLICATION TO RESET TO DEFAULT SETTINGS\n\n" \
-                               "# Analysis settings parameters\n" \
-                               "self.x_threshold = {}\n" \
-                               "self.y_threshold = {}\n" \
-                               "self.z_threshold = {}\n" \
-                               "self.main_direction_threshold = {}\n\n" \
-                               "# Plot settings parameters\n" \
-                               "self.dpi = {}".format(self.x_threshold, self.y_threshold, self.z_threshold, self.main_direction_threshold,
-                                                      self.dpi)
-                with open(os.path.join(script_dir, "config/settings.config"), 'w') as f:
-                    f.writelines(new_settings)
 
+            # Saved whenever a setting is accepted (the plot dpi and sample rate do not need a re-run)
+            self.__save()
             self.d.close()
         else:
             error_dialog = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Critical, "Error", "The settings are invalid.")
@@ -1460,12 +1456,13 @@ class AnalysisSettingsWidget(QtWidgets.QWidget):
 
 class PlotSettingsWidget(QtWidgets.QWidget):
 
-    def __init__(self, dpi, parent=None):
+    def __init__(self, dpi, sample_rate, parent=None):
         super(PlotSettingsWidget, self).__init__(parent)
         layout = QtWidgets.QGridLayout(self)
 
         # Create class attributes
         self.dpi = dpi
+        self.sample_rate = sample_rate
 
         # Create labels and line-edit for entries
         dpi_lbl = QtWidgets.QLabel("Plot dpi:\n(Default: 60)", self)
@@ -1475,6 +1472,13 @@ class PlotSettingsWidget(QtWidgets.QWidget):
         self.dpi_le.setValidator(QtGui.QRegExpValidator(QtCore.QRegExp("^[1-9]\d*$")))
         layout.addWidget(self.dpi_le, 1, 2, 1, 1)
 
+        rate_lbl = QtWidgets.QLabel("Sample rate of the recording (Hz):\n(Default: 100) (for Show Trajectory)", self)
+        layout.addWidget(rate_lbl, 2, 1, 1, 1)
+
+        self.rate_le = QtWidgets.QLineEdit(str(self.sample_rate), self)
+        self.rate_le.setValidator(QtGui.QRegExpValidator(QtCore.QRegExp("^([1-9]\d*|0)(\.\d+)?$")))
+        layout.addWidget(self.rate_le, 2, 2, 1, 1)
+
 
 ##################
 # Plotting class #
@@ -1493,12 +1497,20 @@ class PlotCanvas(FigureCanvas):
         FigureCanvas.setSizePolicy(self, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self)
 
+        # Line, point and faint tail of the current node, created by initplot and moved by updateplot
+        # They are animated: left out of full redraws and blitted over the saved background of the axes
+        self.artists = None
+        self.background = None
+        self.mpl_connect('draw_event', self.__ondraw)
+
         self.draw()
 
     # Initialize plots of first node
+    # The artists are created here once per file and level, then reused by updateplot
     def initplot(self, plot, title='', x_axis='', y_axis='', z_axis='', invert_x=False, invert_y=False, invert_z=False):
         # Clear all plots
-        self.clearplot()
+        self.axes.clear()
+        self.box.clear()
 
         # Initialize plot title and axes
         self.title = title
@@ -1523,66 +1535,69 @@ class PlotCanvas(FigureCanvas):
         # Get the max and min of all data for bounding box set-up
         max_min = plot[1]
 
-        # Create 3D bounding box to simulate equal aspect ratio
-        ranges = np.array([max_min[0] - max_min[1], max_min[2] - max_min[3], max_min[4] - max_min[5]])
-        max_range = ranges.max()
-        Xb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][0].flatten() + 0.5 * (max_min[0] + max_min[1])
-        Yb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][1].flatten() + 0.5 * (max_min[2] + max_min[3])
-        Zb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][1].flatten() + 0.5 * (max_min[4] + max_min[5])
-        for xb, yb, zb in zip(Xb, Yb, Zb):
-            self.box.plot([xb], [yb], [zb], 'w')
+        # Create 3D bounding box to simulate equal aspect ratio (corners only, not drawn)
+        Xb, Yb, Zb = bounding_box(max_min[0::2], max_min[1::2])
+        self.box.plot(Xb, Yb, Zb, linestyle='None')
         self.axes.grid(True)
 
-        # Draw plots and point
-        self.axes.plot(plot[0][0], plot[0][1], plot[0][2], 'b', linewidth=2)
-        self.axes.scatter(plot[0][0][-1], plot[0][1][-1], plot[0][2][-1], c='r',
-                          marker="o", s=(Xb.max() + Yb.max() + Zb.max()) / 7, alpha=.4)
+        # Draw plots and point, and the faint tail of the previous node (hidden on the first node)
+        segment = plot[0]
+        line, = self.axes.plot(segment[:, 0], segment[:, 1], segment[:, 2], 'b', linewidth=2)
+        point = self.axes.scatter(segment[-1, 0], segment[-1, 1], segment[-1, 2], c='r',
+                                  marker="o", s=(Xb.max() + Yb.max() + Zb.max()) / 7, alpha=.4)
+        tail, = self.axes.plot(segment[:1, 0], segment[:1, 1], segment[:1, 2], 'r', alpha=.2)
+        tail.set_visible(False)
+        for artist in (line, point, tail):
+            artist.set_animated(True)
+        self.artists = (line, point, tail)
 
         self.draw()
 
     # Update plots
+    # The bounding box keeps the axes limits of initplot, so only the data of the artists changes
+    # plot holds (k, 3) views of the node and of its faint tail (see Plot)
     def updateplot(self, plot):
-        # Clear all plots
-        self.clearplot()
-
-        # Set up the axes and title
-        self.axes.set_aspect("equal")
-        self.axes.set_title(self.title)
-        #self.axes.set_title("[Distance: {}CM]".format(dist), loc="right")
-        self.axes.set_xlabel(self.x_axis)
-        self.axes.set_ylabel(self.y_axis)
-        self.axes.set_zlabel(self.z_axis)
-        if self.invert_x: self.axes.invert_xaxis()
-        if self.invert_y: self.axes.invert_yaxis()
-        if self.invert_z: self.axes.invert_zaxis()
-        self.box.set_aspect("equal")
-
-        # Get the max and min of all data for bounding box set-up
-        max_min = plot[2]
-
-        # Create 3D bounding box to simulate equal aspect ratio
-        ranges = np.array([max_min[0] - max_min[1], max_min[2] - max_min[3], max_min[4] - max_min[5]])
-        max_range = ranges.max()
-        Xb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][0].flatten() + 0.5 * (max_min[0] + max_min[1])
-        Yb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][1].flatten() + 0.5 * (max_min[2] + max_min[3])
-        Zb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][1].flatten() + 0.5 * (max_min[4] + max_min[5])
-        for xb, yb, zb in zip(Xb, Yb, Zb):
-            self.box.plot([xb], [yb], [zb], 'w')
-        self.axes.grid(True)
-
-        # Draw plots and point
-        self.axes.plot(plot[0][0], plot[0][1], plot[0][2], 'b', linewidth=2)
-        self.axes.scatter(plot[0][0][-1], plot[0][1][-1], plot[0][2][-1], c='r',
-                          marker="o", s=(Xb.max() + Yb.max() + Zb.max()) / 7, alpha=.4)
-        if plot[1] is not None:
-            self.axes.plot(plot[1][0], plot[1][1], plot[1][2], 'r', alpha=.2)
-
-        self.draw()
+        line, point, tail = self.artists
+        segment, faint = plot[0], plot[1]
+        line.set_data(segment[:, 0], segment[:, 1])
+        line.set_3d_properties(segment[:, 2])
+        point._offsets3d = (segment[-1:, 0], segment[-1:, 1], segment[-1:, 2])
+        if faint is not None:
+            tail.set_data(faint[:, 0], faint[:, 1])
+            tail.set_3d_properties(faint[:, 2])
+        tail.set_visible(faint is not None)
+
+        # Blit over the background of the last full redraw (full redraw if there is none yet)
+        if self.background is None:
+            self.draw_idle()
+            return
+        self.restore_region(self.background)
+        self.__drawartists()
+        self.blit(self.fig.bbox)
+
+    # Pixels across the bounding box on screen at the current zoom, for the level of detail of long nodes (see Plot)
+    def resolution(self):
+        return min(self.width(), self.height()) * 10 / self.axes.dist
+
+    # Save the background after every full redraw (e.g. rotation or resize), then draw the artists over it
+    def __ondraw(self, event):
+        if self.artists is None:
+            self.background = None
+            return
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        self.__drawartists()
+
+    def __drawartists(self):
+        project_scatter(self.artists[1], self.get_renderer())
+        for artist in self.artists:
+            self.axes.draw_artist(artist)
 
     # Clear all plots
     def clearplot(self):
         self.axes.clear()
         self.box.clear()
+        self.artists = None
+        self.background = None
         self.draw()
 
 
@@ -1591,7 +1606,11 @@ class PlotCanvas(FigureCanvas):
 #######################
 class Trajectory(QtWidgets.QDialog):
 
-    def __init__(self, x, y, z, invert_x=False, invert_y=False, invert_z=False):
+    # Playback timer interval (ms), frames in between are skipped
+    FRAME_INTERVAL = 16
+    SPEEDS = ["0.25x", "0.5x", "1x", "2x", "4x"]
+
+    def __init__(self, x, y, z, invert_x=False, invert_y=False, invert_z=False, rate=100.0, pre_post_idx=None):
         super().__init__()
 
         # Create attributes
@@ -1602,10 +1621,19 @@ class Trajectory(QtWidgets.QDialog):
         self.invert_y = invert_y
         self.invert_z = invert_z
 
+        # Playback in real time at the sample rate of the recording (Hz)
+        # pre_post_idx gives the frame of every recorded data point, so interpolated trajectories play at the same speed
+        self.rate = rate
+        self.pre_post_idx = np.asarray(pre_post_idx if pre_post_idx is not None else np.arange(len(x)), dtype=float)
+        self.samples = np.arange(len(self.pre_post_idx), dtype=float)
+        self.speed = 1.0
+        self.frame = 0
+        self.start_sample = 0.0
+
         # Dialog window settings
         self.setWindowTitle("Showing Trajectory...")
         self.move(300, 10)
-        self.setFixedSize(600, 600)
+        self.setFixedSize(600, 640)
         self.setWindowModality(QtCore.Qt.NonModal)
 
         # Create figure elements
@@ -1615,30 +1643,49 @@ class Trajectory(QtWidgets.QDialog):
         FigureCanvas.setSizePolicy(self.canvas, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         FigureCanvas.updateGeometry(self.canvas)
 
+        # Playback controls: play/pause, seek slider and speed
+        self.play_btn = QtWidgets.QPushButton("Pause", self)
+        self.play_btn.setShortcut('Space')
+        self.play_btn.clicked.connect(self.__play_pause)
+
+        self.seek_sl = QtWidgets.QSlider(QtCore.Qt.Horizontal, self)
+        self.seek_sl.setRange(0, max(len(self.x) - 1, 0))
+        self.seek_sl.valueChanged.connect(self.__seek)
+
+        self.speed_cb = QtWidgets.QComboBox(self)
+        self.speed_cb.addItems(self.SPEEDS)
+        self.speed_cb.setCurrentText("1x")
+        self.speed_cb.currentTextChanged.connect(self.__change_speed)
+
+        controls_layout = QtWidgets.QHBoxLayout()
+        controls_layout.addWidget(self.play_btn)
+        controls_layout.addWidget(self.seek_sl)
+        controls_layout.addWidget(self.speed_cb)
+
         # Set layout
         layout = QtWidgets.QVBoxLayout()
         layout.addWidget(self.canvas)
+        layout.addLayout(controls_layout)
         self.setLayout(layout)
 
+        # Playback timer (stopped when the dialog closes) and clock of the playback
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(self.FRAME_INTERVAL)
+        self.timer.timeout.connect(self.__next_frame)
+        self.clock = QtCore.QElapsedTimer()
+
         # Call animate function
         self.animate()
         self.canvas.draw()
+        self.clock.start()
+        self.timer.start()
 
         # Display dialog
         self.exec_()
 
     # Main function for animation plotting
+    # The line, point and title of the frame are animated artists, blitted over the background of the last full redraw
     def animate(self):
-
-        # Frame update function
-        def __update_line(num, data, line):
-            line_start = max((num - 100, 0))
-            dot_start = max((num - 1, 0))
-            scat._offsets3d = (data[0, dot_start:num], data[1, dot_start:num], data[2, dot_start:num])
-            line.set_data(data[:2, line_start:num])
-            line.set_3d_properties(data[2, line_start:num])
-            self.ax.set_title("3D animated trajectory (Frame={})".format(num))
-
         self.ax = self.fig.gca(projection='3d')
         self.ax.set_aspect("equal")
         self.ax.set_xlabel('X (Left/Right)')
@@ -1648,22 +1695,97 @@ class Trajectory(QtWidgets.QDialog):
         if self.invert_y: self.ax.invert_yaxis()
         if self.invert_z: self.ax.invert_zaxis()
 
-        # Create 3D bounding box to simulate equal aspect ratio
-        max_range = np.array([self.x.max() - self.x.min(), self.y.max() - self.y.min(),
-                              self.z.max() - self.z.min()]).max()
-        Xb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][0].flatten() + 0.5 * (self.x.max() + self.x.min())
-        Yb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][1].flatten() + 0.5 * (self.y.max() + self.y.min())
-        Zb = 0.5 * max_range * np.mgrid[-1:2:2, -1:2:2, -1:2:2][2].flatten() + 0.5 * (self.z.max() + self.z.min())
-        for xb, yb, zb in zip(Xb, Yb, Zb):
-            self.ax.plot([xb], [yb], [zb], 'w')
+        # Create 3D bounding box to simulate equal aspect ratio (corners only, not drawn)
+        Xb, Yb, Zb = bounding_box([self.x.max(), self.y.max(), self.z.max()],
+                                  [self.x.min(), self.y.min(), self.z.min()])
+        self.ax.plot(Xb, Yb, Zb, linestyle='None')
         self.ax.grid(True)
 
-        data = np.array(list(zip(self.x, self.y, self.z))).T
-        line, = self.ax.plot(data[0, 0:1], data[1, 0:1], data[2, 0:1])
-        scat = self.ax.scatter(data[0, 0], data[1, 0], data[2, 0], c='#771F1F')
-
-        self.ani = FuncAnimation(self.fig, __update_line, len(self.x), fargs=(data, line), interval=0,
-                                 blit=False, repeat=True)
+        self.data = np.vstack((self.x, self.y, self.z))
+        line, = self.ax.plot(self.data[0, 0:1], self.data[1, 0:1], self.data[2, 0:1])
+        scat = self.ax.scatter(self.data[0, 0], self.data[1, 0], self.data[2, 0], c='#771F1F')
+        title = self.ax.set_title("3D animated trajectory (Frame=0)")
+        for artist in (line, scat, title):
+            artist.set_animated(True)
+        self.artists = (line, scat, title)
+
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.__ondraw)
+        self.__update_line(0)
+
+    # Frame update function: the last 100 data points up to the frame
+    def __update_line(self, num):
+        line, scat, title = self.artists
+        line_start = max((num - 100, 0))
+        dot_start = max((num - 1, 0))
+        scat._offsets3d = (self.data[0, dot_start:num], self.data[1, dot_start:num], self.data[2, dot_start:num])
+        line.set_data(self.data[:2, line_start:num])
+        line.set_3d_properties(self.data[2, line_start:num])
+        title.set_text("3D animated trajectory (Frame={})".format(num))
+        self.frame = num
+
+    # Show the frame of the current playback time, looping at the end of the recording
+    # Frames are chosen from the clock, so frames are skipped when drawing is slower than the recording
+    def __next_frame(self):
+        sample = self.start_sample + self.clock.elapsed() / 1000 * self.rate * self.speed
+        if sample > self.samples[-1]:
+            self.start_sample = sample = 0.0
+            self.clock.restart()
+        frame = min(int(np.interp(sample, self.samples, self.pre_post_idx)), len(self.x) - 1)
+        if frame != self.frame:
+            self.__update_line(frame)
+            self.seek_sl.blockSignals(True)
+            self.seek_sl.setValue(frame)
+            self.seek_sl.blockSignals(False)
+            self.__blit()
+
+    # Draw the artists of the frame over the background
+    def __blit(self):
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.__drawartists()
+        self.canvas.blit(self.fig.bbox)
+
+    # Save the background after every full redraw (e.g. rotation), then draw the artists over it
+    def __ondraw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.__drawartists()
+
+    def __drawartists(self):
+        project_scatter(self.artists[1], self.canvas.get_renderer())
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+    def __play_pause(self):
+        if self.timer.isActive():
+            self.timer.stop()
+            self.play_btn.setText("Play")
+        else:
+            self.__restart_clock()
+            self.timer.start()
+            self.play_btn.setText("Pause")
+
+    # Action for moving the seek slider
+    def __seek(self, frame):
+        self.__update_line(frame)
+        self.__restart_clock()
+        self.__blit()
+
+    def __change_speed(self, text):
+        self.speed = float(text.rstrip('x'))
+        self.__restart_clock()
+
+    # Continue the playback from the current frame
+    def __restart_clock(self):
+        self.start_sample = float(np.interp(self.frame, self.pre_post_idx, self.samples))
+        self.clock.restart()
+
+    # Stop the playback when the dialog closes
+    def done(self, result):
+        self.timer.stop()
+        super().done(result)
 
 
 ########
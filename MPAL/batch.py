@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analysis import *
+
+'''
+--------------------------------------------------------------
+Headless batch processing
+
+Runs the analysis on many recordings in a pool of worker processes (one per core by default), without the GUI. The
+results of every file are saved in the same .pkl/.mat/.csv formats as "Save Results..." in the application, and the
+run time or failure of every file is written to a summary .csv file.
+
+Usage:  On terminal, in the MPAL folder, enter (e.g.)
+        python3 batch.py "../data/*.csv" --header 1 --smooth --invert-z --format csv mat --out-dir ../results
+
+        The file options mirror the "Open File" dialog (index starts at 1), and the thresholds are read from
+        config/settings.config unless given on the command line. Enter python3 batch.py --help for all options.
+--------------------------------------------------------------
+'''
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+SUMMARY_FIELDS = ["file", "status", "seconds", "data_points", "level3_segments", "outputs", "error"]
+# Names of the result files (see run_file and MultiAnalysis.save), and of the other outputs of MPAL (sweep.py and
+# export.py), so that recordings with "_MPAL" elsewhere in their name are still analysed
+RESULT_PATTERN = re.compile(r".+_MPAL(_marker\d+)?\.(pkl|mat|csv)|.+_MPAL_sweep\.csv|.+_MPAL\.(mp4|gif)")
+
+
+################################
+# Settings parameters (no GUI) #
+################################
+class Settings:
+
+    def __init__(self, path=os.path.join(script_dir, "config/settings.config")):
+        # Default parameters, overwritten by the settings.config file if found
+        self.x_threshold = 60.0
+        self.y_threshold = 60.0
+        self.z_threshold = 60.0
+        self.main_direction_threshold = 5
+        self.smoothing = dict(SMOOTHING)
+        self.sample_rate = 100.0
+        self.dpi = 60
+        try:
+            with open(path, 'r') as f:
+                for line in f.readlines():
+                    try:
+                        exec(line)
+                    except Exception:
+                        pass
+        except FileNotFoundError:
+            pass
+
+
+##################
+# Batch function #
+##################
+# Analyse one file and save its results, returning a row of the summary
+# Runs in a worker process, so only the summary row is sent back
+def run_file(file, options, formats, out_dir=None):
+    row = dict.fromkeys(SUMMARY_FIELDS, '')
+    row["file"] = file
+    start = time.perf_counter()
+    try:
+        analysis = Analysis(file, **options)
+
+        # Save results next to the input file (or in out_dir) with the default name of "Save Results..."
+        name = os.path.join(out_dir if out_dir is not None else os.path.dirname(file),
+                            os.path.splitext(os.path.basename(file))[0] + "_MPAL")
+        for file_format in formats:
+            analysis.save(name, file_format)
+
+        row["status"] = "ok"
+        row["data_points"] = len(analysis.original_corr)
+        row["level3_segments"] = len(analysis.lvl3hash) - 1
+        row["outputs"] = ";".join(name + '.' + file_format for file_format in formats)
+    except Exception as e:
+        row["status"] = "failed"
+        row["error"] = "{}: {}".format(type(e).__name__, e)
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+# Expand file names and glob patterns, keeping their order and dropping duplicates
+# Result files of MPAL (see RESULT_PATTERN), summary files and the files in exclude matched by a pattern are skipped
+# (and printed if verbose), so that running the same pattern again does not analyse the outputs of the previous run
+def expand_files(patterns, exclude=(), verbose=True):
+    exclude = {os.path.abspath(file) for file in exclude}
+    files = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = []
+            for file in sorted(glob.glob(pattern)):
+                reason = _skip_reason(file, exclude)
+                if reason is None:
+                    matches.append(file)
+                elif verbose:
+                    print("Skipped {} ({})".format(file, reason))
+        else:
+            matches = [pattern]
+        for file in matches:
+            if file not in files:
+                files.append(file)
+    return files
+
+
+# Why a file matched by a pattern is not analysed, or None
+def _skip_reason(file, exclude):
+    if RESULT_PATTERN.fullmatch(os.path.basename(file)):
+        return "result file of MPAL"
+    if os.path.abspath(file) in exclude:
+        return "excluded"
+    if _is_summary(file):
+        return "summary file"
+    return None
+
+
+# Whether a file is a summary file of a batch run (saved under another name than the current one)
+def _is_summary(file):
+    try:
+        with open(file, newline='') as handle:
+            return next(csv.reader(handle), None) == SUMMARY_FIELDS
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+# Summary file of a batch run: MPAL_batch_summary.csv in the output folder, or in the working folder
+def default_summary(out_dir=None):
+    return os.path.join(out_dir if out_dir is not None else os.getcwd(), "MPAL_batch_summary.csv")
+
+
+# Run the analysis of all files in a process pool and write the summary file
+def run_batch(files, options, formats, out_dir=None, workers=None, summary=None, verbose=True):
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+    if summary is None:
+        summary = default_summary(out_dir)
+
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_file, file, options, formats, out_dir): file for file in files}
+        for i, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            rows[futures[future]] = row
+            if verbose:
+                print("[{}/{}] {} {} ({}s) {}".format(i, len(files), row["status"], row["file"], row["seconds"],
+                                                      row["error"]))
+
+    # Summary in the order of the input files
+    rows = [rows[file] for file in files]
+    with open(summary, 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+########################
+# Command line options #
+########################
+# File, preprocessing and invert axis options of the command line tools, as in the "Open File" dialog
+def add_input_arguments(parser, preprocessing=True):
+    file_options = parser.add_argument_group("file options (index starts at 1)")
+    file_options.add_argument("--header", type=int, default=None, help="header row (default: no header)")
+    file_options.add_argument("--col-x", type=int, default=1, help="column of the X-axis (L/R) (default: 1)")
+    file_options.add_argument("--col-y", type=int, default=2, help="column of the Y-axis (F/B) (default: 2)")
+    file_options.add_argument("--col-z", type=int, default=3, help="column of the Z-axis (U/D) (default: 3)")
+
+    if preprocessing:
+        preprocessing_options = parser.add_argument_group("preprocessing options")
+        preprocessing_options.add_argument("--smooth", action="store_true",
+                                           help="smooth the trajectory (filter from the settings file)")
+        preprocessing_options.add_argument("--interpolate", type=float, default=None, metavar="CM",
+                                           help="interpolate the trajectory every CM cm (e.g. 0.5)")
+
+    invert_options = parser.add_argument_group("invert axis options")
+    invert_options.add_argument("--invert-x", action="store_true", help="invert X-axis")
+    invert_options.add_argument("--invert-y", action="store_true", help="invert Y-axis")
+    invert_options.add_argument("--invert-z", action="store_true", help="invert Z-axis")
+
+
+# Keyword arguments of Analysis from the options of add_input_arguments and the thresholds and filter of the settings
+def analysis_arguments(args, settings):
+    return dict(col_x=args.col_x, col_y=args.col_y, col_z=args.col_z,
+                x_threshold=settings.x_threshold, y_threshold=settings.y_threshold,
+                z_threshold=settings.z_threshold, main_direction_threshold=settings.main_direction_threshold,
+                invert_x=args.invert_x, invert_y=args.invert_y, invert_z=args.invert_z,
+                header=args.header, smooth=args.smooth, interpolate=args.interpolate is not None,
+                interdist=args.interpolate if args.interpolate is not None else 0.5, smoothing=settings.smoothing)
+
+
+# Analysis of args.file with the options of add_input_arguments
+def analysis_from_args(args, settings):
+    return Analysis(args.file, **analysis_arguments(args, settings))
+
+
+########
+# Main #
+########
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the MPAL analysis on many files without the GUI.")
+    parser.add_argument("files", nargs='+', help="input files or glob patterns (e.g. \"data/*.csv\")")
+
+    add_input_arguments(parser)
+
+    analysis_options = parser.add_argument_group("analysis settings (default: from the settings file)")
+    analysis_options.add_argument("--settings", default=os.path.join(script_dir, "config/settings.config"),
+                                  help="settings file (default: config/settings.config)")
+    analysis_options.add_argument("--x-threshold", type=float, help="X-axis (L/R) threshold (degrees)")
+    analysis_options.add_argument("--y-threshold", type=float, help="Y-axis (F/B) threshold (degrees)")
+    analysis_options.add_argument("--z-threshold", type=float, help="Z-axis (U/D) threshold (degrees)")
+    analysis_options.add_argument("--main-direction-threshold", type=int,
+                                  help="main direction threshold (data points)")
+
+    output_options = parser.add_argument_group("output options")
+    output_options.add_argument("--format", nargs='+', choices=["pkl", "mat", "csv"], default=["csv"],
+                                help="result file formats (default: csv)")
+    output_options.add_argument("--out-dir", default=None, help="output folder (default: next to each input file)")
+    output_options.add_argument("--summary", default=None,
+                                help="summary file (default: MPAL_batch_summary.csv in the output folder)")
+    output_options.add_argument("--workers", type=int, default=os.cpu_count(),
+                                help="number of worker processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    # Thresholds from the settings file, overridden by the command line
+    settings = Settings(args.settings)
+    for key in ["x_threshold", "y_threshold", "z_threshold", "main_direction_threshold"]:
+        if getattr(args, key) is not None:
+            setattr(settings, key, getattr(args, key))
+
+    options = analysis_arguments(args, settings)
+
+    summary = args.summary if args.summary is not None else default_summary(args.out_dir)
+    files = expand_files(args.files, exclude=[summary])
+    if len(files) == 0:
+        parser.error("no input files found")
+
+    rows = run_batch(files, options, args.format, out_dir=args.out_dir, workers=args.workers, summary=summary)
+    failed = sum(row["status"] != "ok" for row in rows)
+    print("{} files analysed, {} failed".format(len(rows) - failed, failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+'''
+--------------------------------------------------------------
+Preprocessing cache
+
+Keeps the parsed coordinates, the preprocessed trajectory X and pre_post_idx of smoothed or interpolated .csv files
+as .npy files in the user cache folder, so that reopening a recording with the same options skips parsing and
+preprocessing (binary trajectories are memory-mapped instead, see Analysis). Entries are
+keyed by a hash of the file content and the options, and the least recently used entries are removed when the cache
+grows over its size limit.
+
+Navigation cache
+
+Keeps the plot data and labels of the nodes around the node displayed in the main window. The nodes next to it are
+computed on a worker thread while the current one is displayed, so that stepping through the nodes only looks them up.
+Entries are evicted by their distance from the displayed node.
+--------------------------------------------------------------
+'''
+
+# Increased whenever the preprocessing results change (2: arc-length resampler), so that older entries are not loaded
+CACHE_VERSION = 2
+CACHE_ARRAYS = ("original_corr", "X", "pre_post_idx")
+
+
+# Default cache folder of the user (e.g. ~/.cache/MPAL)
+def default_cache_dir():
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "MPAL")
+
+
+class PreprocessingCache:
+
+    def __init__(self, directory=None, max_bytes=1024 ** 3):
+        self.directory = directory if directory is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+
+    # Key of a file and its reading/preprocessing options
+    def key(self, file, **options):
+        h = hashlib.blake2b(digest_size=16)
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        options = sorted((name, sorted(value.items()) if isinstance(value, dict) else value)
+                         for name, value in options.items())
+        h.update(repr((CACHE_VERSION, options)).encode())
+        return h.hexdigest()
+
+    # Cached arrays (original_corr, X, pre_post_idx) of a key, or None if not cached
+    def load(self, key):
+        entry = os.path.join(self.directory, key)
+        if not os.path.isdir(entry):
+            return None
+        try:
+            arrays = tuple(np.load(os.path.join(entry, name + ".npy"), allow_pickle=False) for name in CACHE_ARRAYS)
+        except (OSError, ValueError):
+            # Incomplete or corrupted entry
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return arrays
+
+    # Store the arrays of a key, then evict the least recently used entries over the size limit
+    # Failing to write the cache (e.g. read-only or full disk) does not stop the analysis
+    def store(self, key, original_corr, X, pre_post_idx):
+        entry = os.path.join(self.directory, key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write in a temporary folder first, so that a partially written entry is never loaded
+            temp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+            for name, array in zip(CACHE_ARRAYS, (original_corr, X, pre_post_idx)):
+                np.save(os.path.join(temp, name + ".npy"), np.asarray(array), allow_pickle=False)
+            try:
+                os.rename(temp, entry)
+            except OSError:
+                # Already stored (e.g. by another process)
+                shutil.rmtree(temp, ignore_errors=True)
+            self.evict()
+        except OSError:
+            pass
+
+    # Remove the least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    # Remove all entries
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+# Entries of the nodes around the displayed node, prefetched on a worker thread
+# source(level, node, resolution) computes the entry of a node (e.g. its plot data and label); get() does not wait for
+# the node being prefetched, so the source may be called by get() and by the worker thread at the same time
+class NavigationCache:
+
+    def __init__(self, source, size=64, ahead=8):
+        self.source = source
+        self.size = size
+        self.ahead = ahead
+        self._entries = {}
+        # Displayed node as (level, node, resolution, last node of the level), and direction of the last step
+        self._cursor = None
+        self._direction = 1
+        # Entries computed before a reset are not stored, and nodes whose source raised are not prefetched again
+        # until the next reset
+        self._generation = 0
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._moved = threading.Condition(self._lock)
+        self._computing = threading.Lock()
+        self._thread = None
+
+    # Entry of a node (computed now if it was not prefetched), then prefetch of the nodes around it up to last
+    def get(self, level, node, resolution=None, last=None):
+        key = (level, node, resolution)
+        with self._lock:
+            if self._cursor is not None and self._cursor[0] == level and self._cursor[2] == resolution \
+                    and self._cursor[1] != node:
+                self._direction = 1 if node > self._cursor[1] else -1
+            self._cursor = (level, node, resolution, last)
+            entry = self._entries.get(key)
+            generation = self._generation
+            self._moved.notify()
+
+        # Computed now, even if the worker thread is computing another node (errors are raised here)
+        if entry is None:
+            entry = self.source(*key)
+            self._store(key, entry, generation)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._prefetch, name="NavigationCache", daemon=True)
+            self._thread.start()
+        return entry
+
+    # Remove all entries, and stop prefetching until the next get
+    # Waits for the entry being prefetched, so that the source data can be changed safely afterwards (resets and gets
+    # are called by the same thread)
+    def reset(self):
+        with self._computing, self._lock:
+            self._entries.clear()
+            self._failed.clear()
+            self._cursor = None
+            self._generation += 1
+
+    def _store(self, key, entry, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = entry
+            if len(self._entries) > self.size and self._cursor is not None:
+                # Entries of other levels or resolutions first, then the farthest from the displayed node
+                level, node, resolution, _ = self._cursor
+                order = sorted(self._entries, key=lambda k: ((k[0], k[2]) != (level, resolution), abs(k[1] - node)))
+                for k in order[self.size:]:
+                    del self._entries[k]
+
+    # Next node to prefetch: the closest to the displayed node that is not cached, in the direction of the last step
+    # first (called with the lock held)
+    def _next(self):
+        if self._cursor is None:
+            return None
+        level, node, resolution, last = self._cursor
+        for distance in range(1, min(self.ahead, (self.size - 1) // 2) + 1):
+            for step in (self._direction * distance, -self._direction * distance):
+                key = (level, node + step, resolution)
+                if 0 <= key[1] and (last is None or key[1] <= last) and key not in self._entries \
+                        and key not in self._failed:
+                    return key
+        return None
+
+    # Worker thread
+    def _prefetch(self):
+        while True:
+            with self._lock:
+                key = self._next()
+                while key is None:
+                    self._moved.wait()
+                    key = self._next()
+                generation = self._generation
+
+            with self._computing:
+                # Skip nodes that were reset or computed by get() while waiting
+                if generation != self._generation or key in self._entries:
+                    continue
+                try:
+                    entry = self.source(*key)
+                except Exception:
+                    # Left to get(), which raises the error if the node is displayed
+                    with self._lock:
+                        if generation == self._generation:
+                            self._failed.add(key)
+                    continue
+            self._store(key, entry, generation)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D, art3d
+
+from analysis import *
+from batch import Settings, add_input_arguments, analysis_from_args, script_dir
+
+try:
+    from PIL import Image
+except ImportError:
+    # GIF export is not available
+    Image = None
+
+'''
+--------------------------------------------------------------
+Headless video export
+
+Renders the animated trajectory (as in "Show Trajectory", in real time at the sample rate of the recording), or a
+walk-through of the level 1/2/3 nodes (one node per frame, as in the main window), to an .mp4 or .gif file or a
+folder of .png frames, with the Agg backend (no display needed).
+
+The frames are split into ranges rendered by worker processes (one per core by default). Every worker draws the axes
+once and blits the moving artists over them. For .mp4 files, every worker pipes its raw frames into its own ffmpeg
+process, and the encoded parts are joined without re-encoding. For .gif files and .png frames, the workers write .png
+files (with a fast compression level if Pillow is installed), which are joined into the .gif file with Pillow.
+
+Usage:  On terminal, in the MPAL folder, enter (e.g.)
+        python3 export.py ../data/trial.csv --header 1 --smooth --out ../results/trial.mp4 --fps 30
+        python3 export.py ../data/trial.csv --header 1 --level 3 --out ../results/trial_level3.gif --fps 2
+        python3 export.py ../data/trial.csv --header 1 --out ../results/trial_frames/
+
+        Enter python3 export.py --help for all options.
+--------------------------------------------------------------
+'''
+
+LEVEL_TITLES = {1: '3D trajectory (Level 1)', 2: '3D trajectory (Level 2)', 3: '3D trajectory (Level 3)'}
+
+
+###################
+# Export function #
+###################
+# Export the trajectory of an analysis to out (.mp4, .gif, or a folder for .png frames)
+# level: None for the animated trajectory at `speed` times the sample rate `rate` (Hz), or 1/2/3 for a node walk-through
+def export_video(analysis, out, level=None, fps=30.0, rate=100.0, speed=1.0, size=(600, 600), dpi=60, workers=None,
+                 verbose=True):
+    file_format = os.path.splitext(out)[1].lower().lstrip('.')
+    if file_format not in ('mp4', 'gif', ''):
+        raise ValueError("Unknown export format: {} (use .mp4, .gif, or a folder)".format(out))
+    if file_format == 'mp4' and shutil.which('ffmpeg') is None:
+        raise RuntimeError("Exporting .mp4 files requires ffmpeg")
+    if file_format == 'gif' and Image is None:
+        raise RuntimeError("Exporting .gif files requires Pillow")
+
+    frames = _frames(analysis, level, fps, rate, speed)
+    if len(frames) == 0:
+        raise ValueError("No frames to export")
+
+    # Frame folder: the output folder for .png frames, otherwise a temporary folder next to the output
+    if file_format == '':
+        folder = out
+        os.makedirs(folder, exist_ok=True)
+    else:
+        folder = tempfile.mkdtemp(prefix=".MPAL-frames-", dir=os.path.dirname(os.path.abspath(out)))
+
+    try:
+        # A few ranges per worker, so that workers finishing early take over the remaining frames
+        if workers is None:
+            workers = os.cpu_count() or 1
+        chunks = min(len(frames), 4 * workers)
+        bounds = np.linspace(0, len(frames), chunks + 1).astype(int)
+        scene = _scene(analysis, level)
+        tasks = [(scene, frames[start:stop], start, folder, size, dpi, fps, file_format)
+                 for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        if workers == 1:
+            for task in tasks:
+                _render_range(task)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for i, _ in enumerate(executor.map(_render_range, tasks), 1):
+                    if verbose:
+                        print("[{}/{}] frame ranges rendered".format(i, len(tasks)))
+
+        if file_format == 'mp4':
+            _join_mp4(folder, out)
+        elif file_format == 'gif':
+            _join_gif(folder, out, fps)
+    finally:
+        if file_format != '':
+            shutil.rmtree(folder, ignore_errors=True)
+    return len(frames)
+
+
+# Frame of every exported image: trajectory frames at the playback time of every image, or node numbers
+def _frames(analysis, level, fps, rate, speed):
+    if level is not None:
+        return np.arange(len(analysis.plot.starts[level]))
+
+    # pre_post_idx gives the frame of every recorded data point, so interpolated trajectories play at the same speed
+    pre_post_idx = np.asarray(analysis.pre_post_idx, dtype=float)
+    samples = np.arange(len(pre_post_idx), dtype=float)
+    times = np.arange(0, samples[-1] / (rate * speed) + 0.5 / fps, 1 / fps) if len(samples) else np.zeros(0)
+    frames = np.interp(times * rate * speed, samples, pre_post_idx).astype(int)
+    return np.minimum(frames, len(analysis.X) - 1)
+
+
+# Data needed by the workers to draw the frames (the Plot object is rebuilt in every worker)
+def _scene(analysis, level):
+    scene = dict(X=np.ascontiguousarray(analysis.X), level=level, invert=(analysis.invert_x, analysis.invert_y,
+                                                                            analysis.invert_z))
+    if level is not None:
+        scene.update(lvl2hashframe=analysis.lvl2hashframe, lvl3hashframe=analysis.lvl3hashframe,
+                     labels=_node_labels(analysis, level))
+    return scene
+
+
+# Label of every node of a level (e.g. 'L-U' for levels 1 and 2)
+def _node_labels(analysis, level):
+    if level == 3:
+        return analysis.lvl3hash[:-1]
+    rows = analysis.lvl1hash if level == 1 else analysis.lvl2hash
+    return [''.join(labels) for labels in zip(*(row[:-1] for row in rows))]
+
+
+# Render a range of frames, named after the index of their first frame in the export
+# Runs in a worker process, the axes are drawn once and the moving artists are blitted over them
+def _render_range(task):
+    scene, frames, first, folder, size, dpi, fps, file_format = task
+    fig = plt.figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    canvas = fig.canvas
+    ax = fig.add_subplot(111, projection='3d')
+    X = scene["X"]
+    if scene["level"] is None:
+        artists, update = _trajectory_artists(ax, X, scene["invert"])
+    else:
+        artists, update = _walkthrough_artists(ax, scene)
+    for artist in artists:
+        artist.set_animated(True)
+
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    renderer = canvas.get_renderer()
+    height, width = np.asarray(canvas.buffer_rgba()).shape[:2]
+    encoder = _encoder(folder, first, width, height, fps) if file_format == 'mp4' else None
+    broken = False
+    try:
+        for i, frame in enumerate(frames.tolist()):
+            update(frame)
+            canvas.restore_region(background)
+            for artist in artists:
+                if isinstance(artist, art3d.Path3DCollection):
+                    project_scatter(artist, renderer)
+                ax.draw_artist(artist)
+            if encoder is not None:
+                try:
+                    encoder.stdin.write(canvas.buffer_rgba())
+                except BrokenPipeError:
+                    # ffmpeg exited early, reported with its exit status below
+                    broken = True
+                    break
+            else:
+                _write_png(os.path.join(folder, "frame_{:06d}.png".format(first + i)),
+                           np.asarray(canvas.buffer_rgba()))
+    finally:
+        if encoder is not None:
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                broken = True
+            broken = encoder.wait() != 0 or broken
+        plt.close(fig)
+
+    # Only reached if rendering succeeded, so that an error of the rendering is not hidden by the failed encoder
+    if broken:
+        raise RuntimeError("ffmpeg failed to encode frames {} to {}".format(first, first + len(frames) - 1))
+    return len(frames)
+
+
+# ffmpeg process encoding raw RGBA frames from its input into an .mp4 part (H.264, with an even frame size)
+def _encoder(folder, first, width, height, fps):
+    return subprocess.Popen(["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+                             "-s", "{}x{}".format(width, height), "-framerate", str(fps), "-i", "-",
+                             "-c:v", "libx264", "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                             os.path.join(folder, "part_{:06d}.mp4".format(first))], stdin=subprocess.PIPE)
+
+
+# Write an RGBA image as a .png file
+# Encoding takes most of the time per frame with the default compression, so Pillow's fastest level is used if installed
+def _write_png(file, image):
+    if Image is not None:
+        Image.fromarray(image).save(file, compress_level=1)
+    else:
+        plt.imsave(file, image)
+
+
+# Axes of the trajectory plots: labels, inversion, and a bounding box around all data for an equal aspect ratio
+def _setup_axes(ax, X, invert):
+    ax.set_xlabel('X (Left/Right)')
+    ax.set_ylabel('Y (Forward/Backward)')
+    ax.set_zlabel('Z (Up/Down)')
+    if invert[0]: ax.invert_xaxis()
+    if invert[1]: ax.invert_yaxis()
+    if invert[2]: ax.invert_zaxis()
+
+    box = bounding_box(np.nanmax(X, axis=0), np.nanmin(X, axis=0))
+    ax.plot(box[0], box[1], box[2], linestyle='None')
+    ax.grid(True)
+    return box
+
+
+# Animated trajectory (see Trajectory in app.py): the last 100 data points up to the frame, and the current point
+def _trajectory_artists(ax, X, invert):
+    _setup_axes(ax, X, invert)
+    line, = ax.plot(X[0:1, 0], X[0:1, 1], X[0:1, 2])
+    scat = ax.scatter(X[0, 0], X[0, 1], X[0, 2], c='#771F1F')
+    title = ax.set_title("3D animated trajectory (Frame=0)")
+
+    def update(num):
+        line_start = max(num - 100, 0)
+        dot_start = max(num - 1, 0)
+        scat._offsets3d = (X[dot_start:num, 0], X[dot_start:num, 1], X[dot_start:num, 2])
+        line.set_data(X[line_start:num, 0], X[line_start:num, 1])
+        line.set_3d_properties(X[line_start:num, 2])
+        title.set_text("3D animated trajectory (Frame={})".format(num))
+
+    return (line, scat, title), update
+
+
+# Node walk-through (see PlotCanvas in app.py): the node, its end point and the faint tail of the previous node
+def _walkthrough_artists(ax, scene):
+    X, level = scene["X"], scene["level"]
+    box = _setup_axes(ax, X, scene["invert"])
+    plot = Plot(X, scene["lvl2hashframe"], scene["lvl3hashframe"])
+    labels = scene["labels"]
+
+    # Long nodes are simplified to the resolution of the image (see Plot.segment)
+    resolution = min(ax.figure.bbox.width, ax.figure.bbox.height)
+    line, = ax.plot(X[0:2, 0], X[0:2, 1], X[0:2, 2], 'b', linewidth=2)
+    point = ax.scatter(X[0, 0], X[0, 1], X[0, 2], c='r', marker="o", s=box.max(axis=1).sum() / 7, alpha=.4)
+    tail, = ax.plot(X[0:1, 0], X[0:1, 1], X[0:1, 2], 'r', alpha=.2)
+    title = ax.set_title(LEVEL_TITLES[level])
+
+    def update(node):
+        segment = plot.segment(level, node, resolution)
+        line.set_data(segment[:, 0], segment[:, 1])
+        line.set_3d_properties(segment[:, 2])
+        point._offsets3d = (segment[-1:, 0], segment[-1:, 1], segment[-1:, 2])
+        faint = plot.tail(level, node)
+        if faint is not None:
+            tail.set_data(faint[:, 0], faint[:, 1])
+            tail.set_3d_properties(faint[:, 2])
+        tail.set_visible(faint is not None)
+        title.set_text("{} node {}: {}".format(LEVEL_TITLES[level], node, labels[node]))
+
+    return (line, point, tail, title), update
+
+
+# Join the .mp4 parts of a folder into an .mp4 file, without re-encoding
+def _join_mp4(folder, out):
+    parts = os.path.join(folder, "parts.txt")
+    with open(parts, 'w') as f:
+        for file in sorted(glob.glob(os.path.join(folder, "part_*.mp4"))):
+            f.write("file '{}'\n".format(os.path.basename(file)))
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", parts, "-c", "copy", out],
+                   check=True)
+
+
+# Join the .png frames of a folder into a looping .gif file
+def _join_gif(folder, out, fps):
+    files = sorted(glob.glob(os.path.join(folder, "frame_*.png")))
+    images = (Image.open(file).convert('RGB') for file in files)
+    first = next(images)
+    first.save(out, save_all=True, append_images=images, duration=int(round(1000 / fps)), loop=0)
+
+
+########
+# Main #
+########
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the trajectory of a file as a video without the GUI.")
+    parser.add_argument("file", help="input file")
+
+    add_input_arguments(parser)
+
+    export_options = parser.add_argument_group("export options")
+    export_options.add_argument("--settings", default=os.path.join(script_dir, "config/settings.config"),
+                                help="settings file (default: config/settings.config)")
+    export_options.add_argument("--out", default=None,
+                                help="output .mp4 or .gif file, or folder for .png frames "
+                                     "(default: <file>_MPAL.mp4 next to the input file)")
+    export_options.add_argument("--level", type=int, choices=[1, 2, 3], default=None,
+                                help="export a walk-through of the nodes of a level instead of the animated trajectory")
+    export_options.add_argument("--fps", type=float, default=30.0, help="frames per second (default: 30)")
+    export_options.add_argument("--rate", type=float, default=None,
+                                help="sample rate of the recording in Hz (default: sample_rate of the settings file)")
+    export_options.add_argument("--speed", type=float, default=1.0, help="playback speed (default: 1)")
+    export_options.add_argument("--size", type=int, nargs=2, default=[600, 600], metavar=("WIDTH", "HEIGHT"),
+                                help="frame size in pixels (default: 600 600)")
+    export_options.add_argument("--dpi", type=int, default=60, help="resolution of the text (default: 60)")
+    export_options.add_argument("--workers", type=int, default=os.cpu_count(),
+                                help="number of worker processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    settings = Settings(args.settings)
+    analysis = analysis_from_args(args, settings)
+
+    out = args.out
+    if out is None:
+        out = os.path.splitext(args.file)[0] + "_MPAL.mp4"
+    rate = args.rate if args.rate is not None else settings.sample_rate
+    count = export_video(analysis, out, level=args.level, fps=args.fps, rate=rate, speed=args.speed,
+                         size=tuple(args.size), dpi=args.dpi, workers=args.workers)
+    print("{} frames exported to {}".format(count, out))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis import *
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8, trajectories are labelled in the main process
+    shared_memory = None
+
+'''
+--------------------------------------------------------------
+Parallel labelling with shared memory
+
+Labels many preprocessed trajectories (e.g. the markers of a file, or the trajectories of several files) in a pool of
+worker processes. The (n, 3) trajectories are copied once into a shared memory block that the workers read without
+copying, and the workers write the parameters of every node into a second shared block. Only the hash strings and
+hash frames are sent back through the pool, instead of pickling the coordinate and parameter arrays both ways.
+
+Usage:  analyses = analyse_parallel([(original_corr, X, pre_post_idx), ...], thresholds, workers=4)
+        markers = ParallelMultiAnalysis(file, columns, thresholds, workers=4)    (see MultiAnalysis)
+
+        Scaling benchmark on random trajectories, on terminal in the MPAL folder, enter (e.g.)
+        python3 parallel.py --trajectories 16 --points 200000 --workers 1 2 4 8
+--------------------------------------------------------------
+'''
+
+
+######################
+# Parallel labelling #
+######################
+# Analysis of every preprocessed trajectory (original_corr, X, pre_post_idx), in the order given
+# workers: number of worker processes (default: number of cores), 1 labels in the main process
+def analyse_parallel(trajectories, x_threshold, y_threshold, z_threshold, main_direction_threshold,
+                     invert_x=False, invert_y=False, invert_z=False, workers=None):
+    settings = (x_threshold, y_threshold, z_threshold, main_direction_threshold, invert_x, invert_y, invert_z)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(trajectories))
+    if workers <= 1 or shared_memory is None:
+        return [Analysis.from_preprocessed(*trajectory, *settings) for trajectory in trajectories]
+
+    # Rows of every trajectory in the shared blocks
+    lengths = [len(X) for _, X, _ in trajectories]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).tolist()
+    itemsize = np.dtype(np.float64).itemsize
+
+    # Shared memory cannot be empty
+    points = shared_memory.SharedMemory(create=True, size=max(offsets[-1] * 3 * itemsize, 1))
+    try:
+        parameters = shared_memory.SharedMemory(create=True,
+                                                size=max(offsets[-1] * len(PARAMETER_NAMES) * itemsize, 1))
+        try:
+            for (_, X, _), start, n in zip(trajectories, offsets, lengths):
+                _shared_array(points, 3, start, n)[:] = X
+
+            # Largest trajectories first, so that a long one does not start last
+            order = sorted(range(len(trajectories)), key=lambda i: -lengths[i])
+            tasks = [(points.name, parameters.name, offsets[i], lengths[i], settings) for i in order]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                labels = dict(zip(order, executor.map(_label_shared, tasks)))
+
+            analyses = []
+            for i, trajectory in enumerate(trajectories):
+                # Copy the parameters out of the shared block, which is released below
+                block = np.array(_shared_array(parameters, len(PARAMETER_NAMES), offsets[i], lengths[i]))
+                analyses.append(_from_labels(trajectory, block, labels[i], settings))
+        finally:
+            parameters.close()
+            parameters.unlink()
+    finally:
+        points.close()
+        points.unlink()
+    return analyses
+
+
+# (n, columns) float64 view of the rows [start, start + n) of a shared memory block
+def _shared_array(block, columns, start, n):
+    return np.ndarray((n, columns), dtype=np.float64, buffer=block.buf,
+                      offset=start * columns * np.dtype(np.float64).itemsize)
+
+
+# Label one trajectory of the shared block in a worker process
+# The parameters are written into the shared parameter block, and the hashes and hash frames are returned
+def _label_shared(task):
+    points_name, parameters_name, start, n, settings = task
+    points = shared_memory.SharedMemory(name=points_name)
+    parameters = shared_memory.SharedMemory(name=parameters_name)
+    try:
+        analysis = Analysis.__new__(Analysis)
+        analysis._settings(*settings)
+        analysis._set_trajectory(_shared_array(points, 3, start, n), None)
+        analysis._parameters(out=_shared_array(parameters, len(PARAMETER_NAMES), start, n))
+        analysis._lvl1hash()
+        analysis._lvl2hash()
+        analysis._lvl3hash()
+        labels = (analysis.lvl1hash, analysis.lvl2hash, analysis.lvl2hashframe, analysis.lvl3hash,
+                  analysis.lvl3hashframe)
+        # Release the views before closing the blocks
+        del analysis
+    finally:
+        points.close()
+        parameters.close()
+    return labels
+
+
+# Analysis of a trajectory from the parameters and hashes computed by a worker
+def _from_labels(trajectory, parameters, labels, settings):
+    original_corr, X, pre_post_idx = trajectory
+    analysis = Analysis.__new__(Analysis)
+    analysis._settings(*settings)
+    analysis.original_corr = original_corr
+    analysis._set_trajectory(X, pre_post_idx)
+    analysis.parameters = parameters
+    analysis.lvl1hash, analysis.lvl2hash, analysis.lvl2hashframe, analysis.lvl3hash, analysis.lvl3hashframe = labels
+    analysis._get_prepost_idx()
+    analysis._plot = None
+    return analysis
+
+
+# Analysis of several markers of the same file (see MultiAnalysis), labelled in worker processes
+class ParallelMultiAnalysis(MultiAnalysis):
+
+    def __init__(self, *args, workers=None, **kwargs):
+        self.workers = workers
+        super().__init__(*args, **kwargs)
+
+    def _analyse(self, trajectories, *settings):
+        return analyse_parallel(trajectories, *settings, workers=self.workers)
+
+
+#############
+# Benchmark #
+#############
+# Time the labelling of random walk trajectories with every number of workers
+# Returns rows of (workers, seconds, speedup over one worker)
+def benchmark(trajectories=16, points=200000, workers=None, repeat=3, seed=0, verbose=True):
+    if workers is None:
+        workers = list(range(1, (os.cpu_count() or 1) + 1))
+    rng = np.random.default_rng(seed)
+    data = []
+    for _ in range(trajectories):
+        X = np.cumsum(rng.normal(size=(points, 3)), axis=0)
+        data.append((X, X, np.arange(points)))
+
+    rows = []
+    reference = None
+    for count in workers:
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            analyses = analyse_parallel(data, 60.0, 60.0, 60.0, 5, workers=count)
+            seconds.append(time.perf_counter() - start)
+        if reference is None:
+            reference = min(seconds)
+        rows.append((count, min(seconds), reference / min(seconds)))
+        if verbose:
+            print("{:>3} workers {:8.3f}s  speedup {:5.2f}".format(*rows[-1]))
+        del analyses
+    return rows
+
+
+########
+# Main #
+########
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the parallel labelling on random trajectories.")
+    parser.add_argument("--trajectories", type=int, default=16, help="number of trajectories (default: 16)")
+    parser.add_argument("--points", type=int, default=200000, help="data points per trajectory (default: 200000)")
+    parser.add_argument("--workers", type=int, nargs='+', default=None,
+                        help="numbers of worker processes to time (default: 1 to the number of cores)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per number of workers, best kept (default: 3)")
+    args = parser.parse_args(argv)
+
+    if shared_memory is None:
+        print("multiprocessing.shared_memory requires Python 3.8, labelling runs in the main process")
+    print("{} trajectories of {} data points, {} cores".format(args.trajectories, args.points, os.cpu_count()))
+    benchmark(args.trajectories, args.points, args.workers, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
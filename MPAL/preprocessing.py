@@ -1,64 +1,275 @@
+import os
+import tempfile
 import numpy as np
-from numpy.matlib import repmat
-from scipy.signal import savgol_filter
+from scipy.signal import butter, savgol_filter, sosfiltfilt
+
+# Default smoothing settings (overwritten by self.smoothing in config/settings.config)
+# method: "savgol" (Savitzky–Golay), "butterworth" (zero-phase low-pass) or "moving_average"
+# window: filter window of savgol and moving_average (odd number of data points)
+# order: polynomial order of savgol, filter order of butterworth
+# cutoff, rate: cut-off frequency of butterworth and sampling rate of the recording (Hz)
+SMOOTHING = {"method": "savgol", "window": 7, "order": 2, "cutoff": 6.0, "rate": 100.0}
+
+# Number of data points processed at once by the chunked preprocessing
+CHUNK_SIZE = 1 << 20
+
+
+# Smoothing settings, from the defaults updated with the given ones
+def _smoothing_options(smoothing=None):
+    options = dict(SMOOTHING)
+    if smoothing is not None:
+        options.update(smoothing)
+    if options["method"] not in ("savgol", "butterworth", "moving_average"):
+        raise ValueError("Unknown smoothing method: {}".format(options["method"]))
+    return options
+
+
+# Smooth curve X (n, 3) with the smoothing settings
+def _smooth(X, smoothing=None):
+    options = _smoothing_options(smoothing)
+    if options["method"] == "savgol":
+        return _savgol(X, options["window"], options["order"])
+    elif options["method"] == "butterworth":
+        return _butterworth(X, options["order"], options["cutoff"], options["rate"])
+    else:
+        return _moving_average(X, options["window"])
+
+
+# Savitzky–Golay filter window, shortened to fit trajectories shorter than the window
+def _savgol_window(n, window, order):
+    window = min(window, n if n % 2 == 1 else n - 1)
+    return window if window > order else None
 
 
 # Smooth curve using a Savitzky–Golay filter
-def _smooth(px, py, pz):
-    x = savgol_filter(px, 7, 2)
-    y = savgol_filter(py, 7, 2)
-    z = savgol_filter(pz, 7, 2)
-    return np.array([x, y, z]).T
+# Trajectories too short for a polynomial fit are returned as they are
+def _savgol(X, window, order):
+    window = _savgol_window(len(X), window, order)
+    if window is None:
+        return np.array(X, dtype=float)
+    return savgol_filter(X, window, order, axis=0)
+
 
+# Smooth curve using a zero-phase Butterworth low-pass filter
+def _butterworth(X, order, cutoff, rate):
+    if len(X) < 2:
+        return np.array(X, dtype=float)
+    sos = butter(order, cutoff, fs=rate, output='sos')
+    # Default padding of sosfiltfilt, shortened for short trajectories
+    padlen = 3 * (2 * len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum()))
+    return sosfiltfilt(sos, X, axis=0, padlen=min(padlen, len(X) - 1))
 
-# Redistribute points evenly over a curve with arc-length of t cm
-# Original MATLAB code translated from https://www.mathworks.com/matlabcentral/fileexchange/34874-interparc
-# by John D'Errico
-def _interparc(t, px, py, pz):
-    t = np.linspace(0, 1, t)
-    nt = len(t)
-    n = len(px)
-    pxyz = np.array([px, py, pz]).T
 
-    pt = np.empty((nt, 3), dtype=float)
-    chordlen = np.sqrt(np.sum(np.power(np.diff(pxyz.T), 2), axis=0))
-    chordlen = chordlen / np.sum(chordlen)
-    cumarc = np.insert(np.cumsum(chordlen), 0, 0)
+# Smooth curve using a centered moving average (computed from cumulative sums)
+# The window is shortened at both ends of the trajectory
+def _moving_average(X, window):
+    csum = np.concatenate((np.zeros((1, X.shape[1])), np.cumsum(X, axis=0)))
+    return _window_means(csum, 0, len(X), len(X), window)
 
-    tbins = np.digitize(t, cumarc)
-    tbins[tbins <= 0] = 1
-    tbins[t <= 0] = 1
-    tbins[tbins >= n] = n - 1
-    tbins[t >= 1] = n - 1
-    tbins = tbins - 1
 
-    s = np.divide(t - cumarc[tbins], chordlen[tbins])
+# Means of the windows centered on the points start:stop, from the cumulative sums csum of the n points
+def _window_means(csum, start, stop, n, window):
+    half = window // 2
+    means = np.empty((max(stop - start, 0), csum.shape[1]))
 
-    pt = pxyz[tbins, :] + np.multiply(pxyz[tbins + 1, :] - pxyz[tbins, :], repmat(s, 3, 1).T)
+    # Whole windows
+    a = min(max(start, half), stop)
+    b = max(min(stop, n - half), a)
+    means[a - start:b - start] = csum[a + half + 1:b + half + 1] - csum[a - half:b - half]
+    means[a - start:b - start] /= 2 * half + 1
 
-    return pt
+    # Shortened windows at both ends
+    i = np.concatenate((np.arange(start, a), np.arange(b, stop)))
+    first = np.maximum(i - half, 0)
+    last = np.minimum(i + half + 1, n)
+    means[i - start] = (csum[last] - csum[first]) / (last - first)[:, None]
+    return means
+
+
+# Redistribute points evenly over a curve
+# Points start:stop of t points evenly spaced over the cumulative arc length csum of X (csum[0] = 0, one per point)
+# Adapted from the MATLAB interparc (https://www.mathworks.com/matlabcentral/fileexchange/34874-interparc)
+# by John D'Errico, without recomputing the chord lengths
+# out: (stop - start, 3) array to write the points to (e.g. float32 to save memory), else one of X.dtype is returned
+def _resample(X, csum, t, start=0, stop=None, out=None):
+    n = len(csum)
+    stop = t if stop is None else stop
+    if out is None:
+        out = np.empty((max(stop - start, 0), X.shape[1]), dtype=X.dtype)
+    if stop <= start:
+        return out
+
+    # Arc length of the points (np.linspace(0, csum[-1], t)[start:stop])
+    s = np.arange(start, stop, dtype=float)
+    s *= csum[-1] / (t - 1) if t > 1 else 0
+    if stop == t:
+        s[-1] = csum[-1]
+
+    # Chord of each point
+    tbins = np.searchsorted(csum, s, side='right')
+    tbins -= 1
+    np.clip(tbins, 0, n - 2, out=tbins)
+    tbins[s <= 0] = 0
+    tbins[s >= csum[-1]] = n - 2
+
+    # Position of each point on its chord, then linear interpolation of its end points
+    s -= csum[tbins]
+    s /= csum[tbins + 1] - csum[tbins]
+    # np.take casts an out of another type (e.g. float32) through a copy of its (uninitialized) values, so it is filled
+    # by assignment instead
+    p0 = np.take(X, tbins, axis=0, mode='clip')
+    if out.dtype == X.dtype:
+        np.take(X, tbins + 1, axis=0, out=out, mode='clip')
+    else:
+        out[...] = np.take(X, tbins + 1, axis=0, mode='clip')
+    out -= p0
+    out *= s[:, None]
+    out += p0
+    return out
 
 
 # Main preprocessing function
 # Run smoothing and interpolating function depending on the boolean settings
 # Return idx as the lookup table of pre-processed and post-processed time information
-def preprocess(x, y, z, smooth=False, interpolate=False, interdist=0.5):
+# smoothing: smoothing settings (see SMOOTHING), the defaults if None
+def preprocess(x, y, z, smooth=False, interpolate=False, interdist=0.5, smoothing=None):
     idx = np.arange(0, len(x))
     X = np.array([x, y, z]).T
 
     if smooth:
-        X = _smooth(X[:, 0], X[:, 1], X[:, 2])
+        X = _smooth(X, smoothing)
 
     if interpolate:
-        idx = None
-        chordlen = np.sqrt(np.sum(np.power(np.diff(X.T), 2), axis=0))
-        chordlen = np.insert(chordlen, 0, 0)
-        csum = np.cumsum(chordlen)
-        dist = sum(chordlen)
+        csum = np.concatenate(([0], np.cumsum(_chord_lengths(X))))
         idx = csum // interdist
 
-        t = round(dist / interdist)
+        t = int(round(csum[-1] / interdist))
 
-        X = _interparc(t, X[:, 0], X[:, 1], X[:, 2])[1:, :]
+        X = _resample(X, csum, t, start=1)
 
     return X, idx
+
+
+#########################
+# Chunked preprocessing #
+#########################
+# Same results as preprocess, for trajectories larger than memory (e.g. memory-mapped columns of load_trajectory)
+# The trajectory is read in blocks of chunk data points; when interpolating, the chord lengths, the cumulative arc
+# length and the smoothed points are kept in temporary memory-mapped files instead of memory
+
+# Generator of blocks of the preprocessed X
+# idx_out: array of len(x) data points (e.g. a memory-mapped file) to write idx to, int if not interpolating, else float
+# dtype: type of the interpolated points (e.g. np.float32 to save memory)
+# Butterworth smoothing (an IIR filter applied forward and backward) cannot be computed block by block
+def iter_preprocess(x, y, z, smooth=False, interpolate=False, interdist=0.5, smoothing=None, chunk=CHUNK_SIZE,
+                    idx_out=None, temp_dir=None, dtype=float):
+    with tempfile.TemporaryDirectory(dir=temp_dir) as temp:
+        blocks = _preprocess_blocks(x, y, z, smooth, interpolate, interdist, smoothing, chunk, idx_out, temp, dtype)
+        next(blocks)
+        yield from blocks
+
+
+# Preprocess into .npy files, returning X and idx memory-mapped from them
+def preprocess_to_file(x, y, z, X_file, idx_file, smooth=False, interpolate=False, interdist=0.5, smoothing=None,
+                       chunk=CHUNK_SIZE, temp_dir=None, dtype=float):
+    idx = np.lib.format.open_memmap(idx_file, mode='w+', shape=(len(x),),
+                                    dtype=float if interpolate else np.arange(0).dtype)
+    with tempfile.TemporaryDirectory(dir=temp_dir) as temp:
+        blocks = _preprocess_blocks(x, y, z, smooth, interpolate, interdist, smoothing, chunk, idx, temp, dtype)
+        X = np.lib.format.open_memmap(X_file, mode='w+', dtype=dtype, shape=(next(blocks), 3))
+        start = 0
+        for block in blocks:
+            X[start:start + len(block)] = block
+            start += len(block)
+    X.flush()
+    idx.flush()
+    return X, idx
+
+
+# Yield the number of preprocessed data points, then the blocks of X
+def _preprocess_blocks(x, y, z, smooth, interpolate, interdist, smoothing, chunk, idx_out, temp, dtype):
+    n = len(x)
+    blocks = _iter_points(x, y, z, smooth, smoothing, chunk, temp)
+    if not interpolate:
+        yield n
+        for start, stop, block in blocks:
+            if idx_out is not None:
+                idx_out[start:stop] = np.arange(start, stop)
+            yield block
+        return
+
+    # Points (smoothed or not), read back by the passes below
+    points = np.lib.format.open_memmap(os.path.join(temp, "points.npy"), mode='w+', dtype=float, shape=(n, 3))
+    for start, stop, block in blocks:
+        points[start:stop] = block
+
+    # Cumulative arc length (carried from block to block)
+    csum = np.lib.format.open_memmap(os.path.join(temp, "csum.npy"), mode='w+', dtype=float, shape=(n,))
+    carry = np.float64(0)
+    if n > 0:
+        csum[0] = carry
+    for start in range(0, n - 1, chunk):
+        stop = min(start + chunk, n - 1)
+        block = np.cumsum(np.concatenate(([carry], _chord_lengths(points[start:stop + 1]))))
+        csum[start + 1:stop + 1] = block[1:]
+        carry = block[-1]
+    if idx_out is not None:
+        for start in range(0, n, chunk):
+            idx_out[start:start + chunk] = csum[start:start + chunk] // interdist
+    t = int(round(carry / interdist))
+    yield max(t - 1, 0)
+
+    # Redistribute points evenly over the curve (without the first point)
+    for start in range(1, t, chunk):
+        stop = min(start + chunk, t)
+        yield _resample(points, csum, t, start, stop, out=np.empty((stop - start, 3), dtype=dtype))
+
+
+# Generator of the blocks (start, stop, points) of the trajectory, smoothed or not
+def _iter_points(x, y, z, smooth, smoothing, chunk, temp):
+    n = len(x)
+    options = _smoothing_options(smoothing)
+    if smooth and options["method"] == "butterworth":
+        raise ValueError("Butterworth smoothing is not available in chunked preprocessing")
+
+    # Cumulative sums of the moving average (carried from block to block)
+    if smooth and options["method"] == "moving_average":
+        csum = np.lib.format.open_memmap(os.path.join(temp, "smooth.npy"), mode='w+', dtype=float, shape=(n + 1, 3))
+        carry = np.zeros((1, 3))
+        csum[0] = carry
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            block = np.cumsum(np.concatenate((carry, _raw_points(x, y, z, start, stop))), axis=0)
+            csum[start + 1:stop + 1] = block[1:]
+            carry = block[-1:]
+
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        if not smooth:
+            yield start, stop, _raw_points(x, y, z, start, stop)
+        elif options["method"] == "savgol":
+            yield start, stop, _savgol_block(x, y, z, start, stop, options["window"], options["order"])
+        else:
+            yield start, stop, _window_means(csum, start, stop, n, options["window"])
+
+
+# Points start:stop of the trajectory
+def _raw_points(x, y, z, start, stop):
+    return np.array([x[start:stop], y[start:stop], z[start:stop]]).T
+
+
+# Smooth the points start:stop with a Savitzky–Golay filter, reading only half a filter window around them
+# The first and last points are fitted on the first and last windows of the whole trajectory, as in _savgol
+def _savgol_block(x, y, z, start, stop, window, order):
+    n = len(x)
+    window = _savgol_window(n, window, order)
+    if window is None:
+        return _raw_points(x, y, z, start, stop).astype(float)
+    lo = max(0, min(start - window // 2, n - window))
+    hi = min(n, max(stop + window // 2, window))
+    return _savgol(_raw_points(x, y, z, lo, hi), window, order)[start - lo:stop - lo]
+
+
+# Length of the chords between consecutive points
+def _chord_lengths(points):
+    return np.sqrt(np.sum(np.power(np.diff(points.T), 2), axis=0))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+from analysis import *
+from analysis import _direction_angles, _read_csv_columns, _x_labels, _y_labels, _z_labels, _reduce_turn
+from batch import Settings, add_input_arguments, script_dir
+
+'''
+--------------------------------------------------------------
+Streaming analysis (live input)
+
+Labels a trajectory while it is being recorded. Data points are pushed one at a time or in small batches, and every
+push returns the level-1 labels of the new nodes together with the level-3 segments that became final:
+    - a level-2 node (run of identical level-1 labels) is known as a main direction as soon as it reaches
+      main_direction_threshold level-1 nodes, and as a change in direction when it ends before that
+    - a main direction segment is final as soon as it is known, and the change in direction before it is reduced
+      (or removed, with the main direction, when it returns to the previous main direction) at the same time
+    - the first and last changes in direction are not reduced, so the last one is only final after finish()
+After finish(), the hashes and hash frames are the same as those of an Analysis of the same data points, without
+preprocessing (smoothing and interpolation need data points that are not recorded yet).
+
+Every push costs O(new data points + finished level-2 nodes), with each level-1 label looked at once, and the state kept
+between pushes is the current level-2 node and the pending change in direction.
+
+Usage:  stream = StreamingAnalysis(thresholds)
+        for points in source:                   (e.g. replay(file, rate=100), or a motion tracker)
+            labels, segments = stream.push(points)
+        segments = stream.finish()
+
+        Replay of a recording, on terminal in the MPAL folder, enter (e.g.)
+        python3 stream.py ../data/trial.csv --header 1 --rate 100
+--------------------------------------------------------------
+'''
+
+
+######################
+# Streaming analysis #
+######################
+class StreamingAnalysis:
+
+    def __init__(self, x_threshold, y_threshold, z_threshold, main_direction_threshold,
+                 invert_x=False, invert_y=False, invert_z=False):
+        # Set object attributes (as in Analysis)
+        self.x_threshold = x_threshold
+        self.y_threshold = 90 - y_threshold
+        self.z_threshold = 90 - z_threshold
+        self.main_direction_threshold = main_direction_threshold
+        self.invert_x = invert_x
+        self.invert_y = invert_y
+        self.invert_z = invert_z
+
+        # Level-1 label rows, start frames of the level-2 nodes, and final level-3 segments
+        self.lvl1 = [bytearray(), bytearray(), bytearray()]
+        self.lvl2hashframe = []
+        self.lvl3hash = []
+        self.lvl3hashframe = []
+        self.finished = False
+
+        self._last = None
+        # Current level-2 node: label code, length, and whether it was already found to be a main direction
+        self._code = None
+        self._length = 0
+        self._main = False
+        # Last main direction, and the change in direction (labels, start frame) after it
+        self._main_axis = None
+        self._turn = None
+        self._turn_frame = None
+        self._labels = {}
+
+    # Number of level-1 nodes so far
+    def __len__(self):
+        return len(self.lvl1[0])
+
+    # Add data points, as an (n, 3) array or a single (x, y, z) point
+    # Returns the level-1 labels of the new nodes (e.g. 'L-U'), and the new final level-3 segments as (label, frame)
+    def push(self, points):
+        if self.finished:
+            raise ValueError("The stream is finished")
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(points) == 0:
+            return [], []
+        if self._last is not None:
+            points = np.concatenate((self._last, points))
+        self._last = points[-1:].copy()
+        if len(points) < 2:
+            return [], []
+
+        # Level-1 labels of the new nodes
+        angle1, angle2 = _direction_angles(points)
+        rows = (_x_labels(angle1, self.x_threshold, self.invert_x), _y_labels(angle1, self.y_threshold, self.invert_y),
+                _z_labels(angle2, self.z_threshold, self.invert_z))
+        start = len(self)
+        for lvl1, row in zip(self.lvl1, rows):
+            lvl1.extend(row.tobytes())
+
+        # Extend the current level-2 node, or close it and start new ones
+        code = (rows[0].astype(np.int32) << 16) | (rows[1].astype(np.int32) << 8) | rows[2]
+        segments = []
+        bounds = np.concatenate(([0], np.flatnonzero(code[1:] != code[:-1]) + 1, [len(code)])).tolist()
+        for s, e in zip(bounds[:-1], bounds[1:]):
+            c = int(code[s])
+            if c == self._code:
+                self._length += e - s
+            else:
+                self._close()
+                self._code = c
+                self._length = e - s
+                self._main = False
+                self.lvl2hashframe.append(start + s)
+            if not self._main and self._length >= self.main_direction_threshold:
+                self._main = True
+                self._main_direction(self._label(c), self.lvl2hashframe[-1], segments)
+
+        labels = np.stack(rows, axis=1).tobytes().decode('ascii')
+        labels = [labels[i:i + 3] for i in range(0, len(labels), 3)]
+        return labels, segments
+
+    # End of the recording: close the last level-2 node and change in direction
+    # Sets lvl1hash, lvl2hash, lvl2hashframe, lvl3hash and lvl3hashframe as in Analysis, and returns the last segments
+    def finish(self):
+        if self.finished:
+            return []
+        segments = []
+        self._close()
+        if self._turn is not None:
+            # The last change in direction is not reduced
+            self._emit(''.join(self._turn), self._turn_frame, segments)
+            self._turn = None
+        self.finished = True
+
+        self.lvl1hash = [lvl1.decode('ascii') + '/' for lvl1 in self.lvl1]
+        self.lvl2hashframe = np.array(self.lvl2hashframe + [len(self)], dtype=np.int64)
+        self.lvl2hash = [np.frombuffer(bytes(lvl1), dtype=np.uint8)[self.lvl2hashframe[:-1]].tobytes().decode('ascii')
+                         + '/' for lvl1 in self.lvl1]
+        self.lvl3hash.append("END")
+        self.lvl3hashframe.append(len(self))
+        return segments
+
+    # Level-3 label of a level-2 node code, without '-' (uppercase)
+    def _label(self, code):
+        if code not in self._labels:
+            self._labels[code] = (chr(code >> 16 & 255) + chr(code >> 8 & 255) + chr(code & 255)).replace('-', '')
+        return self._labels[code]
+
+    # Close the current level-2 node, which is a change in direction if it did not become a main direction
+    def _close(self):
+        if self._code is None or self._main:
+            return
+        label = self._label(self._code).lower()
+        if label == '':
+            return
+        # Consecutive changes in direction are grouped
+        if self._turn is None:
+            self._turn = []
+            self._turn_frame = self.lvl2hashframe[-1]
+        self._turn.append(label)
+
+    # A new main direction: the change in direction before it becomes final (see Analysis._lvl3hash)
+    def _main_direction(self, label, frame, segments):
+        if label == '':
+            return
+        turn = ''.join(self._turn) if self._turn is not None else None
+        self._turn = None
+        if self._main_axis is None:
+            # The first change in direction is not reduced
+            if turn is not None:
+                self._emit(turn, self._turn_frame, segments)
+        elif turn is not None:
+            # A change in direction between two identical main directions is removed with the second one
+            if self._main_axis == label:
+                return
+            turn = _reduce_turn(turn, self._main_axis, label)
+            if turn != '':
+                self._emit(turn, self._turn_frame, segments)
+        self._main_axis = label
+        self._emit(label, frame, segments)
+
+    def _emit(self, label, frame, segments):
+        self.lvl3hash.append(label)
+        self.lvl3hashframe.append(frame)
+        segments.append((label, frame))
+
+
+##########
+# Replay #
+##########
+# Data points of a recording (.csv or binary trajectory file, see Analysis), in batches of `batch` points released at
+# `rate` data points per second (as fast as possible if rate is None)
+# Batches are released on a fixed schedule, so a slow consumer catches up instead of delaying the following points
+def replay(file, col_x=1, col_y=2, col_z=3, header=None, rate=100.0, batch=1):
+    # Update header
+    if header is not None: header -= 1
+
+    if is_binary_trajectory(file):
+        data, _ = load_trajectory(file)
+    else:
+        data = _read_csv_columns(file, [col_x - 1, col_y - 1, col_z - 1], header=header)
+
+    start = time.perf_counter()
+    for i in range(0, len(data), batch):
+        if rate is not None:
+            delay = start + (i + batch - 1) / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield np.asarray(data[i:i + batch])
+
+
+########
+# Main #
+########
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recording through the streaming analysis.")
+    parser.add_argument("file", help="input file")
+
+    # No preprocessing: the data points are analysed as they arrive
+    add_input_arguments(parser, preprocessing=False)
+
+    replay_options = parser.add_argument_group("replay options")
+    replay_options.add_argument("--settings", default=os.path.join(script_dir, "config/settings.config"),
+                                help="settings file with the thresholds (default: config/settings.config)")
+    replay_options.add_argument("--rate", type=float, default=100.0,
+                                help="data points per second, 0 for as fast as possible (default: 100)")
+    replay_options.add_argument("--batch", type=int, default=1, help="data points per push (default: 1)")
+    replay_options.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+
+    settings = Settings(args.settings)
+    stream = StreamingAnalysis(settings.x_threshold, settings.y_threshold, settings.z_threshold,
+                               settings.main_direction_threshold, args.invert_x, args.invert_y, args.invert_z)
+
+    # Time spent in push() per batch of data points
+    latencies = []
+    start = time.perf_counter()
+    for points in replay(args.file, args.col_x, args.col_y, args.col_z, args.header, args.rate or None, args.batch):
+        t = time.perf_counter()
+        _, segments = stream.push(points)
+        latencies.append(time.perf_counter() - t)
+        if not args.quiet:
+            for label, frame in segments:
+                print("{:>8} {}".format(frame, label))
+    segments = stream.finish()
+    if not args.quiet:
+        for label, frame in segments:
+            print("{:>8} {}".format(frame, label))
+
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    print("{} data points in {:.2f}s, {} level-3 segments, push time mean {:.3f} ms, max {:.3f} ms".format(
+        len(stream) + 1 if len(latencies) else 0, elapsed, len(stream.lvl3hash) - 1,
+        latencies.mean() if len(latencies) else 0, latencies.max() if len(latencies) else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import os
+import sys
+
+from analysis import *
+from analysis import _x_labels, _y_labels, _z_labels
+from batch import Settings, add_input_arguments, analysis_from_args, script_dir
+
+'''
+--------------------------------------------------------------
+Threshold sweep (sensitivity analysis)
+
+Evaluates a grid of x/y/z/main direction thresholds against one preprocessed trajectory and returns a table with a row
+of statistics per setting: number of level 2 segments, main direction and change in direction segments, fraction of
+level 1 nodes in main direction segments, and the histogram of the level 1 labels of every axis.
+
+The angles of the trajectory are computed once. Every axis is classified once per threshold value, and the statistics
+of all combinations are counted together from the windows of level 1 nodes without a label change (matrix products
+over the grid), so no per-setting Analysis is run.
+
+Usage:  On terminal, in the MPAL folder, enter (e.g.)
+        python3 sweep.py ../data/trial.csv --header 1 --smooth --x-thresholds 30:80:5 --y-thresholds 45 60
+                --main-direction-thresholds 3 5 10 --out ../results/trial_sweep.csv
+
+        Thresholds are lists of values or start:stop:step ranges (stop included). Thresholds not swept are read from
+        config/settings.config. Enter python3 sweep.py --help for all options.
+--------------------------------------------------------------
+'''
+
+SWEEP_FIELDS = ["x_threshold", "y_threshold", "z_threshold", "main_direction_threshold",
+                "level2_segments", "main_direction_segments", "change_in_direction_segments",
+                "main_direction_fraction", "L", "R", "x_none", "F", "B", "y_none", "U", "D", "z_none"]
+
+
+##################
+# Sweep function #
+##################
+# Statistics of every combination of thresholds, as a DataFrame with the SWEEP_FIELDS columns
+# y_thresholds and z_thresholds are given as in the settings (not the complementary angles)
+def threshold_sweep(analysis, x_thresholds, y_thresholds, z_thresholds, main_direction_thresholds, chunk=2**20):
+    angle1 = analysis.parameters[:-1, 0]
+    angle2 = analysis.parameters[:-1, 2]
+    nodes = len(angle1)
+
+    x = [_x_labels(angle1, threshold, analysis.invert_x) for threshold in x_thresholds]
+    y = [_y_labels(angle1, 90 - threshold, analysis.invert_y) for threshold in y_thresholds]
+    z = [_z_labels(angle2, 90 - threshold, analysis.invert_z) for threshold in z_thresholds]
+
+    histograms = [_histogram(labels, 'LR') for labels in x], [_histogram(labels, 'FB') for labels in y], \
+                 [_histogram(labels, 'UD') for labels in z]
+
+    # Number of label changes before every level 1 node, per axis and threshold
+    changes = [_cumulative_changes(labels) for labels in (x, y, z)]
+
+    # windows[size]: number of runs of `size` consecutive level 1 nodes without any label change
+    windows = {1: np.full((len(x), len(y), len(z)), nodes, dtype=np.int64)}
+
+    def count(size):
+        if size not in windows:
+            windows[size] = _window_counts(*changes, size, chunk)
+        return windows[size]
+
+    # A level 2 segment of length l holds l - size + 1 windows, so the segments of at least `size` nodes are
+    # count(size) - count(size + 1), and they hold count(size) + (size - 1) * segments level 1 nodes
+    level2_segments = count(1) - count(2)
+    rows = []
+    for main_direction_threshold in main_direction_thresholds:
+        size = max(int(main_direction_threshold), 1)
+        main_segments = count(size) - count(size + 1)
+        main_nodes = count(size) + (size - 1) * main_segments
+        for a, b, c in itertools.product(range(len(x)), range(len(y)), range(len(z))):
+            rows.append([x_thresholds[a], y_thresholds[b], z_thresholds[c], main_direction_threshold,
+                         level2_segments[a, b, c], main_segments[a, b, c],
+                         level2_segments[a, b, c] - main_segments[a, b, c],
+                         main_nodes[a, b, c] / nodes if nodes else np.nan,
+                         *histograms[0][a], *histograms[1][b], *histograms[2][c]])
+    return pd.DataFrame(rows, columns=SWEEP_FIELDS)
+
+
+# Cumulative number of label changes up to every node, as an int32 array of shape (thresholds, nodes)
+def _cumulative_changes(labels):
+    changes = np.zeros((len(labels), len(labels[0]) if labels else 0), dtype=np.int32)
+    for i, row in enumerate(labels):
+        np.cumsum(row[1:] != row[:-1], out=changes[i, 1:])
+    return changes
+
+
+# Number of windows of `size` nodes without a label change on any axis, for all threshold combinations
+# sum_i wx[a, i] * wy[b, i] * wz[c, i] is computed as a matrix product per X threshold, in chunks of nodes so that the
+# float32 sums stay exact
+def _window_counts(changes_x, changes_y, changes_z, size, chunk):
+    total = np.zeros((len(changes_x), len(changes_y), len(changes_z)), dtype=np.int64)
+    count = changes_x.shape[1] - size + 1
+    for start in range(0, max(count, 0), chunk):
+        stop = min(start + chunk, count)
+        wx, wy, wz = [(changes[:, start + size - 1:stop + size - 1] == changes[:, start:stop]).astype(np.float32)
+                      for changes in (changes_x, changes_y, changes_z)]
+        for a in range(len(wx)):
+            total[a] += np.rint((wx[a] * wy) @ wz.T).astype(np.int64)
+    return total
+
+
+# Number of level 1 nodes with each label of the axis and without label
+def _histogram(labels, names):
+    return [np.count_nonzero(labels == ord(names[0])), np.count_nonzero(labels == ord(names[1])),
+            np.count_nonzero(labels == ord('-'))]
+
+
+# Threshold values from a list of numbers and start:stop:step ranges (stop included)
+def _grid(values):
+    grid = []
+    for value in values:
+        if ':' in value:
+            start, stop, step = [float(part) for part in value.split(':')]
+            grid.extend(np.round(np.arange(start, stop + step / 2, step), 10).tolist())
+        else:
+            grid.append(float(value))
+    return grid
+
+
+########
+# Main #
+########
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a grid of thresholds on one trajectory without the GUI.")
+    parser.add_argument("file", help="input file")
+
+    add_input_arguments(parser)
+
+    sweep_options = parser.add_argument_group("threshold grid (values or start:stop:step, default: from the settings "
+                                              "file)")
+    sweep_options.add_argument("--settings", default=os.path.join(script_dir, "config/settings.config"),
+                               help="settings file (default: config/settings.config)")
+    sweep_options.add_argument("--x-thresholds", nargs='+', help="X-axis (L/R) thresholds (degrees)")
+    sweep_options.add_argument("--y-thresholds", nargs='+', help="Y-axis (F/B) thresholds (degrees)")
+    sweep_options.add_argument("--z-thresholds", nargs='+', help="Z-axis (U/D) thresholds (degrees)")
+    sweep_options.add_argument("--main-direction-thresholds", nargs='+',
+                               help="main direction thresholds (data points)")
+
+    parser.add_argument("--out", default=None,
+                        help="output .csv file (default: <file>_MPAL_sweep.csv next to the input file)")
+    args = parser.parse_args(argv)
+
+    settings = Settings(args.settings)
+    grids = {}
+    for key in ["x_threshold", "y_threshold", "z_threshold", "main_direction_threshold"]:
+        values = getattr(args, key + 's')
+        grids[key] = _grid(values) if values is not None else [getattr(settings, key)]
+    grids["main_direction_threshold"] = [int(value) for value in grids["main_direction_threshold"]]
+
+    analysis = analysis_from_args(args, settings)
+
+    table = threshold_sweep(analysis, grids["x_threshold"], grids["y_threshold"], grids["z_threshold"],
+                            grids["main_direction_threshold"])
+
+    out = args.out
+    if out is None:
+        out = os.path.splitext(args.file)[0] + "_MPAL_sweep.csv"
+    table.to_csv(out, index=False)
+    print("{} settings evaluated, saved to {}".format(len(table), out))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
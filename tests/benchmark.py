@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MPAL"))
+
+import numpy as np
+
+import reference
+from analysis import *
+from analysis import _direction_angles, _lvl1labels, _read_csv_columns
+from preprocessing import _chord_lengths, _resample, _smooth
+
+'''
+--------------------------------------------------------------
+Benchmarks of the optimised code against the reference implementations (see reference.py)
+
+Every benchmark checks that both versions give the same results, then times them on random trajectories and prints
+the best of `repeat` runs.
+
+Usage:  On terminal, in the tests folder, enter (e.g.)
+        python3 benchmark.py level1 --points 200000
+        Enter python3 benchmark.py --help for all benchmarks and options.
+--------------------------------------------------------------
+'''
+
+
+# Best time of `repeat` calls of function()
+def _best_time(function, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+# Rows of (name, seconds, speedup over the first row), printed if verbose
+def _report(timings, verbose):
+    reference_time = timings[0][1]
+    rows = [(name, seconds, reference_time / seconds) for name, seconds in timings]
+    if verbose:
+        for row in rows:
+            print("{:<28} {:9.4f}s  speedup {:7.2f}".format(*row))
+    return rows
+
+
+# Random walk of n data points
+def random_walk(n, seed=0):
+    return np.cumsum(np.random.default_rng(seed).normal(size=(n, 3)), axis=0)
+
+
+##################
+# Level-1 labels #
+##################
+# Level-1 hash strings and angles, per-point-pair loop against the vectorized kernels
+def benchmark_level1(points=200000, repeat=3, seed=0, verbose=True):
+    X = random_walk(points, seed)
+    thresholds = (60.0, 90 - 60.0, 90 - 60.0)
+
+    def vectorized():
+        angle1, angle2 = _direction_angles(X)
+        return _lvl1labels(angle1, angle2, *thresholds), angle1, angle2
+
+    hashes, angles = reference.lvl1hash(X, *thresholds)
+    labels, angle1, angle2 = vectorized()
+    assert [row + '/' for row in labels] == hashes
+    np.testing.assert_allclose(np.column_stack((angle1, angle1, angle2)), angles[:-1], rtol=1e-15, atol=1e-12)
+
+    return _report([("loop", _best_time(lambda: reference.lvl1hash(X, *thresholds), repeat)),
+                    ("vectorized", _best_time(vectorized, repeat))], verbose)
+
+
+#################
+# .csv file read #
+#################
+# Read of 3 coordinate columns of a .csv file of `columns` columns with a header row, all columns with the Python engine
+# against the selected columns with the C engine
+# Values are written with 8 decimals, as in tracker exports (the Python engine of pandas >= 2 does not round numbers of
+# 17 or more digits correctly, the C engine with float_precision="round_trip" does)
+def benchmark_csv(points=300000, columns=24, repeat=3, seed=0, verbose=True):
+    data = np.random.default_rng(seed).normal(scale=100, size=(points, columns))
+    handle, file = tempfile.mkstemp(suffix=".csv")
+    os.close(handle)
+    try:
+        np.savetxt(file, data, fmt='%.8f', delimiter=',', header=','.join("marker{}".format(i) for i in range(columns)),
+                   comments='')
+        cols = (4, 5, 6)
+
+        expected = reference.read_csv(file, *cols, header=0)
+        np.testing.assert_array_equal(_read_csv_columns(file, [col - 1 for col in cols], header=0), expected)
+
+        return _report([("python engine, all columns",
+                         _best_time(lambda: reference.read_csv(file, *cols, header=0), repeat)),
+                        ("c engine, usecols",
+                         _best_time(lambda: _read_csv_columns(file, [col - 1 for col in cols], header=0), repeat))],
+                       verbose)
+    finally:
+        os.remove(file)
+
+
+#########################
+# Arc length resampling #
+#########################
+# Interpolation of a trajectory every interdist, interparc against _resample (with new or given output buffers)
+# The cumulative arc length is computed by preprocess in both versions, for idx, so it is not timed
+def benchmark_resample(points=1000000, interdist=5.0, repeat=3, seed=0, verbose=True):
+    X = random_walk(points, seed)
+    csum = np.concatenate(([0], np.cumsum(_chord_lengths(X))))
+    t = int(round(csum[-1] / interdist))
+    out = np.empty((t, 3))
+    out32 = np.empty((t, 3), dtype=np.float32)
+
+    # Same points up to rounding (see reference.interparc_tolerance)
+    expected = reference.interparc(t, X[:, 0], X[:, 1], X[:, 2])
+    np.testing.assert_allclose(_resample(X, csum, t), expected, rtol=0, atol=reference.interparc_tolerance(X, csum))
+    if verbose:
+        print("{} data points resampled to {} points".format(points, t))
+
+    return _report([("interparc", _best_time(lambda: reference.interparc(t, X[:, 0], X[:, 1], X[:, 2]), repeat)),
+                    ("_resample", _best_time(lambda: _resample(X, csum, t), repeat)),
+                    ("_resample out=", _best_time(lambda: _resample(X, csum, t, out=out), repeat)),
+                    ("_resample float32 out=", _best_time(lambda: _resample(X, csum, t, out=out32), repeat))],
+                   verbose)
+
+
+#############
+# Smoothing #
+#############
+# Smoothing filters (see SMOOTHING) against the per-axis Savitzky-Golay filter, on a 0.5 Hz sine on every axis sampled
+# at rate Hz with white noise, also printing the throughput and the RMS of the noise left by every filter
+def benchmark_smoothing(points=2000000, rate=200.0, noise=0.2, repeat=3, seed=0, verbose=True):
+    times = np.arange(points) / rate
+    signal = np.sin(2 * np.pi * 0.5 * times[:, None] + np.array([0, 2, 4]))
+    X = signal + np.random.default_rng(seed).normal(scale=noise, size=(points, 3))
+    settings = [("savgol 7/2", dict(method="savgol", window=7, order=2)),
+                ("savgol 31/2", dict(method="savgol", window=31, order=2)),
+                ("butterworth 2nd, 6 Hz", dict(method="butterworth", order=2, cutoff=6.0, rate=rate)),
+                ("butterworth 4th, 6 Hz", dict(method="butterworth", order=4, cutoff=6.0, rate=rate)),
+                ("moving_average 7", dict(method="moving_average", window=7)),
+                ("moving_average 31", dict(method="moving_average", window=31))]
+
+    # The default filter gives the same points as the per-axis filter
+    expected = reference.smooth(X[:, 0], X[:, 1], X[:, 2])
+    np.testing.assert_array_equal(_smooth(X), expected)
+
+    timings = [("per-axis savgol 7/2", _best_time(lambda: reference.smooth(X[:, 0], X[:, 1], X[:, 2]), repeat))]
+    residuals = [np.sqrt(np.mean((expected - signal) ** 2))]
+    for name, smoothing in settings:
+        timings.append((name, _best_time(lambda: _smooth(X, smoothing), repeat)))
+        residuals.append(np.sqrt(np.mean((_smooth(X, smoothing) - signal) ** 2)))
+
+    rows = _report(timings, verbose=False)
+    if verbose:
+        rms = np.sqrt(np.mean((X - signal) ** 2))
+        for (name, seconds, speedup), residual in zip(rows, residuals):
+            print("{:<28} {:9.4f}s  speedup {:7.2f}  {:6.1f} M points/s  noise RMS {:.3f} -> {:.3f}".format(
+                name, seconds, speedup, points / seconds / 1e6, rms, residual))
+    return rows
+
+
+##############
+# Parameters #
+##############
+# Analysis._parameters into a new array copied to an output buffer (e.g. a shared memory block of parallel.py), against
+# the parameters written to the buffer directly
+def benchmark_parameters(points=1000000, repeat=3, seed=0, verbose=True):
+    X = random_walk(points, seed)
+    analysis = Analysis.from_preprocessed(X, X, np.arange(points), 60.0, 60.0, 60.0, 5)
+    out = np.empty((points, len(PARAMETER_NAMES)))
+
+    analysis._parameters()
+    expected = analysis.parameters
+    analysis._parameters(out=out)
+    np.testing.assert_array_equal(out, expected)
+
+    def copy():
+        analysis._parameters()
+        out[:] = analysis.parameters
+
+    return _report([("_parameters() and copy", _best_time(copy, repeat)),
+                    ("_parameters(out=)", _best_time(lambda: analysis._parameters(out=out), repeat))], verbose)
+
+
+BENCHMARKS = {"level1": benchmark_level1, "csv": benchmark_csv, "resample": benchmark_resample,
+              "smoothing": benchmark_smoothing, "parameters": benchmark_parameters}
+
+
+########
+# Main #
+########
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the optimised code against the reference implementations.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), nargs='+', help="benchmarks to run")
+    parser.add_argument("--points", type=int, default=None, help="data points (default: set by every benchmark)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per version, best kept (default: 3)")
+    args = parser.parse_args(argv)
+
+    for name in args.benchmark:
+        print(name)
+        options = dict(repeat=args.repeat)
+        if args.points is not None:
+            options["points"] = args.points
+        BENCHMARKS[name](**options)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
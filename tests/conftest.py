@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The MPAL modules import each other by name (e.g. "from analysis import *"), as when run from the MPAL folder
+MPAL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MPAL")
+sys.path.insert(0, MPAL_DIR)
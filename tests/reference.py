@@ -0,0 +1,293 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+from numpy.linalg import norm
+import pandas as pd
+from scipy.signal import savgol_filter
+
+'''
+--------------------------------------------------------------
+Reference implementations
+
+Code of the first release of MPAL, before it was optimised, kept to check that the optimised code gives the same
+results (see the tests) and to measure the speedup (see benchmark.py). Every function is the body of the original
+method, with the Analysis attributes passed as arguments.
+--------------------------------------------------------------
+'''
+
+
+# Analysis._lvl1hash: level-1 hash strings, and the angles of every point duplet (parameters[:, 0:3])
+# y_threshold and z_threshold are the complementary angles (90 - threshold), as stored by Analysis
+def lvl1hash(X, x_threshold, y_threshold, z_threshold, invert_x=False, invert_y=False, invert_z=False):
+    x, y, z = X[:, 0], X[:, 1], X[:, 2]
+    hashes = [''] * 3
+    angles = np.full((len(x), 3), np.nan)
+
+    # Loop through point duplets
+    for i in range(len(x) - 1):
+        # Compute directional vector
+        direction_vector = [x[i+1] - x[i], y[i+1] - y[i], z[i+1] - z[i]]
+
+        # Compute angular change in x/y and z
+        angle1 = math.degrees(math.atan2(direction_vector[1], direction_vector[0]))
+        angle2 = math.degrees(math.atan2(direction_vector[2], math.sqrt(direction_vector[0]**2 + direction_vector[1]**2)))
+
+        # Determine left/right
+        if abs(angle1) <= x_threshold:
+            hashes[0] += 'R' if invert_x else 'L'
+        elif abs(angle1) >= 180 - x_threshold:
+            hashes[0] += 'L' if invert_x else 'R'
+        else:
+            hashes[0] += '-'
+        angles[i, 0] = angle1
+
+        # Determine forward/backward
+        if y_threshold < angle1 < 180 - y_threshold:
+            hashes[1] += 'F' if invert_y else 'B'
+        elif -(180 - y_threshold) < angle1 < -y_threshold:
+            hashes[1] += 'B' if invert_y else 'F'
+        else:
+            hashes[1] += '-'
+        angles[i, 1] = angle1
+
+        # Determine up/down
+        if angle2 >= z_threshold:
+            hashes[2] += 'D' if invert_z else 'U'
+        elif angle2 <= -z_threshold:
+            hashes[2] += 'U' if invert_z else 'D'
+        else:
+            hashes[2] += '-'
+        angles[i, 2] = angle2
+
+    # '/' padding
+    return [row + '/' for row in hashes], angles
+
+
+# Analysis.__find_angle: angle (degrees) between the segments p2-p1 and p2-p3
+def find_angle(p1, p2, p3):
+    p1 = np.array(p1)
+    p2 = np.array(p2)
+    p3 = np.array(p3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n1 = (p3 - p2) / norm(p3 - p2)
+        n2 = (p1 - p2) / norm(p1 - p2)
+    return math.degrees(math.atan2(norm(np.cross(n1, n2)), np.dot(n1, n2)))
+
+
+# Analysis.__curvature: cumulative arc length L, and radius R and curvature vector k of the circumcircle through
+# X[i-1], X[i] and X[i+1], point by point (np.NAN is written as np.nan, as it was removed in numpy 2)
+def curvature(X):
+
+    def circumcenter(A, B, C):
+        D = np.cross(B - A, C - A)
+        b = norm(A - C)
+        c = norm(A - B)
+
+        E = np.cross(D, B - A)
+        F = np.cross(D, C - A)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            G = (b * b * E - c * c * F) / norm(D) ** 2 / 2
+        M = A + G
+        R = norm(G)
+        if R == 0:
+            k = G
+        else:
+            k = G / (R * R)
+        return R, M, k
+
+    N = X.shape[0]
+    L = np.zeros(N)
+    R = np.full(N, np.nan)
+    k = np.full((N, 3), np.nan)
+    for i in range(1, N - 1):
+        R[i], _, k[i, :] = circumcenter(X[i], X[i - 1], X[i + 1])
+        L[i] = L[i - 1] + norm(X[i] - X[i - 1])
+    i = N - 1
+    L[i] = L[i - 1] + L[i - 1] + norm(X[i] - X[i - 1])
+    return L, R, k
+
+
+# Analysis._lvl3hash: level-3 hash (with the "END" padding) and hash frames of the level-2 hash, by repeated passes
+# until no node is removed
+def lvl3hash(lvl2hash, lvl2hashframe, main_direction_threshold):
+    lvl3hash = []
+    lvl3hashframe = []
+
+    # Group the three rows of level-2 hash strings into one
+    # Remove 'n'
+    # Change in direction is defined as Level-2 consecutive grouping smaller than main_direction_threshold
+    # Change in direction is denoted with lowercase
+    for i in range(len(lvl2hashframe)-1):
+        # Line segment is larger than main_direction threshold
+        if lvl2hashframe[i+1] - lvl2hashframe[i] >= main_direction_threshold:
+            temp = lvl2hash[0][i] + lvl2hash[1][i] + lvl2hash[2][i]
+            # Regex for substituting 'n' with blank
+            temp = re.sub('[-]', '', temp)
+        # Line segment is a change in direction
+        else:
+            temp = (lvl2hash[0][i] + lvl2hash[1][i] + lvl2hash[2][i]).lower()
+            # Regex for substituting 'n' with blank
+            temp = re.sub('[-]', '', temp)
+
+        if temp != '':
+            lvl3hash.append(temp)
+            lvl3hashframe.append(lvl2hashframe[i])
+
+    # Group consecutive change in directions (lowercase)
+    temphash = [lvl3hash[0]]
+    temphashframe = [lvl3hashframe[0]]
+    for i in range(1, len(lvl3hash)):
+        if lvl3hash[i].isupper():
+            temphash.append(lvl3hash[i])
+            temphashframe.append(lvl3hashframe[i])
+        elif lvl3hash[i].islower() and temphash[-1].islower():
+            temphash[-1] += lvl3hash[i]
+        else:
+            temphash.append(lvl3hash[i])
+            temphashframe.append(lvl3hashframe[i])
+
+    # Mark the last frame of the Level-1 hash
+    temphashframe.append(lvl2hashframe[-1])
+
+    lvl3hash = temphash
+    lvl3hashframe = temphashframe
+
+    while True:
+        length = len(lvl3hash)
+        # Remove main direction axes from change in direction
+        for h in range(len(lvl3hash)):
+            # Only make amendments to lowercase strings
+            if lvl3hash[h].islower():
+                # Get strings of main direction
+                if h == 0:
+                    continue
+                elif h == len(lvl3hash) - 1:
+                    continue
+                else:
+                    j = h - 1
+                    while True:
+                        if lvl3hash[j].isupper():
+                            main_axis1 = lvl3hash[j]
+                            break
+                        j -= 1
+                    main_axis2 = lvl3hash[h + 1]
+
+                # Identify which main axes to remove
+                include = [0, 1, 2]
+                if ('F' in main_axis1 or 'B' in main_axis1) and ('F' in main_axis2 or 'B' in main_axis2):
+                    include.remove(0)
+                if ('L' in main_axis1 or 'R' in main_axis1) and ('L' in main_axis2 or 'R' in main_axis2):
+                    include.remove(1)
+                if ('U' in main_axis1 or 'D' in main_axis1) and ('U' in main_axis2 or 'D' in main_axis2):
+                    include.remove(2)
+
+                # Remove labels according to main axes
+                if 0 not in include:
+                    lvl3hash[h] = list(filter(lambda a: a not in 'fb', lvl3hash[h]))
+                if 1 not in include:
+                    lvl3hash[h] = list(filter(lambda a: a not in 'lr', lvl3hash[h]))
+                if 2 not in include:
+                    lvl3hash[h] = list(filter(lambda a: a not in 'ud', lvl3hash[h]))
+
+                # Join string and remove duplicate characters
+                if lvl3hash[h] != []:
+                    c = Counter(lvl3hash[h])
+                    highest = max(c.values())
+                    result = [k for k, v in c.items() if v == highest]
+                else:
+                    result = ""
+                lvl3hash[h] = ''.join(set(result))
+
+                # Remove turn between two identical main direction
+                try:
+                    if main_axis1 == main_axis2:
+                        lvl3hash[h + 1] = ""
+                        lvl3hash[h] = ""
+                except IndexError:
+                    pass
+
+        # List all index where "" empty string
+        ix = [i for i, s in enumerate(lvl3hash) if s == '']
+        ix.reverse()
+
+        for i in ix:
+            lvl3hash.pop(i)
+            lvl3hashframe.pop(i)
+
+        if len(lvl3hash) == length:
+            break
+
+    # END Padding
+    lvl3hash.append("END")
+    return lvl3hash, lvl3hashframe
+
+
+# Analysis.__init__: coordinates of the columns col_x, col_y and col_z (index starts at 1) of a .csv file, read with
+# all its columns by the Python engine of pandas
+# header: header row as given to pandas (index starts at 0), or None
+def read_csv(file, col_x, col_y, col_z, header=None):
+    dataset = pd.read_csv(file, header=header, engine="python")
+    x = dataset.iloc[:, col_x-1].values
+    y = dataset.iloc[:, col_y-1].values
+    z = dataset.iloc[:, col_z-1].values
+    return np.asarray([x, y, z]).T
+
+
+# preprocessing._smooth: Savitzky-Golay filter (window 7, order 2) of every axis
+def smooth(px, py, pz):
+    x = savgol_filter(px, 7, 2)
+    y = savgol_filter(py, 7, 2)
+    z = savgol_filter(pz, 7, 2)
+    return np.array([x, y, z]).T
+
+
+# preprocessing._interparc: t points evenly spaced over the normalized arc length of the curve (px, py, pz)
+# (numpy.matlib.repmat(s, 3, 1) is written as np.tile(s, (3, 1)), which gives the same array, as numpy.matlib is
+# deprecated)
+def interparc(t, px, py, pz):
+    t = np.linspace(0, 1, t)
+    nt = len(t)
+    n = len(px)
+    pxyz = np.array([px, py, pz]).T
+
+    pt = np.empty((nt, 3), dtype=float)
+    chordlen = np.sqrt(np.sum(np.power(np.diff(pxyz.T), 2), axis=0))
+    chordlen = chordlen / np.sum(chordlen)
+    cumarc = np.insert(np.cumsum(chordlen), 0, 0)
+
+    tbins = np.digitize(t, cumarc)
+    tbins[tbins <= 0] = 1
+    tbins[t <= 0] = 1
+    tbins[tbins >= n] = n - 1
+    tbins[t >= 1] = n - 1
+    tbins = tbins - 1
+
+    s = np.divide(t - cumarc[tbins], chordlen[tbins])
+
+    pt = pxyz[tbins, :] + np.multiply(pxyz[tbins + 1, :] - pxyz[tbins, :], np.tile(s, (3, 1)).T)
+
+    return pt
+
+
+# Largest rounding difference between interparc and preprocessing._resample: the cumulative (normalized) arc lengths
+# are rounded differently, by about sqrt(n) ulps of the total arc length (and of the coordinates) for n data points
+def interparc_tolerance(X, csum):
+    return 4 * np.sqrt(len(X)) * np.finfo(float).eps * (csum[-1] + np.abs(X).max())
+
+
+# preprocessing.preprocess with interpolation (and without smoothing): resampled trajectory X and idx
+def interpolate(x, y, z, interdist=0.5):
+    X = np.array([x, y, z]).T
+    chordlen = np.sqrt(np.sum(np.power(np.diff(X.T), 2), axis=0))
+    chordlen = np.insert(chordlen, 0, 0)
+    csum = np.cumsum(chordlen)
+    dist = sum(chordlen)
+    idx = csum // interdist
+
+    t = round(dist / interdist)
+
+    X = interparc(t, X[:, 0], X[:, 1], X[:, 2])[1:, :]
+
+    return X, idx
@@ -0,0 +1,77 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import batch
+from analysis import Analysis
+
+
+def _recordings(folder):
+    for i, name in enumerate(("a", "b")):
+        X = np.cumsum(np.random.default_rng(i).normal(size=(300, 3)), axis=0)
+        pd.DataFrame(X).to_csv(os.path.join(folder, name + ".csv"), index=False, header=False)
+
+
+# Running the same pattern again analyses the recordings only, not the results and summary of the first run
+def test_rerun_skips_outputs(tmp_path):
+    _recordings(str(tmp_path))
+    pattern = str(tmp_path / "*.csv")
+    for summary in ("summary.csv", "summary.csv", "other_summary.csv"):
+        assert batch.main([pattern, "--workers", "1", "--summary", str(tmp_path / summary)]) == 0
+    assert batch.expand_files([pattern]) == [str(tmp_path / "a.csv"), str(tmp_path / "b.csv")]
+
+
+def test_explicit_files_are_kept(tmp_path):
+    _recordings(str(tmp_path))
+    batch.main([str(tmp_path / "*.csv"), "--workers", "1", "--out-dir", str(tmp_path)])
+    result = str(tmp_path / "a_MPAL.csv")
+    assert batch.expand_files([str(tmp_path / "*.csv"), result]) == [str(tmp_path / "a.csv"),
+                                                                      str(tmp_path / "b.csv"), result]
+
+
+# The sample rate of the recording is its own setting, with a default for settings files written before it existed
+def test_settings_sample_rate(tmp_path):
+    config = tmp_path / "settings.config"
+    config.write_text("self.smoothing = {'method': 'butterworth', 'order': 2, 'cutoff': 6.0, 'rate': 200.0}\n")
+    settings = batch.Settings(str(config))
+    assert settings.sample_rate == 100.0 and settings.smoothing["rate"] == 200.0
+    config.write_text("self.sample_rate = 250.0\n")
+    assert batch.Settings(str(config)).sample_rate == 250.0
+    assert batch.Settings().sample_rate == 100.0
+
+
+# The scripts share the input options, and their Analysis is the same as with the same arguments given directly
+def test_analysis_from_args(tmp_path):
+    _recordings(str(tmp_path))
+    file = str(tmp_path / "a.csv")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file")
+    batch.add_input_arguments(parser)
+    args = parser.parse_args([file, "--col-x", "2", "--col-y", "3", "--col-z", "1", "--smooth", "--interpolate", "0.2",
+                              "--invert-y"])
+    settings = batch.Settings(str(tmp_path / "missing.config"))
+    analysis = batch.analysis_from_args(args, settings)
+    expected = Analysis(file, 2, 3, 1, 60.0, 60.0, 60.0, 5, invert_y=True, smooth=True, interpolate=True,
+                        interdist=0.2, smoothing=settings.smoothing)
+    np.testing.assert_array_equal(analysis.X, expected.X)
+    assert analysis.lvl3hash == expected.lvl3hash
+
+    parser = argparse.ArgumentParser()
+    batch.add_input_arguments(parser, preprocessing=False)
+    assert not hasattr(parser.parse_args([]), "smooth")
+
+
+# Only the names of the outputs of MPAL are skipped, not recordings with "_MPAL" elsewhere in their name
+def test_result_names(tmp_path, capsys):
+    outputs = ["a_MPAL.csv", "a_MPAL.pkl", "a_MPAL.mat", "a_MPAL_marker2.csv", "a_MPAL_sweep.csv", "a_MPAL.mp4",
+               "a_MPAL.gif"]
+    recordings = ["a.csv", "a_MPAL_trial.csv", "lab_MPAL_2.csv", "a_MPAL_sweep2.csv", "a_MPAL.csv.csv"]
+    for name in outputs + recordings:
+        (tmp_path / name).write_text("1,2,3\n")
+    assert batch.expand_files([str(tmp_path / "*")]) == sorted(str(tmp_path / name) for name in recordings)
+    skipped = capsys.readouterr().out.splitlines()
+    assert sorted(skipped) == sorted("Skipped {} (result file of MPAL)".format(tmp_path / name) for name in outputs)
+    batch.expand_files([str(tmp_path / "*")], verbose=False)
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import Analysis
+from cache import NavigationCache, PreprocessingCache
+
+THRESHOLDS = (60.0, 60.0, 60.0, 5)
+
+
+@pytest.fixture
+def trajectory(tmp_path):
+    rng = np.random.default_rng(0)
+    X = np.cumsum(rng.normal(size=(500, 3)), axis=0)
+    pd.DataFrame(X).to_csv(tmp_path / "trial.csv", index=False, header=False)
+    np.save(tmp_path / "trial.npy", X)
+    return tmp_path
+
+
+def _entries(cache):
+    if not os.path.isdir(cache.directory):
+        return []
+    return [name for name in os.listdir(cache.directory) if not name.startswith(".")]
+
+
+def test_preprocessed_csv_is_cached(trajectory):
+    cache = PreprocessingCache(str(trajectory / "cache"))
+    file = str(trajectory / "trial.csv")
+    first = Analysis(file, 1, 2, 3, *THRESHOLDS, interpolate=True, cache=cache)
+    assert len(_entries(cache)) == 1
+    second = Analysis(file, 1, 2, 3, *THRESHOLDS, interpolate=True, cache=cache)
+    np.testing.assert_array_equal(first.X, second.X)
+    assert first.lvl3hash == second.lvl3hash
+
+
+# Binary trajectories stay memory-mapped, and trajectories without preprocessing are not copied into the cache
+@pytest.mark.parametrize("name, options", [("trial.npy", dict(interpolate=True)), ("trial.npy", {}),
+                                           ("trial.csv", {})])
+def test_not_cached(trajectory, name, options):
+    cache = PreprocessingCache(str(trajectory / "cache"))
+    Analysis(str(trajectory / name), 1, 2, 3, *THRESHOLDS, cache=cache, **options)
+    assert _entries(cache) == []
+
+
+
+# Source of a navigation cache recording the nodes it computes, raising for the nodes in fail
+class _Source:
+
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+
+    def __call__(self, level, node, resolution):
+        self.calls.append((level, node))
+        if node in self.fail:
+            raise ValueError("node {}".format(node))
+        return level, node, resolution
+
+
+# Wait until the worker thread has no node left to prefetch
+def _wait_idle(cache, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with cache._lock:
+            idle = cache._next() is None
+        if idle and cache._computing.acquire(blocking=False):
+            cache._computing.release()
+            return
+        time.sleep(0.001)
+    raise AssertionError("navigation cache still prefetching")
+
+
+def _nodes(cache):
+    return sorted(key[1] for key in cache._entries)
+
+
+def test_navigation_hit_and_miss():
+    source = _Source()
+    cache = NavigationCache(source, size=16, ahead=2)
+    assert cache.get(1, 3, last=10) == (1, 3, None)
+    _wait_idle(cache)
+    assert cache.get(1, 4, last=10) == (1, 4, None)
+    assert source.calls.count((1, 3)) == 1 and source.calls.count((1, 4)) == 1
+    assert cache.get(2, 4, 100, last=10) == (2, 4, 100)
+    assert (2, 4) in source.calls
+
+
+# Nodes in the direction of the last step are prefetched first, up to the last node
+def test_navigation_prefetch_direction():
+    source = _Source()
+    cache = NavigationCache(source, size=64, ahead=2)
+    cache.get(1, 10, last=100)
+    _wait_idle(cache)
+    assert [node for _, node in source.calls] == [10, 11, 9, 12, 8]
+
+    del source.calls[:]
+    cache.get(1, 5, last=100)
+    _wait_idle(cache)
+    assert [node for _, node in source.calls] == [5, 4, 6, 3, 7]
+
+    del source.calls[:]
+    cache.get(1, 99, last=100)
+    _wait_idle(cache)
+    assert [node for _, node in source.calls] == [99, 100, 98, 97]
+
+
+# Entries of other levels, then the farthest from the displayed node, are removed first
+def test_navigation_eviction():
+    cache = NavigationCache(_Source(), size=5, ahead=2)
+    cache.get(1, 10)
+    _wait_idle(cache)
+    assert _nodes(cache) == [8, 9, 10, 11, 12]
+    cache.get(1, 20)
+    _wait_idle(cache)
+    assert _nodes(cache) == [18, 19, 20, 21, 22]
+    cache.get(2, 0)
+    _wait_idle(cache)
+    assert sorted(cache._entries) == [(1, 18, None), (1, 19, None), (2, 0, None), (2, 1, None), (2, 2, None)]
+
+
+# Entries being prefetched during a reset are discarded, and get() does not wait for them
+def test_navigation_reset():
+    started, release, finished = threading.Event(), threading.Event(), threading.Event()
+    source = _Source()
+
+    def blocking(level, node, resolution):
+        if node == 1:
+            started.set()
+            release.wait(5)
+            finished.set()
+        return source(level, node, resolution)
+
+    cache = NavigationCache(blocking, size=16, ahead=1)
+    cache.get(1, 0, last=10)
+    assert started.wait(5)
+    assert cache.get(1, 5, last=10) == (1, 5, None)
+    assert not finished.is_set()
+
+    reset = threading.Thread(target=cache.reset)
+    reset.start()
+    reset.join(0.1)
+    assert reset.is_alive()
+    release.set()
+    reset.join(5)
+    _wait_idle(cache)
+    assert cache._entries == {}
+
+    # Prefetching resumes with the next get
+    cache.get(1, 8, last=10)
+    _wait_idle(cache)
+    assert _nodes(cache) == [7, 8, 9]
+
+
+# A node whose source raises is not prefetched again, keeps the displayed node, and raises when displayed
+def test_navigation_source_error():
+    source = _Source(fail=[2])
+    cache = NavigationCache(source, size=3, ahead=1)
+    cache.get(1, 1, last=10)
+    _wait_idle(cache)
+    assert _nodes(cache) == [0, 1]
+    assert cache._cursor == (1, 1, None, 10)
+
+    # The cache is full after the next miss
+    assert cache.get(1, 5, last=10) == (1, 5, None)
+    _wait_idle(cache)
+    assert _nodes(cache) == [4, 5, 6]
+    assert source.calls.count((1, 2)) == 1
+
+    with pytest.raises(ValueError):
+        cache.get(1, 2, last=10)
+    _wait_idle(cache)
+    assert cache.get(1, 3, last=10) == (1, 3, None)
@@ -0,0 +1,93 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import export
+from analysis import Analysis
+
+
+# Random walk of 200 data points, with straight strokes so that it has a few level-3 nodes
+@pytest.fixture(scope="module")
+def analysis():
+    rng = np.random.default_rng(0)
+    X = np.cumsum(np.repeat(rng.normal(size=(10, 3)), 20, axis=0) + rng.normal(size=(200, 3)) * 0.1, axis=0)
+    return Analysis.from_preprocessed(X, X, np.arange(len(X)), 60.0, 60.0, 60.0, 5)
+
+
+def _frames(folder):
+    return sorted(os.listdir(folder))
+
+
+def test_trajectory_png_frames(analysis, tmp_path):
+    count = export.export_video(analysis, str(tmp_path / "frames"), fps=5, rate=100, size=(120, 120), dpi=40,
+                                workers=1, verbose=False)
+    # 2 seconds at 5 frames per second, first and last frame included
+    assert count == 11
+    assert _frames(tmp_path / "frames") == ["frame_{:06d}.png".format(i) for i in range(count)]
+
+
+def test_walkthrough_png_frames(analysis, tmp_path):
+    count = export.export_video(analysis, str(tmp_path / "frames"), level=3, size=(120, 120), dpi=40, workers=1,
+                                verbose=False)
+    assert count == len(analysis.lvl3hash) - 1
+    assert len(_frames(tmp_path / "frames")) == count
+
+
+# Frame ranges rendered by worker processes are the same as in the main process
+def test_workers_render_identical_frames(analysis, tmp_path):
+    for workers in (1, 2):
+        export.export_video(analysis, str(tmp_path / str(workers)), fps=5, rate=100, size=(120, 120), dpi=40,
+                            workers=workers, verbose=False)
+    for name in _frames(tmp_path / "1"):
+        with open(tmp_path / "1" / name, 'rb') as a, open(tmp_path / "2" / name, 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_unknown_format(analysis, tmp_path):
+    with pytest.raises(ValueError):
+        export.export_video(analysis, str(tmp_path / "trial.avi"), verbose=False)
+
+
+# Encoder process exiting with an error, in place of ffmpeg
+def _failing_encoder(folder, first, width, height, fps):
+    return subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(1)"], stdin=subprocess.PIPE)
+
+
+def _task(analysis, tmp_path):
+    return export._scene(analysis, None), np.arange(5), 0, str(tmp_path), (120, 120), 40, 5, 'mp4'
+
+
+def test_encoder_error(analysis, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "_encoder", _failing_encoder)
+    with pytest.raises(RuntimeError, match="ffmpeg failed"):
+        export._render_range(_task(analysis, tmp_path))
+
+
+# An error while rendering is raised, not hidden by the error of the encoder
+def test_render_error_not_masked(analysis, tmp_path, monkeypatch):
+    def artists(ax, X, invert):
+        def update(num):
+            raise ValueError("render failed")
+        return [], update
+
+    monkeypatch.setattr(export, "_encoder", _failing_encoder)
+    monkeypatch.setattr(export, "_trajectory_artists", artists)
+    with pytest.raises(ValueError, match="render failed"):
+        export._render_range(_task(analysis, tmp_path))
+
+
+# The sample rate of the export defaults to the sample_rate setting, not the rate of the smoothing filter
+def test_rate_from_settings(tmp_path, monkeypatch):
+    rates = []
+    monkeypatch.setattr(export, "export_video", lambda analysis, out, **options: rates.append(options["rate"]) or 1)
+    file = str(tmp_path / "trial.csv")
+    np.savetxt(file, np.cumsum(np.random.default_rng(0).normal(size=(50, 3)), axis=0), delimiter=',')
+    config = tmp_path / "settings.config"
+    config.write_text("self.smoothing = {'method': 'savgol', 'window': 7, 'order': 2, 'cutoff': 6.0, 'rate': 200.0}\n"
+                      "self.sample_rate = 250.0\n")
+    export.main([file, "--settings", str(config)])
+    export.main([file, "--settings", str(config), "--rate", "50"])
+    assert rates == [250.0, 50.0]
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+MPAL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "MPAL")
+
+
+# The analysis core and the headless tools can be used without matplotlib or Qt (see Analysis.plot)
+@pytest.mark.parametrize("module", ["analysis", "batch", "stream", "parallel", "sweep", "cache"])
+def test_core_does_not_import_gui(module):
+    code = ("import sys; import {}; "
+            "print(sorted(name for name in ('matplotlib', 'PyQt5') if name in sys.modules))").format(module)
+    result = subprocess.run([sys.executable, "-c", code], cwd=MPAL_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+# The plot materials of an analysis are built without matplotlib too
+def test_analysis_plot_without_gui():
+    code = ("import sys; from analysis import Analysis; "
+            "a = Analysis('../sample_data/sample_data.csv', 1, 2, 3, 60, 60, 60, 5, header=1); a.plot.updateplot_lvl3(0); "
+            "print(sorted(name for name in ('matplotlib', 'PyQt5') if name in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=MPAL_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
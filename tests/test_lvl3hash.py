@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import reference
+from analysis import Analysis, _reduce_turn
+
+AXES = ("LR-", "FB-", "UD-")
+
+
+# Random level-1 label stream: runs of random labels with random lengths, with '-' on an axis with probability dash
+def _lvl1hash(rng, runs, dash, max_length):
+    lengths = rng.integers(1, max_length + 1, size=runs)
+    rows = []
+    for labels in AXES:
+        choice = np.where(rng.random(runs) < dash, 2, rng.integers(0, 2, size=runs))
+        rows.append(''.join(labels[c] * n for c, n in zip(choice.tolist(), lengths.tolist())) + '/')
+    return rows
+
+
+# Changes in direction of the reference are joined in the (arbitrary) order of a set, so they are compared as sets
+def _unordered(lvl3hash):
+    return [''.join(sorted(label)) if label.islower() else label for label in lvl3hash]
+
+
+def _analysis(lvl1hash, main_direction_threshold):
+    analysis = Analysis.__new__(Analysis)
+    analysis.main_direction_threshold = main_direction_threshold
+    analysis.lvl1hash = lvl1hash
+    analysis._lvl2hash()
+    return analysis
+
+
+# Property: on any label stream, the single-pass reduction gives the same labels and frames as the fix-point loop
+@pytest.mark.parametrize("seed", range(40))
+def test_lvl3hash_matches_fixpoint_reference(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(25):
+        lvl1hash = _lvl1hash(rng, runs=int(rng.integers(1, 300)), dash=rng.random() * 0.8,
+                             max_length=int(rng.integers(1, 12)))
+        analysis = _analysis(lvl1hash, int(rng.integers(1, 8)))
+        try:
+            expected = reference.lvl3hash(analysis.lvl2hash, list(analysis.lvl2hashframe),
+                                          analysis.main_direction_threshold)
+        except IndexError:
+            # The reference fails on streams without any label (e.g. only '-')
+            continue
+        analysis._lvl3hash()
+        assert _unordered(analysis.lvl3hash) == _unordered(expected[0])
+        assert [int(frame) for frame in analysis.lvl3hashframe] == [int(frame) for frame in expected[1]]
+
+
+# A change in direction between two identical main directions is removed with the second one
+def test_lvl3hash_removes_turn_between_identical_main_directions():
+    analysis = _analysis(["LLLLL-LLLLL/", "-----F-----/", "-----------/"], 5)
+    analysis._lvl3hash()
+    assert analysis.lvl3hash == ["L", "END"]
+
+
+# The most frequent labels of a change in direction are kept in the order of their first occurrence
+def test_reduce_turn_order():
+    assert _reduce_turn("ubfuflbd", "L", "R") == "ubf"
+    assert _reduce_turn("dbuflrdb", "LF", "FU") == "d"
+    assert _reduce_turn("lrlr", "L", "R") == ""
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import Analysis, MultiAnalysis
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_data",
+                           "sample_data.csv")
+THRESHOLDS = (60.0, 60.0, 60.0, 5)
+
+# Columns (index starts at 1) of the markers in the file written by markers_file
+COLUMNS = [(1, 2, 3), (9, 4, 7), (5, 12, 10), (6, 8, 11)]
+
+
+# The sample data has one marker: the other markers are the same recording reversed in time, rotated and scaled, and
+# with added noise, in columns out of order
+@pytest.fixture(scope="module")
+def markers_file(tmp_path_factory):
+    X = pd.read_csv(SAMPLE_FILE).values
+    angle = np.radians(30)
+    rotation = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+    markers = [X, X[::-1], 1.5 * X @ rotation.T, X + np.random.default_rng(0).normal(scale=0.2, size=X.shape)]
+
+    data = np.empty((len(X), 12))
+    for marker, columns in zip(markers, COLUMNS):
+        data[:, [col - 1 for col in columns]] = marker
+    file = str(tmp_path_factory.mktemp("markers") / "markers.csv")
+    pd.DataFrame(data, columns=["c{}".format(i) for i in range(1, 13)]).to_csv(file, index=False)
+    return file
+
+
+def _assert_same(marker, analysis):
+    np.testing.assert_array_equal(marker.original_corr, analysis.original_corr)
+    np.testing.assert_array_equal(marker.X, analysis.X)
+    np.testing.assert_array_equal(marker.pre_post_idx, analysis.pre_post_idx)
+    np.testing.assert_array_equal(marker.parameters, analysis.parameters)
+    assert marker.lvl1hash == analysis.lvl1hash
+    assert marker.lvl2hash == analysis.lvl2hash
+    np.testing.assert_array_equal(marker.lvl2hashframe, analysis.lvl2hashframe)
+    assert marker.lvl3hash == analysis.lvl3hash
+    assert list(marker.lvl3hashframe) == list(analysis.lvl3hashframe)
+    np.testing.assert_array_equal(marker.idx, analysis.idx)
+
+
+# Every marker gives the same results as an Analysis of its columns alone
+@pytest.mark.parametrize("options", [{}, dict(smooth=True), dict(interpolate=True, interdist=0.5),
+                                     dict(smooth=True, interpolate=True, smoothing=dict(method="moving_average")),
+                                     dict(smooth=True, smoothing=dict(method="butterworth", order=2, cutoff=6.0)),
+                                     dict(invert_x=True, invert_z=True, smooth=True,
+                                          smoothing=dict(method="savgol", window=15, order=3))])
+def test_markers_match_analysis(markers_file, options):
+    multi = MultiAnalysis(markers_file, COLUMNS, *THRESHOLDS, header=1, **options)
+    assert len(multi) == len(COLUMNS)
+    for i, columns in enumerate(COLUMNS):
+        _assert_same(multi[i], Analysis(markers_file, *columns, *THRESHOLDS, header=1, **options))
+
+
+def test_markers_save(markers_file, tmp_path):
+    multi = MultiAnalysis(markers_file, COLUMNS[:2], *THRESHOLDS, header=1)
+    multi.save(str(tmp_path / "trial_MPAL"), "csv")
+    assert sorted(os.listdir(tmp_path)) == ["trial_MPAL_marker1.csv", "trial_MPAL_marker2.csv"]
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import parallel
+from analysis import Analysis
+from parallel import ParallelMultiAnalysis, analyse_parallel
+
+pytestmark = pytest.mark.skipif(parallel.shared_memory is None, reason="multiprocessing.shared_memory requires 3.8")
+
+THRESHOLDS = (60.0, 60.0, 60.0, 3)
+
+
+# Shared memory blocks created by analyse_parallel (in the main process)
+@pytest.fixture
+def blocks(monkeypatch):
+    names = []
+    shared_memory = parallel.shared_memory.SharedMemory
+
+    class SharedMemory(shared_memory):
+        def __init__(self, name=None, create=False, size=0):
+            super().__init__(name=name, create=create, size=size)
+            if create:
+                names.append(self.name)
+
+    monkeypatch.setattr(parallel.shared_memory, "SharedMemory", SharedMemory)
+    yield names
+    monkeypatch.undo()
+
+
+def _assert_unlinked(names):
+    assert len(names) == 2
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            parallel.shared_memory.SharedMemory(name=name)
+
+
+def _trajectories():
+    rng = np.random.default_rng(0)
+    trajectories = []
+    for n in [0, 1, 2, 3, 500, 2000, 40]:
+        X = np.cumsum(rng.normal(size=(n, 3)), axis=0)
+        trajectories.append((X, X, np.arange(n)))
+    return trajectories
+
+
+def _assert_same(analysis, expected):
+    np.testing.assert_array_equal(analysis.X, expected.X)
+    np.testing.assert_array_equal(analysis.parameters, expected.parameters)
+    assert analysis.lvl1hash == expected.lvl1hash
+    assert analysis.lvl2hash == expected.lvl2hash
+    np.testing.assert_array_equal(analysis.lvl2hashframe, expected.lvl2hashframe)
+    assert analysis.lvl3hash == expected.lvl3hash
+    assert list(analysis.lvl3hashframe) == list(expected.lvl3hashframe)
+    np.testing.assert_array_equal(analysis.idx, expected.idx)
+
+
+# Labels and parameters of the workers are the same as those of serial analyses, and the blocks are unlinked
+@pytest.mark.parametrize("invert", [(False, False, False), (True, False, True)])
+def test_parallel_matches_serial(blocks, invert):
+    trajectories = _trajectories()
+    analyses = analyse_parallel(trajectories, *THRESHOLDS, *invert, workers=2)
+    assert len(analyses) == len(trajectories)
+    for analysis, trajectory in zip(analyses, trajectories):
+        _assert_same(analysis, Analysis.from_preprocessed(*trajectory, *THRESHOLDS, *invert))
+    _assert_unlinked(blocks)
+
+
+# Only empty and single point trajectories: the shared blocks hold no data point
+def test_parallel_empty_trajectories(blocks):
+    trajectories = _trajectories()[:2]
+    analyses = analyse_parallel(trajectories, *THRESHOLDS, workers=2)
+    for analysis, trajectory in zip(analyses, trajectories):
+        _assert_same(analysis, Analysis.from_preprocessed(*trajectory, *THRESHOLDS))
+    _assert_unlinked(blocks)
+
+
+# The error of a worker is raised, and the blocks are unlinked
+def test_parallel_worker_error(blocks):
+    with pytest.raises(TypeError):
+        analyse_parallel(_trajectories(), 60.0, "60", 60.0, 3, workers=2)
+    _assert_unlinked(blocks)
+
+
+def test_parallel_multi_analysis(tmp_path):
+    rng = np.random.default_rng(1)
+    data = np.cumsum(rng.normal(size=(1000, 6)), axis=0)
+    file = str(tmp_path / "markers.csv")
+    np.savetxt(file, data, delimiter=',')
+    columns = [(1, 2, 3), (4, 5, 6)]
+    options = dict(smooth=True, interpolate=True)
+    markers = ParallelMultiAnalysis(file, columns, *THRESHOLDS, workers=2, **options)
+    for marker, cols in zip(markers, columns):
+        _assert_same(marker, Analysis(file, *cols, *THRESHOLDS, **options))
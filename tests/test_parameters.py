@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import reference
+from analysis import _curvature, _turning_angles
+
+
+# Random walk of n data points with repeated points (zero-length steps), straight runs (collinear points) and
+# reversals; with integer steps, collinear points are exactly collinear
+def _walk(seed, n, integer):
+    rng = np.random.default_rng(seed)
+    steps = rng.integers(-3, 4, size=(n, 3)).astype(float) if integer else rng.normal(size=(n, 3))
+    steps[rng.random(n) < 0.1] = 0
+    for start in rng.integers(0, n, size=n // 20):
+        steps[start:start + rng.integers(2, 8)] = steps[start]
+    steps[rng.random(n) < 0.05] *= -1
+    return np.cumsum(steps, axis=0) + rng.integers(-100, 100, size=3)
+
+
+def _assert_same(actual, expected):
+    # Degenerate points give NaN (or inf) at the same places, other values differ by rounding only
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=0, equal_nan=True)
+
+
+@pytest.mark.parametrize("integer", [True, False])
+@pytest.mark.parametrize("seed", range(10))
+def test_turning_angles_match_find_angle(seed, integer):
+    X = _walk(seed, 300, integer)
+    expected = [reference.find_angle(X[i - 1], X[i], X[i + 1]) for i in range(1, len(X) - 1)]
+    angles = _turning_angles(X)
+    assert np.isnan(angles).any()
+    _assert_same(angles, np.array(expected))
+
+
+@pytest.mark.parametrize("integer", [True, False])
+@pytest.mark.parametrize("seed", range(10))
+def test_curvature_matches_circumcenter(seed, integer):
+    X = _walk(seed, 300, integer)
+    L, R, k = _curvature(X)
+    expected_L, expected_R, expected_k = reference.curvature(X)
+    assert np.isnan(R[1:-1]).any()
+    _assert_same(L, expected_L)
+    _assert_same(R, expected_R)
+    _assert_same(k, expected_k)
+
+
+# Only duplicate or only collinear points, and trajectories of 1-3 points
+@pytest.mark.parametrize("X", [np.zeros((5, 3)), np.outer(np.arange(6.0), [1, 2, -3]), np.ones((1, 3)),
+                               np.array([[0.0, 0, 0], [1, 0, 0]]), np.array([[0.0, 0, 0], [1, 0, 0], [1, 1, 0]])])
+def test_degenerate_trajectories(X):
+    expected = [reference.find_angle(X[i - 1], X[i], X[i + 1]) for i in range(1, len(X) - 1)]
+    _assert_same(_turning_angles(X), np.array(expected).reshape(-1))
+    for actual, expected in zip(_curvature(X), reference.curvature(X)):
+        _assert_same(actual, expected)
@@ -0,0 +1,81 @@
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d import Axes3D
+
+from analysis import bounding_box, project_scatter
+
+
+# Line and scatter of the node plot (see PlotCanvas in app.py) on an Agg canvas
+def _figure(animated):
+    fig = Figure(figsize=(4, 4), dpi=50)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='3d')
+    ax.plot([0, 1], [0, 1], [0, 1], linestyle='None')
+    line, = ax.plot([0, 0.5], [0, 0.5], [0, 0.5], 'b', animated=animated)
+    point = ax.scatter([0.5], [0.5], [0.5], c='r', s=200, animated=animated)
+    return fig, canvas, ax, line, point
+
+
+def _move(line, point, P):
+    line.set_data(P[:, 0], P[:, 1])
+    line.set_3d_properties(P[:, 2])
+    point._offsets3d = (P[-1:, 0], P[-1:, 1], P[-1:, 2])
+
+
+# Blitting the artists over the saved background draws the same image as a full redraw
+def test_blit_matches_full_redraw():
+    P = np.array([[0.2, 0.9, 0.1], [0.9, 0.1, 0.8]])
+
+    fig, canvas, ax, line, point = _figure(animated=True)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    _move(line, point, P)
+    canvas.restore_region(background)
+    project_scatter(point, canvas.get_renderer())
+    ax.draw_artist(line)
+    ax.draw_artist(point)
+    blitted = np.asarray(canvas.buffer_rgba()).astype(int)
+
+    fig, canvas, ax, line, point = _figure(animated=False)
+    _move(line, point, P)
+    canvas.draw()
+    redrawn = np.asarray(canvas.buffer_rgba()).astype(int)
+
+    assert np.abs(blitted - redrawn).max() <= 8
+
+
+# First level-3 node of 5000 data points, simplified when plotted at a resolution
+def _long_first_node():
+    from analysis import Plot
+    t = np.linspace(0, 1, 6001)
+    X = np.column_stack((t, np.sin(20 * t), np.cos(7 * t)))
+    return X, Plot(X, [0, 5000, 6000], [0, 5000, 6000])
+
+
+# The first node is plotted up to the data point before the next node, also when it is simplified
+def test_initplot_ends_at_last_point_of_node():
+    X, plot = _long_first_node()
+    for initplot in (plot.initplot_lvl2, plot.initplot_lvl3):
+        full, _ = initplot()
+        np.testing.assert_array_equal(full, X[0:5000])
+        simplified, _ = initplot(100.0)
+        assert len(simplified) < len(full)
+        np.testing.assert_array_equal(simplified[[0, -1]], X[[0, 4999]])
+
+
+def test_simplified_segment_keeps_end_points():
+    X, plot = _long_first_node()
+    segment = plot.segment(3, 0, 100.0)
+    np.testing.assert_array_equal(segment[[0, -1]], X[[0, 5000]])
+    # Simplified segments are made of data points of the node
+    np.testing.assert_array_equal(segment, X[np.isin(X[:, 0], segment[:, 0])])
+
+
+# Cube around the data, with the side of its largest range and the centre of its ranges
+def test_bounding_box():
+    box = bounding_box([4.0, 1.0, 10.0], [0.0, -1.0, 9.0])
+    assert box.shape == (3, 8)
+    np.testing.assert_array_equal(box.min(axis=1), [0.0, -2.0, 7.5])
+    np.testing.assert_array_equal(box.max(axis=1), [4.0, 2.0, 11.5])
+    assert len({tuple(corner) for corner in box.T}) == 8
@@ -0,0 +1,111 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import reference
+from analysis import _direction_angles, _lvl1labels
+from preprocessing import _chord_lengths, _resample, _smooth, iter_preprocess, preprocess, preprocess_to_file
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_data",
+                           "sample_data.csv")
+
+
+def _random_walk(seed, n):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(size=(n, 3)) * rng.uniform(0.1, 3), axis=0) + rng.uniform(-500, 500, size=3)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_interpolation_matches_interparc(seed):
+    X = _random_walk(seed, 50 + 100 * seed)
+    expected, expected_idx = reference.interpolate(X[:, 0], X[:, 1], X[:, 2], interdist=0.5)
+    resampled, idx = preprocess(X[:, 0], X[:, 1], X[:, 2], interpolate=True, interdist=0.5)
+
+    csum = np.concatenate(([0], np.cumsum(_chord_lengths(X))))
+    assert resampled.shape == expected.shape
+    np.testing.assert_array_equal(idx, expected_idx)
+    np.testing.assert_allclose(resampled, expected, rtol=0, atol=reference.interparc_tolerance(X, csum))
+
+
+def test_resample_out_and_blocks():
+    X = _random_walk(0, 1000)
+    csum = np.concatenate(([0], np.cumsum(_chord_lengths(X))))
+    t = 3000
+    full = _resample(X, csum, t)
+    np.testing.assert_allclose(full, reference.interparc(t, X[:, 0], X[:, 1], X[:, 2]), rtol=0,
+                               atol=reference.interparc_tolerance(X, csum))
+
+    # Blocks of the points written to out buffers are the same as the points at once
+    out = np.empty((t, 3))
+    for start in range(0, t, 700):
+        _resample(X, csum, t, start, min(start + 700, t), out=out[start:start + 700])
+    np.testing.assert_array_equal(out, full)
+
+    # An out of another type is overwritten without casting its previous values (signaling NaNs here, as may be left in
+    # the memory of np.empty)
+    out32 = np.full((t, 3), 0x7f800001, dtype=np.uint32).view(np.float32)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        _resample(X, csum, t, out=out32)
+    np.testing.assert_allclose(out32, full, rtol=1e-6)
+
+
+# The rounding differences do not change the level-1 labels of the sample data
+@pytest.mark.parametrize("smooth", [False, True])
+def test_interpolated_sample_labels(smooth):
+    data = pd.read_csv(SAMPLE_FILE).values
+    X, _ = preprocess(data[:, 0], data[:, 1], data[:, 2], smooth=smooth, interpolate=True, interdist=0.5)
+    if smooth:
+        data = _smooth(data)
+    expected, _ = reference.interpolate(data[:, 0], data[:, 1], data[:, 2], interdist=0.5)
+    thresholds = (60.0, 30.0, 30.0)
+    assert _lvl1labels(*_direction_angles(X), *thresholds) == _lvl1labels(*_direction_angles(expected), *thresholds)
+
+
+# Smoothing settings of every method (None: no smoothing), with windows longer than some of the chunks
+SMOOTHINGS = [None, dict(method="savgol", window=7, order=2), dict(method="savgol", window=31, order=3),
+              dict(method="moving_average", window=7), dict(method="moving_average", window=31)]
+
+
+# Chunked preprocessing gives the same points and idx as preprocess, whatever the chunk size (one point, smaller than
+# the filter window, or larger than the trajectory)
+@pytest.mark.parametrize("chunk", [1, 5, 97, 1000])
+@pytest.mark.parametrize("interpolate", [False, True])
+@pytest.mark.parametrize("smoothing", SMOOTHINGS)
+def test_chunked_preprocessing(tmp_path, smoothing, interpolate, chunk):
+    X = _random_walk(1, 300)
+    options = dict(smooth=smoothing is not None, interpolate=interpolate, interdist=0.5, smoothing=smoothing)
+    expected, expected_idx = preprocess(X[:, 0], X[:, 1], X[:, 2], **options)
+
+    idx = np.empty(len(X), dtype=expected_idx.dtype)
+    blocks = list(iter_preprocess(X[:, 0], X[:, 1], X[:, 2], chunk=chunk, idx_out=idx, temp_dir=str(tmp_path),
+                                  **options))
+    assert all(len(block) <= chunk for block in blocks)
+    np.testing.assert_array_equal(np.concatenate(blocks), expected)
+    np.testing.assert_array_equal(idx, expected_idx)
+
+    X_file, idx_file = str(tmp_path / "X.npy"), str(tmp_path / "idx.npy")
+    preprocess_to_file(X[:, 0], X[:, 1], X[:, 2], X_file, idx_file, chunk=chunk, temp_dir=str(tmp_path), **options)
+    np.testing.assert_array_equal(np.load(X_file), expected)
+    np.testing.assert_array_equal(np.load(idx_file), expected_idx)
+
+
+# Trajectories shorter than the filter window
+@pytest.mark.parametrize("n", [2, 3, 6])
+@pytest.mark.parametrize("smoothing", SMOOTHINGS[1:])
+def test_chunked_preprocessing_short(tmp_path, smoothing, n):
+    X = _random_walk(2, n)
+    expected, _ = preprocess(X[:, 0], X[:, 1], X[:, 2], smooth=True, interpolate=True, smoothing=smoothing)
+    blocks = list(iter_preprocess(X[:, 0], X[:, 1], X[:, 2], smooth=True, interpolate=True, smoothing=smoothing,
+                                  chunk=2, temp_dir=str(tmp_path)))
+    np.testing.assert_array_equal(np.concatenate(blocks) if blocks else np.empty((0, 3)), expected)
+
+
+def test_chunked_butterworth(tmp_path):
+    X = _random_walk(0, 100)
+    with pytest.raises(ValueError):
+        list(iter_preprocess(X[:, 0], X[:, 1], X[:, 2], smooth=True, smoothing=dict(method="butterworth"),
+                             temp_dir=str(tmp_path)))
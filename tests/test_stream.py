@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import Analysis
+from stream import StreamingAnalysis, replay
+
+THRESHOLDS = (60.0, 45.0, 45.0, 3)
+
+
+# Random walk of n data points drifting in a random direction, with repeated points (zero-length steps) and straight
+# runs (collinear points)
+def _walk(seed, n):
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(size=(n, 3)) + rng.normal(scale=1.5, size=3)
+    steps[rng.random(n) < 0.1] = 0
+    for start in rng.integers(0, n, size=n // 50):
+        steps[start:start + rng.integers(2, 12)] = steps[start]
+    return np.cumsum(steps, axis=0)
+
+
+# Irregular batches of a trajectory, with many single points and some empty batches
+def _batches(X, seed):
+    rng = np.random.default_rng(seed)
+    sizes = np.where(rng.random(len(X)) < 0.5, 1, rng.integers(0, 40, size=len(X)))
+    bounds = np.minimum(np.concatenate(([0], np.cumsum(sizes))), len(X))
+    return [X[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if start < len(X)]
+
+
+def _assert_same(stream, analysis):
+    assert stream.lvl1hash == analysis.lvl1hash
+    assert stream.lvl2hash == analysis.lvl2hash
+    np.testing.assert_array_equal(stream.lvl2hashframe, analysis.lvl2hashframe)
+    assert stream.lvl3hash == analysis.lvl3hash
+    assert list(stream.lvl3hashframe) == list(analysis.lvl3hashframe)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_stream_matches_analysis(seed):
+    X = _walk(seed, 50 + 20 * seed)
+    invert = (seed % 2 == 1, seed % 3 == 1, seed % 5 == 1)
+    analysis = Analysis.from_preprocessed(X, X, np.arange(len(X)), *THRESHOLDS, *invert)
+
+    stream = StreamingAnalysis(*THRESHOLDS, *invert)
+    labels, segments = [], []
+    for points in _batches(X, seed):
+        # Single points also pushed as (x, y, z), and empty batches
+        new_labels, new_segments = stream.push(points[0] if len(points) == 1 and seed % 2 == 0 else points)
+        labels += new_labels
+        segments += new_segments
+    segments += stream.finish()
+
+    _assert_same(stream, analysis)
+    assert labels == [''.join(row[i] for row in analysis.lvl1hash) for i in range(len(X) - 1)]
+    assert segments == list(zip(analysis.lvl3hash[:-1], analysis.lvl3hashframe[:-1]))
+
+
+# Pushes of single points, and trajectories of 0-2 points
+@pytest.mark.parametrize("n", [0, 1, 2, 30])
+def test_stream_single_points(n):
+    X = _walk(n, n)
+    stream = StreamingAnalysis(*THRESHOLDS)
+    for point in X:
+        stream.push(point)
+    stream.push(np.empty((0, 3)))
+    stream.finish()
+    assert len(stream) == max(n - 1, 0)
+    if n >= 2:
+        _assert_same(stream, Analysis.from_preprocessed(X, X, np.arange(n), *THRESHOLDS))
+
+    with pytest.raises(ValueError):
+        stream.push(X)
+
+
+@pytest.mark.parametrize("name", ["trial.csv", "trial.npy"])
+def test_replay(tmp_path, name):
+    X = _walk(0, 200)
+    file = str(tmp_path / name)
+    if name.endswith(".csv"):
+        pd.DataFrame(X, columns=["x", "y", "z"]).to_csv(file, index=False)
+        options = dict(header=1)
+    else:
+        np.save(file, X)
+        options = {}
+
+    batches = list(replay(file, rate=None, batch=7, **options))
+    assert [len(points) for points in batches] == [7] * 28 + [4]
+    np.testing.assert_allclose(np.concatenate(batches), X, rtol=1e-15)
+
+    # Batches are released at the given rate
+    stream = StreamingAnalysis(*THRESHOLDS)
+    for points in replay(file, rate=2000.0, batch=10, **options):
+        stream.push(points)
+    stream.finish()
+    _assert_same(stream, Analysis.from_preprocessed(X, X, np.arange(len(X)), *THRESHOLDS))
@@ -0,0 +1,70 @@
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+from analysis import Analysis
+from sweep import SWEEP_FIELDS, threshold_sweep
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_data",
+                           "sample_data.csv")
+
+X_THRESHOLDS = [30.0, 45.0, 60.0, 75.0]
+Y_THRESHOLDS = [40.0, 60.0]
+Z_THRESHOLDS = [20.0, 60.0, 85.0]
+MAIN_DIRECTION_THRESHOLDS = [1, 3, 5, 10]
+
+
+# Row of the sweep table from the hashes of an analysis re-run with the thresholds
+def _rerun_row(analysis, x_threshold, y_threshold, z_threshold, main_direction_threshold):
+    analysis.x_threshold = x_threshold
+    analysis.y_threshold = 90 - y_threshold
+    analysis.z_threshold = 90 - z_threshold
+    analysis.main_direction_threshold = main_direction_threshold
+    analysis.rerun()
+
+    lengths = np.diff(analysis.lvl2hashframe)
+    main = lengths >= main_direction_threshold
+    nodes = len(analysis.lvl1hash[0]) - 1
+    histograms = [[row[:-1].count(label) for label in labels + '-']
+                  for row, labels in zip(analysis.lvl1hash, ("LR", "FB", "UD"))]
+    return [x_threshold, y_threshold, z_threshold, main_direction_threshold,
+            len(lengths), int(main.sum()), int((~main).sum()), lengths[main].sum() / nodes,
+            *histograms[0], *histograms[1], *histograms[2]]
+
+
+@pytest.fixture(scope="module")
+def sample():
+    return Analysis(SAMPLE_FILE, 1, 2, 3, 60.0, 60.0, 60.0, 5, header=1)
+
+
+# Every row of the sweep is the same as a re-run of the analysis with its thresholds, also with chunks of nodes
+# shorter than the main direction threshold
+@pytest.mark.parametrize("chunk", [2**20, 7])
+def test_sweep_matches_rerun(sample, chunk):
+    table = threshold_sweep(sample, X_THRESHOLDS, Y_THRESHOLDS, Z_THRESHOLDS, MAIN_DIRECTION_THRESHOLDS, chunk=chunk)
+    assert list(table.columns) == SWEEP_FIELDS
+    assert len(table) == len(X_THRESHOLDS) * len(Y_THRESHOLDS) * len(Z_THRESHOLDS) * len(MAIN_DIRECTION_THRESHOLDS)
+
+    rows = {tuple(row[:4]): list(row) for row in table.itertuples(index=False)}
+    for setting in itertools.product(X_THRESHOLDS, Y_THRESHOLDS, Z_THRESHOLDS, MAIN_DIRECTION_THRESHOLDS):
+        assert rows[setting] == pytest.approx(_rerun_row(sample, *setting), rel=0, abs=0), setting
+
+
+# Thresholds at the angles of the trajectory itself, where the labels of some nodes change
+def test_sweep_at_label_boundaries():
+    rng = np.random.default_rng(0)
+    X = np.cumsum(rng.normal(size=(3000, 3)), axis=0)
+    analysis = Analysis.from_preprocessed(X, X, np.arange(len(X)), 60.0, 60.0, 60.0, 5, invert_y=True)
+    angle1 = np.abs(analysis.parameters[:-1, 0])
+    angle2 = np.abs(analysis.parameters[:-1, 2])
+    x_thresholds = [float(angle1[10]), float(180 - angle1[20])]
+    y_thresholds = [float(90 - angle1[30])]
+    z_thresholds = [float(90 - angle2[40]), 45.0]
+
+    table = threshold_sweep(analysis, x_thresholds, y_thresholds, z_thresholds, [2, 4])
+    for row, setting in zip(table.itertuples(index=False),
+                            itertools.product([2, 4], x_thresholds, y_thresholds, z_thresholds)):
+        expected = _rerun_row(analysis, *setting[1:], setting[0])
+        assert list(row) == pytest.approx(expected, rel=0, abs=0)
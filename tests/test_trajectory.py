@@ -0,0 +1,85 @@
+import mmap
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import Analysis, _read_csv_columns, convert_csv, load_trajectory
+
+THRESHOLDS = (60.0, 60.0, 60.0, 5)
+
+
+# Whether an array is a view of a memory-mapped file
+def _memory_mapped(array):
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+# .csv file with a header row and the X, Y and Z columns out of order among other columns
+@pytest.fixture
+def csv_file(tmp_path):
+    data = np.cumsum(np.random.default_rng(0).normal(size=(2000, 5)), axis=0)
+    file = str(tmp_path / "trial.csv")
+    pd.DataFrame(data, columns=["t", "z", "x", "other", "y"]).to_csv(file, index=False)
+    return file
+
+
+@pytest.mark.parametrize("extension", [".npy", ".npz"])
+def test_convert_csv_round_trip(csv_file, tmp_path, extension):
+    out = str(tmp_path / ("trial" + extension))
+    convert_csv(csv_file, out, 3, 5, 2, header=1, invert_z=True)
+    X, metadata = load_trajectory(out)
+
+    assert _memory_mapped(X)
+    assert X.shape == (2000, 3) and X.dtype == np.float64
+    np.testing.assert_array_equal(X, _read_csv_columns(csv_file, [2, 4, 1], header=0))
+    if extension == ".npz":
+        assert metadata == dict(source="trial.csv", header=1, col_x=3, col_y=5, col_z=2, invert_x=False,
+                                invert_y=False, invert_z=True)
+    else:
+        assert metadata == {}
+
+
+# Compressed .npz files cannot be memory-mapped, and are read into memory
+def test_compressed_npz(csv_file, tmp_path):
+    expected = _read_csv_columns(csv_file, [2, 4, 1], header=0)
+    out = str(tmp_path / "trial.npz")
+    np.savez_compressed(out, X=expected, source="trial.csv")
+    X, metadata = load_trajectory(out)
+    assert not _memory_mapped(X)
+    np.testing.assert_array_equal(X, expected)
+    assert metadata == dict(source="trial.csv")
+
+
+def test_not_a_trajectory(tmp_path):
+    out = str(tmp_path / "trial.npy")
+    np.save(out, np.zeros((10, 4)))
+    with pytest.raises(ValueError):
+        load_trajectory(out)
+
+
+# Without preprocessing, the trajectory of a binary file stays memory-mapped, with the same results as the .csv file
+@pytest.mark.parametrize("extension", [".npy", ".npz"])
+def test_binary_analysis_is_memory_mapped(csv_file, tmp_path, extension):
+    out = str(tmp_path / ("trial" + extension))
+    convert_csv(csv_file, out, 3, 5, 2, header=1)
+    analysis = Analysis(out, 1, 2, 3, *THRESHOLDS)
+    expected = Analysis(csv_file, 3, 5, 2, *THRESHOLDS, header=1)
+
+    assert _memory_mapped(analysis.original_corr)
+    assert _memory_mapped(analysis.X)
+    np.testing.assert_array_equal(analysis.X, expected.X)
+    np.testing.assert_array_equal(analysis.pre_post_idx, expected.pre_post_idx)
+    np.testing.assert_array_equal(analysis.parameters, expected.parameters)
+    assert analysis.lvl3hash == expected.lvl3hash
+    assert list(analysis.lvl3hashframe) == list(expected.lvl3hashframe)
+
+    # Preprocessing makes a new trajectory, the original coordinates stay memory-mapped
+    smoothed = Analysis(out, 1, 2, 3, *THRESHOLDS, smooth=True, interpolate=True)
+    assert _memory_mapped(smoothed.original_corr)
+    assert not _memory_mapped(smoothed.X)
+    np.testing.assert_array_equal(smoothed.X, Analysis(csv_file, 3, 5, 2, *THRESHOLDS, header=1, smooth=True,
+                                                       interpolate=True).X)